@@ -0,0 +1,431 @@
+"""
+End-to-end benchmark suite on synthetic scenarios: no Waymo data, no network.
+
+Stages (--stages, default all but obs_quality):
+    conversion    Waymo dict / proto -> MetaDrive scenario, scenarios/sec
+    summary       build_summary and build_index over the synthetic dataset
+    reset         DirectWaymoEnv reset latency (with and without prefetching, and cycling over
+                  a few scenarios with and without the MetaDrive map cache)
+    observations  log observations (src.observations) built per second, online and offline
+    env_steps     DirectWaymoEnv steps/sec at each --workers count, per --obs-modes
+    bc_ppo        BC_PPO update time (on the multi-agent log-replay env)
+    obs_quality   short BC_PPO run per --obs-modes, then route completion / collisions / ADE
+                  on the held-out scenarios (slow)
+
+Every run appends one JSON line (commit, machine, config, results) to --out and
+is compared with the previous run of the same config, so regressions between
+commits show up. Stages whose dependencies are missing are recorded as skipped.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.synthetic import synthetic_waymo_dict, write_synthetic_dataset
+
+STAGES = ("conversion", "summary", "reset", "observations", "env_steps", "bc_ppo")
+# Metrics where a larger value is an improvement (everything else is a cost)
+HIGHER_IS_BETTER = ("per_sec", "route_completion", "hit_rate")
+
+
+def git_commit():
+    try:
+        root = os.path.join(os.path.dirname(__file__), '..')
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def best_rate(fn, items, repeats):
+    """Items/sec of the fastest of 'repeats' passes over 'items'."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def make_env(data_dir, index_dir, prefetch_depth=0, obs_mode="lidar", trajectory_metrics=0, map_cache_size=8):
+    def _init():
+        from src.env_wrapper import DirectWaymoEnv
+        return DirectWaymoEnv({
+            "use_render": False,
+            "data_directory": data_dir,
+            "horizon": 500,
+            "scenario_index": index_dir,
+            "prefetch_depth": prefetch_depth,
+            "obs_mode": obs_mode,
+            "trajectory_metrics": trajectory_metrics,
+            "map_cache_size": map_cache_size,
+            "vehicle_config": {
+                "lidar": {"num_lasers": 60, "distance": 50, "num_others": 0},
+            },
+        })
+    return _init
+
+
+# --- Stages -------------------------------------------------------------------
+
+def bench_conversion(args, ctx):
+    from src.conversion import convert_scenario_dict
+
+    raws = [synthetic_waymo_dict(args.seed + i, num_agents=args.agents, num_map_features=args.map_features)
+            for i in range(args.scenarios)]
+    results = {"dict_scenarios_per_sec": best_rate(
+        lambda raw: convert_scenario_dict(raw, raw["scenario_id"]), raws, args.repeats)}
+
+    try:
+        from google.protobuf.json_format import ParseDict
+        from scenarionet.converter.waymo.waymo_protos import scenario_pb2
+    except ImportError as e:
+        results["proto_skipped"] = f"missing dependency: {e}"
+        return results
+    from src.conversion import convert_scenario_proto
+    from src.converter import Stages
+
+    protos = [ParseDict(raw, scenario_pb2.Scenario()) for raw in raws]
+    results["proto_scenarios_per_sec"] = best_rate(
+        lambda proto: convert_scenario_proto(proto, proto.scenario_id), protos, args.repeats)
+    # The full worker task: parse the record, convert, pickle
+    records = [proto.SerializeToString() for proto in protos]
+    stages = Stages.for_format("pkl")
+    results["record_scenarios_per_sec"] = best_rate(
+        lambda raw: stages.convert(raw, "synthetic.tfrecord", 0), records, args.repeats)
+    return results
+
+
+def bench_summary(args, ctx):
+    from src.dataset_index import build_index, build_summary
+
+    start = time.perf_counter()
+    build_summary(ctx["data_dir"], args.summary_workers)
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_summary(ctx["data_dir"], args.summary_workers, incremental=True)
+    incremental = time.perf_counter() - start
+
+    index_dir = os.path.join(ctx["data_dir"], "bench_index")
+    start = time.perf_counter()
+    build_index(ctx["data_dir"], index_dir, args.summary_workers)
+    index = time.perf_counter() - start
+    shutil.rmtree(index_dir, ignore_errors=True)
+    return {"build_summary_s": full, "build_summary_incremental_s": incremental, "build_index_s": index}
+
+
+def bench_reset(args, ctx):
+    results = {}
+    for name, depth in (("reset", 0), ("reset_prefetch", 2)):
+        env = make_env(ctx["data_dir"], ctx["index_dir"], depth)()
+        try:
+            env.reset(seed=0)  # engine start-up is not part of the latency
+            times = []
+            for _ in range(args.resets):
+                start = time.perf_counter()
+                env.reset()
+                times.append(time.perf_counter() - start)
+                env.step(env.action_space.sample())
+        finally:
+            env.close()
+        times = np.array(times) * 1000.0
+        results[f"{name}_p50_ms"] = float(np.percentile(times, 50))
+        results[f"{name}_p95_ms"] = float(np.percentile(times, 95))
+
+    # Episodes revisiting the same few scenarios: maps rebuilt every reset vs. re-attached
+    cycle = min(4, args.scenarios)
+    for name, cache_size in (("reset_revisit", 0), ("reset_revisit_map_cache", cycle)):
+        env = make_env(ctx["data_dir"], ctx["index_dir"], map_cache_size=cache_size)()
+        try:
+            env.reset(seed=0)
+            times = []
+            for i in range(args.resets):
+                start = time.perf_counter()
+                env.reset(seed=(i + 1) % cycle)
+                times.append(time.perf_counter() - start)
+                env.step(env.action_space.sample())
+            if cache_size:
+                results[f"{name}_hit_rate"] = env.map_cache_stats()["hit_rate"]
+        finally:
+            env.close()
+        times = np.array(times) * 1000.0
+        results[f"{name}_p50_ms"] = float(np.percentile(times, 50))
+        results[f"{name}_p95_ms"] = float(np.percentile(times, 95))
+    return results
+
+
+def bench_observations(args, ctx):
+    import pickle
+    from src.dataset_index import list_scenario_files
+    from src.observations import OBSERVATION_DIM, ScenarioFeatures
+
+    scenarios = []
+    for path in list_scenario_files(ctx["data_dir"]):
+        with open(path, "rb") as f:
+            scenarios.append(pickle.load(f))
+    start = time.perf_counter()
+    features = [ScenarioFeatures(scenario) for scenario in scenarios]
+    build = time.perf_counter() - start
+    rows_per_scenario = sum(len(f.valid_steps) for f in features) / len(features)
+
+    # Online: one row per env step into a preallocated buffer, as DirectWaymoEnv(obs_mode="log") does
+    buffer = np.empty((1, OBSERVATION_DIM), dtype=np.float32)
+    def online(f):
+        for step in f.valid_steps:
+            f.observations([step], f.sdc_position[step:step + 1], f.sdc_heading[step:step + 1],
+                           f.sdc_velocity[step:step + 1], out=buffer)
+    return {
+        "features_ms": 1000.0 * build / len(features),
+        "online_obs_per_sec": best_rate(online, features, args.repeats) * rows_per_scenario,
+        # Offline: every logged SDC state of a scenario in one batch (src.offline_bc)
+        "offline_obs_per_sec": best_rate(lambda f: f.log_observations(), features, args.repeats) * rows_per_scenario,
+    }
+
+
+def bench_env_steps(args, ctx):
+    from src.async_vec_env import AsyncSharedMemoryVecEnv
+    import src.env_wrapper  # noqa: F401  (fail here, not in the workers, if MetaDrive is missing)
+
+    results = {}
+    rng = np.random.default_rng(args.seed)
+    for obs_mode in args.obs_modes:
+        # Lidar keeps the unprefixed names of earlier runs
+        prefix = "" if obs_mode == "lidar" else f"{obs_mode}_"
+        for workers in args.workers:
+            env = AsyncSharedMemoryVecEnv([make_env(ctx["data_dir"], ctx["index_dir"], 2, obs_mode)
+                                           for _ in range(workers)])
+            try:
+                env.reset()
+                low, high = env.action_space.low, env.action_space.high
+                actions = rng.uniform(low, high, (args.env_steps + 10, workers) + low.shape).astype(np.float32)
+                for step in range(10):
+                    env.step(actions[step])
+                start = time.perf_counter()
+                for step in range(10, args.env_steps + 10):
+                    env.step(actions[step])
+                elapsed = time.perf_counter() - start
+            finally:
+                env.close()
+            name = f"{prefix}steps_per_sec_{workers}_workers"
+            results[name] = workers * args.env_steps / elapsed
+            print(f"   {obs_mode:>5} obs, {workers:2d} workers: {results[name]:.0f} steps/sec")
+    return results
+
+
+def bench_bc_ppo(args, ctx):
+    from src.algorithms import BC_PPO
+    from src.multi_agent_env import MultiAgentWaymoVecEnv
+    from src.profiling import timers
+
+    env = MultiAgentWaymoVecEnv(ctx["index_dir"], agents_per_scene=16, prefetch_depth=0, seed=args.seed)
+    try:
+        model = BC_PPO("MlpPolicy", env, n_steps=args.ppo_steps, batch_size=1024, n_epochs=10,
+                       seed=args.seed, device=args.device)
+        rollout = args.ppo_steps * env.num_envs
+        model.learn(rollout)  # warm-up: allocations, first CUDA kernels
+        timers.snapshot()
+        model.learn(rollout * args.ppo_iterations, reset_num_timesteps=False)
+        stats = timers.snapshot()
+    finally:
+        env.close()
+
+    train, collect = stats["ppo/train"], stats["ppo/collect_rollouts"]
+    env_steps = stats["env/multi_agent_step"]
+    return {
+        "device": str(model.device),
+        "train_ms": 1000.0 * train["total_s"] / train["calls"],
+        "train_samples_per_sec": rollout * model.n_epochs * train["calls"] / train["total_s"],
+        "collect_ms": 1000.0 * collect["total_s"] / collect["calls"],
+        "multi_agent_steps_per_sec": env_steps["calls"] * env.num_envs / env_steps["total_s"],
+    }
+
+
+def bench_obs_quality(args, ctx):
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from src.algorithms import BC_PPO
+    from src.dataset_index import ScenarioIndex
+    from src.evaluation import Evaluator, holdout_scenarios, summarize
+
+    # Train on everything, score on the held-out fifth (at least one scenario)
+    held_out = holdout_scenarios(ScenarioIndex(ctx["index_dir"]), 20) or [0]
+    results = {}
+    for obs_mode in args.obs_modes:
+        env = DummyVecEnv([make_env(ctx["data_dir"], ctx["index_dir"], 0, obs_mode)])
+        try:
+            model = BC_PPO("MlpPolicy", env, n_steps=args.ppo_steps, batch_size=64, seed=args.seed, device=args.device)
+            start = time.perf_counter()
+            model.learn(args.quality_steps)
+            results[f"{obs_mode}_train_steps_per_sec"] = args.quality_steps / (time.perf_counter() - start)
+        finally:
+            env.close()
+
+        evaluator = Evaluator(make_env(ctx["data_dir"], ctx["index_dir"], 0, obs_mode, trajectory_metrics=1),
+                              {obs_mode: model}, workers=min(args.workers[0], len(held_out)), max_steps=200)
+        try:
+            summary = summarize(evaluator.run(held_out))[obs_mode]
+        finally:
+            evaluator.close()
+        for key in ("route_completion", "collision", "ade"):
+            results[f"{obs_mode}_{key}"] = summary[key]
+        print(f"   {obs_mode:>5} obs: route {summary['route_completion']:.2f}, "
+              f"collisions {summary['collision']:.2f}, ADE {summary['ade']:.2f}")
+    return results
+
+
+BENCHMARKS = {
+    "conversion": bench_conversion,
+    "summary": bench_summary,
+    "reset": bench_reset,
+    "observations": bench_observations,
+    "env_steps": bench_env_steps,
+    "bc_ppo": bench_bc_ppo,
+    "obs_quality": bench_obs_quality,
+}
+
+
+# --- Results --------------------------------------------------------------------
+
+def load_previous(path, config):
+    """The last recorded run with the same config, if any."""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("config") == config:
+                previous = record
+    return previous
+
+
+def compare(previous, current, threshold):
+    """Prints every metric next to the previous run's; flags changes for the worse beyond 'threshold'."""
+    regressions = 0
+    for stage, metrics in current["results"].items():
+        old_metrics = (previous or {}).get("results", {}).get(stage, {})
+        for name, value in metrics.items():
+            if not isinstance(value, (int, float)):
+                print(f"   {stage}/{name}: {value}")
+                continue
+            old = old_metrics.get(name)
+            if not isinstance(old, (int, float)) or old == 0:
+                print(f"   {stage}/{name}: {value:.4g}")
+                continue
+            change = (value - old) / abs(old)
+            worse = -change if any(key in name for key in HIGHER_IS_BETTER) else change
+            flag = "⚠️" if worse > threshold else "  "
+            regressions += worse > threshold
+            print(f"{flag} {stage}/{name}: {value:.4g} ({change:+.1%} vs {previous.get('commit')})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", type=str, default=",".join(STAGES))
+    parser.add_argument("--scenarios", type=int, default=50, help="Synthetic scenarios to generate")
+    parser.add_argument("--agents", type=int, default=32, help="Agents per scenario")
+    parser.add_argument("--map-features", type=int, default=100, help="Map features per scenario")
+    parser.add_argument("--workers", type=str, default="1,4,8,16", help="Worker counts for env_steps")
+    parser.add_argument("--obs-modes", type=str, default="lidar,log",
+                        help="DirectWaymoEnv obs_mode values compared by env_steps / obs_quality")
+    parser.add_argument("--summary-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--env-steps", type=int, default=200, help="Vectorized steps per worker count")
+    parser.add_argument("--resets", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--ppo-steps", type=int, default=256, help="BC_PPO n_steps (x16 agents)")
+    parser.add_argument("--ppo-iterations", type=int, default=3)
+    parser.add_argument("--quality-steps", type=int, default=20_000, help="Env steps of training per obs mode in obs_quality")
+    parser.add_argument("--device", type=str, default="auto")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", type=str, default=None,
+                        help="Write (and keep) the synthetic dataset here instead of a temp dir")
+    parser.add_argument("--out", type=str, default="benchmarks/results.jsonl")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown vs the previous run reported as a regression")
+    args = parser.parse_args()
+    args.workers = [int(w) for w in args.workers.split(",")]
+    args.obs_modes = [m for m in args.obs_modes.split(",") if m]
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)} (choose from {', '.join(BENCHMARKS)})")
+
+    config = {
+        "stages": stages, "scenarios": args.scenarios, "agents": args.agents,
+        "map_features": args.map_features, "workers": args.workers, "env_steps": args.env_steps,
+        "obs_modes": args.obs_modes, "quality_steps": args.quality_steps,
+        "resets": args.resets, "ppo_steps": args.ppo_steps, "seed": args.seed,
+    }
+
+    # 1. Synthetic dataset, laid out like convert.py's output
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix="waymo_bench_")
+    print(f"🧪 Writing {args.scenarios} synthetic scenarios to {data_dir}")
+    start = time.perf_counter()
+    write_synthetic_dataset(data_dir, args.scenarios, seed=args.seed,
+                            num_agents=args.agents, num_map_features=args.map_features)
+    ctx = {"data_dir": data_dir, "write_dataset_s": time.perf_counter() - start}
+
+    from src.dataset_index import build_index, build_summary, default_index_dir
+    build_summary(data_dir, args.summary_workers)
+    ctx["index_dir"] = default_index_dir(data_dir)
+    build_index(data_dir, ctx["index_dir"], args.summary_workers)
+
+    # 2. Stages
+    results = {}
+    try:
+        for stage in stages:
+            print(f"⏱️ {stage}...")
+            try:
+                results[stage] = BENCHMARKS[stage](args, ctx)
+            except ImportError as e:
+                results[stage] = {"skipped": f"missing dependency: {e}"}
+                print(f"⏭️  {stage} skipped: {e}")
+            except Exception as e:
+                results[stage] = {"error": repr(e)}
+                print(f"❌ {stage} failed: {e!r}")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    # 3. Record and compare
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    previous = load_previous(args.out, config)
+    print("📊 Results" + (f" (vs {previous['commit']} from {previous['timestamp']})" if previous else ""))
+    regressions = compare(previous, record, args.threshold)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"💾 Appended to {args.out}")
+    if regressions:
+        print(f"⚠️ {regressions} metrics regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
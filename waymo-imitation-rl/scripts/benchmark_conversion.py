@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import glob
+import time
+import itertools
+import numpy as np
+from google.protobuf.json_format import MessageToDict
+from scenarionet.converter.waymo.utils import preprocess_waymo_scenarios
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.conversion import convert_scenario_dict, convert_scenario_proto
+
+# Suppress logs
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' 
+
+def dict_path(scenario):
+    # The original path: MessageToDict first, then per-state Python loops
+    scenario_dict = MessageToDict(scenario, preserving_proto_field_name=True, use_integers_for_enums=True)
+    return convert_scenario_dict(scenario_dict, scenario.scenario_id)
+
+def proto_path(scenario):
+    return convert_scenario_proto(scenario, scenario.scenario_id)
+
+def time_path(fn, scenarios, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for scenario in scenarios:
+            fn(scenario)
+        best = min(best, time.perf_counter() - start)
+    return len(scenarios) / best
+
+def same_output(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_output(a[k], b[k]) for k in a)
+    if isinstance(a, np.ndarray):
+        return a.shape == b.shape and np.allclose(a, b)
+    return a == b
+
+def benchmark(raw_path, limit, repeats):
+    files = sorted(glob.glob(os.path.join(raw_path, "*.tfrecord*")))
+    if not files:
+        print("❌ No .tfrecord files found.")
+        return
+
+    print(f"⏳ Loading {limit} scenarios...")
+    # Parse up front so only the conversion itself is timed
+    scenarios = list(itertools.islice(preprocess_waymo_scenarios(files, 0), limit))
+    print(f"   Loaded {len(scenarios)} scenarios.")
+
+    mismatches = sum(not same_output(dict_path(s), proto_path(s)) for s in scenarios)
+    if mismatches:
+        print(f"⚠️ {mismatches} scenarios differ between the two paths!")
+
+    dict_rate = time_path(dict_path, scenarios, repeats)
+    proto_rate = time_path(proto_path, scenarios, repeats)
+
+    print(f"📊 MessageToDict + loops: {dict_rate:8.1f} scenarios/sec")
+    print(f"📊 Protobuf -> NumPy:     {proto_rate:8.1f} scenarios/sec")
+    print(f"🚀 Speedup: {proto_rate / dict_rate:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw", type=str, required=True)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark(args.raw, args.limit, args.repeats)
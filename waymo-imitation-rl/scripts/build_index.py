@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.dataset_index import build_index, default_index_dir
+
+# CONFIG
+DATA_DIR = "data/waymo_processed"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default=DATA_DIR,
+                        help="Directory of converted .pkl files, or a scenario store")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Index directory (default: <data>/scenario_index)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    data_path = os.path.abspath(args.data)
+    index_path = os.path.abspath(args.out or default_index_dir(data_path))
+    print(f"📂 Indexing: {data_path}")
+
+    start = time.perf_counter()
+    count = build_index(data_path, index_path, args.workers)
+    if count == 0:
+        print("❌ No scenarios found!")
+        return
+
+    print(f"🎉 Index built in {time.perf_counter() - start:.1f}s")
+    print(f"   {count} scenarios -> {index_path}")
+    print(f"   Pass it to the env as 'scenario_index' (re-run after adding data)")
+
+if __name__ == "__main__":
+    main()
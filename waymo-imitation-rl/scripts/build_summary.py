@@ -1,62 +1,38 @@
+import argparse
 import os
-import glob
-import pickle
-from tqdm import tqdm
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.dataset_index import build_summary
 
 # CONFIG
 DATA_DIR = "data/waymo_processed"
-SUMMARY_FILE = "dataset_summary.pkl"
 
-def build_summary():
-    data_path = os.path.abspath(DATA_DIR)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default=DATA_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only read files added (or rewritten) since the existing summary was built")
+    args = parser.parse_args()
+
+    data_path = os.path.abspath(args.data)
     print(f"📂 Scanning directory: {data_path}")
+    print("⏳ Building Strict Summary Index from metadata sidecars...")
 
-    # 1. Find all PKL files
-    files = glob.glob(os.path.join(data_path, "*.pkl"))
-    # Exclude the summary itself if it exists
-    files = [f for f in files if "dataset_summary" not in f]
-    files.sort()
+    # Sidecars are read in parallel; files without one fall back to a full unpickle
+    summary, num_read, errors = build_summary(data_path, args.workers, args.incremental)
 
-    if not files:
+    for error in errors:
+        print(f"⚠️ {error}")
+
+    if not summary:
         print("❌ No .pkl files found!")
         return
 
-    print(f"✅ Found {len(files)} .pkl files.")
-    print("⏳ Building Strict Summary Index...")
-
-    summary = {}
-    
-    for f_path in tqdm(files):
-        try:
-            with open(f_path, "rb") as f:
-                data = pickle.load(f)
-                
-            # The ID usually looks like "hash|path/to/tfrecord"
-            # This is fine, AS LONG AS we map it to the local .pkl filename
-            s_id = data.get("id")
-            
-            # CRITICAL FIX: We force the 'filename' field to be the local .pkl name
-            # This prevents MetaDrive from trying to find the original tfrecord
-            local_filename = os.path.basename(f_path)
-            
-            if s_id:
-                summary[s_id] = {
-                    "id": s_id,
-                    "filename": local_filename, # <--- The Fix
-                    "length": data.get("length", 0),
-                    "object_summary": {} 
-                }
-        except Exception as e:
-            print(f"⚠️ Error reading {f_path}: {e}")
-
-    # 3. Save the summary file
-    out_path = os.path.join(data_path, SUMMARY_FILE)
-    with open(out_path, "wb") as f:
-        pickle.dump(summary, f)
-
     print(f"🎉 Summary built successfully!")
-    print(f"   Index saved to: {out_path}")
-    print(f"   Mapped {len(summary)} scenarios.")
+    print(f"   Index saved to: {os.path.join(data_path, 'dataset_summary.pkl')}")
+    print(f"   Read {num_read} files, mapped {len(summary)} scenarios.")
 
 if __name__ == "__main__":
-    build_summary()
\ No newline at end of file
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import glob
+import pickle
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.compact import DEFAULT_QUANTUM, DEFAULT_TOLERANCE, CODECS, dumps_compact
+from src.expert import add_expert_table
+from src.manifest import atomic_write
+from src.map_geometry import add_map_geometry
+
+def compact_dataset(data_dir, out_dir, tolerance, quantum, codec):
+    """
+    Re-encodes a directory of sd_waymo_*.pkl files in the compact format (in place if out_dir == data_dir).
+    Already compact files are decoded transparently by pickle.load, so rerunning is safe.
+    """
+    files = glob.glob(os.path.join(data_dir, "*.pkl"))
+    files = [f for f in files if "dataset_summary" not in f]
+    files.sort()
+
+    if not files:
+        print("❌ No .pkl files found!")
+        return
+
+    print(f"🗜️ Compacting {len(files)} scenarios (tolerance {tolerance} m, quantum {quantum}, {codec})...")
+    os.makedirs(out_dir, exist_ok=True)
+
+    before = after = 0
+    for f_path in tqdm(files):
+        try:
+            before += os.path.getsize(f_path)
+            with open(f_path, "rb") as f:
+                scenario = pickle.load(f)
+            # Derived tables are computed before simplification, from the full-resolution map
+            scenario = add_map_geometry(add_expert_table(scenario))
+            payload = dumps_compact(scenario, tolerance=tolerance, quantum=quantum, codec=codec)
+            out_path = os.path.join(out_dir, os.path.basename(f_path))
+            atomic_write(out_path, payload)
+            after += len(payload)
+        except Exception as e:
+            print(f"⚠️ Error compacting {f_path}: {e}")
+
+    print(f"🎉 {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / max(after, 1):.1f}x smaller)")
+    if out_dir != data_dir:
+        print("   Copy or rebuild the metadata sidecars / dataset_summary.pkl for the new directory.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default="data/waymo_processed")
+    parser.add_argument("--out", type=str, default=None, help="Output directory (default: in place)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Douglas-Peucker error bound for map polylines (m)")
+    parser.add_argument("--quantum", type=float, default=DEFAULT_QUANTUM,
+                        help="Fixed-point step for positions (m), 0 keeps float32")
+    parser.add_argument("--codec", type=str, default="zlib", choices=sorted(CODECS))
+    args = parser.parse_args()
+
+    compact_dataset(args.data, args.out or args.data, args.tolerance, args.quantum or None, args.codec)
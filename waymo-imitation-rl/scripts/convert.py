@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+from functools import partial
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.compact import CODECS, DEFAULT_QUANTUM, DEFAULT_TOLERANCE
+from src.converter import DECODERS, ENCODERS, Stages, crop_map, find_sources, min_sdc_valid_steps, run_pipeline, scenario_ids
+
+# Suppress logs
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+def build_stages(args):
+    filters, transforms = [], []
+    if args.min_sdc_steps:
+        filters.append(partial(min_sdc_valid_steps, steps=args.min_sdc_steps))
+    if args.ids_file:
+        with open(args.ids_file) as f:
+            filters.append(partial(scenario_ids, ids={line.strip() for line in f if line.strip()}))
+    if args.crop_map:
+        transforms.append(partial(crop_map, radius=args.crop_map))
+
+    encode_options = None
+    if args.format == "compact":
+        encode_options = {"tolerance": args.tolerance, "quantum": args.quantum or None, "codec": args.codec}
+    return Stages.for_format(args.format, encode_options, decode=DECODERS[args.decoder],
+                             filters=filters, transforms=transforms)
+
+def main():
+    parser = argparse.ArgumentParser(description="Waymo tfrecords -> MetaDrive scenarios (decode -> filter -> transform -> encode -> write)")
+    parser.add_argument("--raw", type=str, required=True)
+    parser.add_argument("--out", type=str, required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--format", type=str, default="pkl", choices=sorted(ENCODERS),
+                        help="pkl: one pickle per scenario, compact: the same, simplified and compressed "
+                             "(src.compact), store: memory-mapped columnar shards")
+    parser.add_argument("--decoder", type=str, default="proto", choices=sorted(DECODERS),
+                        help="proto: fast protobuf -> NumPy path, dict: MessageToDict reference path")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Max scenarios buffered between stages (default: 4 x workers)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reconvert every tfrecord, ignoring the conversion manifest "
+                             "(needed after changing filters / transforms / format)")
+
+    stages = parser.add_argument_group("filters and transforms")
+    stages.add_argument("--min-sdc-steps", type=int, default=0,
+                        help="Skip scenarios whose SDC is logged for fewer steps")
+    stages.add_argument("--ids-file", type=str, default=None,
+                        help="Only convert the scenario ids listed in this file (one per line)")
+    stages.add_argument("--crop-map", type=float, default=None,
+                        help="Drop map features farther than this many m from the SDC's path")
+
+    compact = parser.add_argument_group("compact format")
+    compact.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                         help="Douglas-Peucker error bound for map polylines (m)")
+    compact.add_argument("--quantum", type=float, default=DEFAULT_QUANTUM,
+                         help="Fixed-point step for positions (m), 0 keeps float32")
+    compact.add_argument("--codec", type=str, default="zlib", choices=sorted(CODECS))
+    args = parser.parse_args()
+
+    files = find_sources(args.raw)
+    if not files:
+        print("❌ No .tfrecord files found.")
+        return
+
+    print(f"🚀 Starting Streaming Conversion of {len(files)} files with {args.workers} workers...")
+
+    # Reader -> per-scenario worker pool -> batching writer
+    # Unchanged tfrecords already listed in the manifest are skipped
+    pipeline = run_pipeline(files, args.out, args.format, args.workers, args.queue_size, args.force,
+                            stages=build_stages(args))
+
+    for error in pipeline.errors:
+        print(f"⚠️ {error}")
+
+    print(f"⏭️  {pipeline.up_to_date} files already up to date.")
+    print(f"🎉 Total Scenarios Converted: {pipeline.converted} (skipped {pipeline.skipped})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.algorithms import BC_PPO
+from src.env_wrapper import DirectWaymoEnv
+from src.dataset_index import ScenarioIndex, build_index, default_index_dir
+from src.evaluation import Evaluator, checkpoint_steps, holdout_scenarios, summarize
+
+def make_env(data_dir, index_dir, obs_mode, horizon):
+    # Headless, configured like scripts/train_parallel.py
+    def _init():
+        env_config = {
+            "use_render": False,
+            "data_directory": data_dir,
+            "horizon": horizon,
+            "scenario_index": index_dir,
+            "obs_mode": obs_mode,
+            # Scenarios are chosen explicitly, nothing to prefetch
+            "prefetch_depth": 0,
+            # Ego trajectory vs. the log (src.metrics), read at the end of every episode
+            "trajectory_metrics": 1,
+            "vehicle_config": {
+                "lidar": {"num_lasers": 60, "distance": 50, "num_others": 0},
+            }
+        }
+        return DirectWaymoEnv(env_config)
+    return _init
+
+def evaluate(args):
+    # 1. Checkpoints, oldest first
+    paths = sorted(glob.glob(os.path.join(args.models, args.pattern)), key=lambda p: (checkpoint_steps(p), p))
+    if not paths:
+        print(f"❌ No checkpoints matching {args.pattern} in {args.models}")
+        return
+    policies = {os.path.basename(p): BC_PPO.load(p, device=args.device) for p in paths}
+    print(f"🧠 Loaded {len(policies)} checkpoints")
+
+    # 2. Held-out scenarios
+    data_dir = os.path.abspath(args.data)
+    index_dir = os.path.abspath(args.index or default_index_dir(data_dir))
+    if not os.path.exists(index_dir):
+        print(f"🗂️ Building scenario index: {index_dir}")
+        build_index(data_dir, index_dir)
+    scenarios = holdout_scenarios(ScenarioIndex(index_dir), args.holdout_percent, args.max_scenarios)
+    if not scenarios:
+        print("❌ No held-out scenarios (raise --holdout-percent?)")
+        return
+    print(f"🎯 {len(scenarios)} held-out scenarios x {len(policies)} checkpoints on {args.workers} workers")
+
+    # 3. Run
+    evaluator = Evaluator(make_env(data_dir, index_dir, args.obs_mode, args.horizon), policies,
+                          workers=min(args.workers, len(scenarios)), max_steps=args.horizon)
+    try:
+        with tqdm(total=len(scenarios) * len(policies), unit="ep") as progress:
+            results = evaluator.run(scenarios, progress)
+    finally:
+        evaluator.close()
+
+    # 4. Report
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"💾 Per-episode results written to {args.out}")
+
+    summary = summarize(results)
+    print(f"\n{'checkpoint':<40} {'route':>6} {'coll':>6} {'offrd':>6} {'ADE':>7} {'FDE':>7} {'TTC':>6} {'lane':>6}")
+    for name in policies:
+        row = summary[name]
+        print(f"{name:<40} {row['route_completion']:6.2f} {row['collision']:6.2f} {row['off_road']:6.2f} "
+              f"{row['ade']:7.2f} {row['fde']:7.2f} {row['min_ttc']:6.2f} {row['lane_deviation']:6.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless parallel evaluation of checkpoints on held-out scenarios")
+    parser.add_argument("--models", type=str, default="models")
+    parser.add_argument("--pattern", type=str, default="bc_ppo_*_steps.zip")
+    parser.add_argument("--data", type=str, default="data/waymo_processed")
+    parser.add_argument("--index", type=str, default=None, help="Scenario index (default: <data>/scenario_index)")
+    parser.add_argument("--holdout-percent", type=int, default=10,
+                        help="Scenarios whose id hash falls in this percentage are the held-out set")
+    parser.add_argument("--max-scenarios", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--obs-mode", type=str, default="lidar", choices=["lidar", "log"],
+                        help="Must match what the checkpoints were trained on")
+    parser.add_argument("--horizon", type=int, default=500)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--out", type=str, default="logs/evaluation.jsonl")
+    args = parser.parse_args()
+
+    evaluate(args)
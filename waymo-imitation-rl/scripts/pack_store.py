@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import glob
+import pickle
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.scenario_store import ScenarioShardWriter
+from src.dataset_index import scenario_metadata
+from src.expert import add_expert_table
+from src.map_geometry import add_map_geometry
+
+def pack_store(data_dir, store_dir, shard_size):
+    """
+    Packs an existing directory of sd_waymo_*.pkl files into a memory-mapped scenario store.
+    """
+    files = glob.glob(os.path.join(data_dir, "*.pkl"))
+    files = [f for f in files if "dataset_summary" not in f]
+    files.sort()
+
+    if not files:
+        print("❌ No .pkl files found!")
+        return
+
+    print(f"📦 Packing {len(files)} scenarios into {store_dir} ({shard_size} per shard)...")
+    os.makedirs(store_dir, exist_ok=True)
+
+    writer = None
+    for i, f_path in enumerate(tqdm(files)):
+        if i % shard_size == 0:
+            if writer is not None:
+                writer.close()
+            writer = ScenarioShardWriter(store_dir, f"shard_{i // shard_size:05d}")
+        try:
+            with open(f_path, "rb") as f:
+                scenario = pickle.load(f)
+            # Scenarios converted before expert tables / map geometry existed get theirs here
+            scenario = add_map_geometry(add_expert_table(scenario))
+            writer.add(scenario, summary=scenario_metadata(scenario))
+        except Exception as e:
+            print(f"⚠️ Error reading {f_path}: {e}")
+    writer.close()
+
+    print(f"🎉 Store written to {store_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default="data/waymo_processed")
+    parser.add_argument("--out", type=str, default="data/waymo_store")
+    parser.add_argument("--shard-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    pack_store(args.data, args.out, args.shard_size)
@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.dataset_index import build_index, default_index_dir
+from src.offline_bc import pretrain
+
+# CONFIG
+DATA_DIR = "data/waymo_processed"
+OUTPUT = "models/bc_pretrained.zip"
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline behavior cloning on the converted scenarios (no simulator)")
+    parser.add_argument("--data", type=str, default=DATA_DIR,
+                        help="Directory of converted .pkl files, or a scenario store")
+    parser.add_argument("--index", type=str, default=None,
+                        help="Scenario index (default: <data>/scenario_index, built if missing)")
+    parser.add_argument("--out", type=str, default=OUTPUT)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="DataLoader worker processes featurizing scenarios")
+    parser.add_argument("--lr", type=float, default=3e-4)
+    parser.add_argument("--device", type=str, default="auto")
+    parser.add_argument("--all-vehicles", action="store_true",
+                        help="Use every logged vehicle as a demonstration, not just the SDC")
+    args = parser.parse_args()
+
+    data_path = os.path.abspath(args.data)
+    index_path = os.path.abspath(args.index or default_index_dir(data_path))
+    if not os.path.exists(index_path):
+        print(f"🗂️ Building scenario index: {index_path}")
+        build_index(data_path, index_path, args.workers)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    print(f"🚀 Offline BC pretraining from {data_path}")
+    pretrain(index_path, args.out, epochs=args.epochs, batch_size=args.batch_size,
+             workers=args.workers, learning_rate=args.lr, device=args.device,
+             all_vehicles=args.all_vehicles)
+
+    print(f"🏆 Saved policy to {args.out}")
+    print(f"   Warm-start PPO with CONFIG['bc_checkpoint'] = '{args.out}' and obs_mode 'log' in scripts/train_parallel.py")
+
+if __name__ == "__main__":
+    main()
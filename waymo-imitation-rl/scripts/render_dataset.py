@@ -0,0 +1,53 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.dataset_index import list_scenario_files
+from src.render import render_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-down thumbnails / GIFs of converted scenarios or saved traces, no simulator")
+    parser.add_argument("--data", type=str, default="data/waymo_processed",
+                        help="Directory of converted .pkl scenarios and / or .npz traces (scripts/visualize.py --save-traces)")
+    parser.add_argument("--out", type=str, default="renders")
+    parser.add_argument("--format", type=str, default="png", choices=["png", "gif"],
+                        help="png: one still of the whole scene with every trajectory, gif: the full replay")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--scale", type=float, default=None,
+                        help="Pixels per meter, camera following the ego (default: fit the whole scene)")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--time", type=float, default=0.0, help="Seconds into the log at which png boxes are drawn")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    files = list_scenario_files(data_dir) + sorted(glob.glob(os.path.join(data_dir, "*.npz")))
+    files = files[:args.limit] if args.limit else files
+    if not files:
+        print("❌ No .pkl / .npz files found!")
+        return
+    os.makedirs(args.out, exist_ok=True)
+    print(f"🖼️ Rendering {len(files)} scenarios as {args.format} with {args.workers} workers...")
+
+    # One file per task; every worker rasterizes and encodes on its own
+    job = partial(render_file, out_dir=args.out, fmt=args.format, size=(args.width, args.height),
+                  scale=args.scale, fps=args.fps, time=args.time)
+    errors = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for _, error in tqdm(executor.map(job, files, chunksize=4), total=len(files), unit="scn"):
+            if error is not None:
+                errors.append(error)
+
+    for error in errors:
+        print(f"⚠️ {error}")
+    print(f"🎉 {len(files) - len(errors)} renders written to {args.out}")
+
+if __name__ == "__main__":
+    main()
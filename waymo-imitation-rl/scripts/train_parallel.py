@@ -10,14 +10,51 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 # Import the NEW wrapper
 from src.env_wrapper import DirectWaymoEnv 
 from src.algorithms import BC_PPO
+from src.scenario_cache import SharedScenarioCache, default_cache_dir
+from src.dataset_index import ScenarioIndex, build_index, default_index_dir
+from src.offline_bc import load_pretrained
+from src.multi_agent_env import ActiveVecMonitor, MultiAgentWaymoVecEnv
+from src.async_vec_env import AsyncSharedMemoryVecEnv, ThroughputCallback
+from src.profiling import SamplingProfiler, TimingCallback
+from src.metrics import TrajectoryMetricsCallback
 
 # CONFIGURATION
 CONFIG = {
     "data_directory": "data/waymo_processed",
+    # Optional memory-mapped store (scripts/pack_store.py); None = read the .pkl files
+    "scenario_store": None,
+    # Prebuilt scenario index (scripts/build_index.py); None = <data>/scenario_index, built if missing
+    "scenario_index": None,
+    # Which scenarios episodes are played on: "uniform", "difficulty" (index metadata)
+    # or "prioritized" (recent failure rate), optionally as {"type": ..., **kwargs}
+    "scenario_sampler": "uniform",
+    # Scenarios each worker decodes ahead of its next reset (0 = off)
+    "prefetch_depth": 2,
+    # Shared-memory LRU cache of decoded .pkl scenarios, shared by all workers (None = off)
+    "scenario_cache_mb": 4096,
+    # "lidar" (MetaDrive sensors) or "log" (src.observations, required for bc_checkpoint)
+    "obs_mode": "lidar",
+    # Warm start from scripts/pretrain_bc.py (None = random init)
+    "bc_checkpoint": None,
+    # Multi-agent log replay (src.multi_agent_env) instead of MetaDrive, e.g.
+    # {"agents_per_scene": 16, "num_scenes": 8}; always uses the log observations
+    "multi_agent": None,
     "logs": "./logs/",
     "models": "./models/",
     "total_timesteps": 10_000_000, 
     "num_envs": 8,
+    # "async": shared-memory transport, partial batches and spare workers that
+    # hide MetaDrive resets (src.async_vec_env); "subproc": SB3's SubprocVecEnv
+    "vec_env": "async",
+    # Extra async workers resetting in the background, on top of num_envs
+    "spare_envs": 2,
+    # Sampling-profiler dumps of the trainer and every worker (folded stacks for
+    # flamegraph.pl / speedscope) go here; None = off. Timers are always on.
+    "profile_dump": None,
+    # Score each worker's last N finished episodes against the logs (ADE/FDE,
+    # time-to-collision, lane deviation; src.metrics), logged under trajectory/.
+    # 0 = off (the default); e.g. 64 to turn it on
+    "trajectory_metrics": 0,
 }
 
 def make_env(rank, seed=0):
@@ -27,6 +64,13 @@ def make_env(rank, seed=0):
             # We pass the dir, the wrapper will scan it manually
             "data_directory": os.path.abspath(CONFIG['data_directory']),
             "horizon": 500,
+            "scenario_index": CONFIG['scenario_index'],
+            "scenario_sampler": CONFIG['scenario_sampler'],
+            "obs_mode": CONFIG['obs_mode'],
+            "prefetch_depth": CONFIG['prefetch_depth'],
+            "profile_dump": CONFIG['profile_dump'],
+            "scenario_cache": CONFIG.get('scenario_cache_dir'),
+            "trajectory_metrics": CONFIG['trajectory_metrics'],
             "vehicle_config": {
                 "lidar": {"num_lasers": 60, "distance": 50, "num_others": 0},
             }
@@ -44,10 +88,37 @@ def main():
     print(f"🚀 Starting Parallel Training (Direct Loading Mode)...")
 
     # 1. Create Vectorized Environment
-    # Note: We don't need to pre-count scenarios. Each worker scans the folder itself.
-    env_fns = [make_env(i) for i in range(CONFIG['num_envs'])]
-    env = SubprocVecEnv(env_fns)
-    env = VecMonitor(env) 
+    # The cache is created here with its byte budget, workers attach to it by path
+    cache = None
+    if CONFIG['scenario_cache_mb'] and not CONFIG['scenario_store']:
+        CONFIG['scenario_cache_dir'] = default_cache_dir(f"waymo_scenario_cache_{os.getpid()}")
+        cache = SharedScenarioCache(CONFIG['scenario_cache_dir'], budget_bytes=CONFIG['scenario_cache_mb'] * 1024**2)
+
+    # The index is built (at most) once here; workers only memory-map it
+    data_root = os.path.abspath(CONFIG['scenario_store'] or CONFIG['data_directory'])
+    CONFIG['scenario_index'] = os.path.abspath(CONFIG['scenario_index'] or default_index_dir(data_root))
+    if not os.path.exists(CONFIG['scenario_index']):
+        print(f"🗂️ Building scenario index: {CONFIG['scenario_index']}")
+        build_index(data_root, CONFIG['scenario_index'])
+    print(f"🗂️ {len(ScenarioIndex(CONFIG['scenario_index']))} scenarios indexed")
+
+    if CONFIG['multi_agent']:
+        env = MultiAgentWaymoVecEnv(
+            CONFIG['scenario_index'],
+            scenario_sampler=CONFIG['scenario_sampler'],
+            prefetch_depth=CONFIG['prefetch_depth'],
+            **CONFIG['multi_agent'],
+        )
+        print(f"🚗 Multi-agent mode: {env.num_envs} controlled vehicles")
+    elif CONFIG['vec_env'] == "async":
+        env_fns = [make_env(i) for i in range(CONFIG['num_envs'] + CONFIG['spare_envs'])]
+        env = AsyncSharedMemoryVecEnv(env_fns, num_envs=CONFIG['num_envs'])
+        print(f"⚡ Async env: {CONFIG['num_envs']} envs on {len(env_fns)} workers")
+    else:
+        env_fns = [make_env(i) for i in range(CONFIG['num_envs'])]
+        env = SubprocVecEnv(env_fns)
+    # Idle multi-agent slots report done every step; they must not count as episodes
+    env = ActiveVecMonitor(env) if CONFIG['multi_agent'] else VecMonitor(env)
 
     # 2. Define Model
     device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -64,6 +135,9 @@ def main():
         tensorboard_log=CONFIG['logs'],
         device=device
     )
+    if CONFIG['bc_checkpoint']:
+        load_pretrained(model, CONFIG['bc_checkpoint'])
+        print(f"🧠 Warm-started from offline BC checkpoint: {CONFIG['bc_checkpoint']}")
     
     # 3. Train
     checkpoint_callback = CheckpointCallback(
@@ -72,10 +146,15 @@ def main():
         name_prefix='bc_ppo_direct'
     )
     
+    callbacks = [checkpoint_callback, ThroughputCallback(verbose=1), TimingCallback(verbose=1)]
+    if CONFIG['trajectory_metrics'] and not CONFIG['multi_agent']:
+        callbacks.append(TrajectoryMetricsCallback())
+
+    profiler = SamplingProfiler().start() if CONFIG['profile_dump'] else None
     try:
         model.learn(
             total_timesteps=CONFIG['total_timesteps'], 
-            callback=checkpoint_callback,
+            callback=callbacks,
             progress_bar=True
         )
         model.save(os.path.join(CONFIG['models'], "waymo_direct_final"))
@@ -85,7 +164,24 @@ def main():
         print("🛑 Training stopped manually.")
         model.save(os.path.join(CONFIG['models'], "waymo_direct_interrupted"))
     finally:
+        if profiler is not None:
+            profiler.stop()
+            path = profiler.dump(os.path.join(CONFIG['profile_dump'], "trainer.folded"))
+            print(f"🔬 Trainer profile written to {path}")
+        try:
+            # The multi-agent env is one object, with one sampler for all its slots
+            indices = [0] if CONFIG['multi_agent'] else None
+            for i, stats in enumerate(env.env_method("sampler_stats", indices=indices)):
+                if stats:
+                    print(f"🎯 Worker {i} sampler: {stats}")
+        except (EOFError, BrokenPipeError):
+            pass  # workers already gone (e.g. Ctrl+C)
         env.close()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"🗄️  Scenario cache: {stats['hit_rate']:.1%} hit rate, "
+                  f"{stats['resident_bytes'] / 1024**2:.0f} / {stats['budget_bytes'] / 1024**2:.0f} MB resident")
+            cache.destroy()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
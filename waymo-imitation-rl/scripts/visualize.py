@@ -1,93 +1,87 @@
 import argparse
 import os
 import sys
-import gymnasium as gym
-import numpy as np
-import imageio
-import pygame # Required for text rendering
-from stable_baselines3 import PPO
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from src.env_wrapper import WaymoImitationEnv
+from src.env_wrapper import DirectWaymoEnv
 from src.algorithms import BC_PPO
+from src.dataset_index import build_index, default_index_dir
+from src.render import TraceRecorder, metadrive_objects, render_video, save_trace
 
-def visualize(model_path, data_dir, output_file="chase_cam_demo.gif"):
-    print(f"🎬 Starting 3D Chase Camera Visualization...")
+def visualize(args):
+    print(f"🎬 Starting Top-Down Visualization...")
 
-    # Enable 3D Rendering
+    # 1. Headless env: nothing is rendered while the policy drives
+    data_dir = os.path.abspath(args.data)
+    index_dir = default_index_dir(data_dir)
+    if not os.path.exists(index_dir):
+        print(f"🗂️ Building scenario index: {index_dir}")
+        build_index(data_dir, index_dir)
     env_config = {
-        "use_render": True, # Required for 3D
-        "data_directory": os.path.abspath(data_dir),
-        "num_scenarios": 3,
+        "use_render": False,
+        "data_directory": data_dir,
+        "scenario_index": index_dir,
+        "obs_mode": args.obs_mode,
+        "prefetch_depth": 0,
         "horizon": 1000,
         "vehicle_config": {
             "lidar": {"num_lasers": 60, "distance": 50, "num_others": 0},
-            "show_lidar": True, # Show laser rays
-            "show_navi_mark": False,
-            "show_dest_mark": False,
         }
     }
 
     try:
-        env = WaymoImitationEnv(env_config)
-        # Force Top-Down view OFF, stick to 3D
-        env.env.config["use_render"] = True
+        env = DirectWaymoEnv(env_config)
     except Exception as e:
         print(f"❌ Env Error: {e}")
         return
 
     print("✅ Environment Loaded. Loading Model...")
-    model = BC_PPO.load(model_path, env=env)
+    model = BC_PPO.load(args.model, device="cpu")
 
-    frames = []
-    
-    for episode in range(2): # Record 2 scenarios
+    # 2. Rollouts: only poses and boxes are recorded per step
+    traces = []
+    for episode in range(args.episodes):
         print(f"   ▶️  Recording Episode {episode+1}...")
         obs, info = env.reset(seed=episode)
-        
-        # Setup Camera to follow the car
-        env.env.engine.force_fps.disable()
-        
-        # Chase Camera View
-        # Position: Behind and slightly above the car
-        # Hpr: Heading, Pitch, Roll
-        camera_pos = [0, -10, 5] 
-        
+        recorder = TraceRecorder(env.current_scenario["map_features"])
+        recorder.record(metadrive_objects(env.env), env.env.vehicle.id)
+
         done = False
-        step = 0
-        while not done and step < 400:
+        while not done and len(recorder) <= args.max_steps:
             action, _ = model.predict(obs, deterministic=True)
             obs, reward, terminated, truncated, info = env.step(action)
             done = terminated or truncated
-            
-            # Capture the 3D frame
-            # MetaDrive captures the window content
-            img = env.env.render(
-                mode="top_down", # We use top_down API but capture window for 3D if use_render=True
-                window=False,
-                screen_size=(800, 600),
-                camera_position=None
-            )
-            
-            # If we are in 3D mode, we need to capture the main window manually
-            # Note: headless rendering of 3D on servers can be tricky.
-            # If the top-down looked good, stick with it for safety on headless servers.
-            # But let's try to enhance the top-down view first.
-            
-            frames.append(img)
-            step += 1
-            
+            recorder.record(metadrive_objects(env.env), env.env.vehicle.id)
+        traces.append(recorder.trace())
+        if args.save_traces:
+            # Re-render later without the simulator (scripts/render_dataset.py)
+            os.makedirs(args.save_traces, exist_ok=True)
+            save_trace(os.path.join(args.save_traces, f"episode_{episode}.npz"), traces[-1])
+
     env.close()
 
-    print(f"💾 Saving {len(frames)} frames...")
-    imageio.mimsave(output_file, frames[::2], fps=20, loop=0)
-    print(f"🎉 Saved to {output_file}")
+    # 3. Frames rasterized in parallel and streamed to the encoder
+    print(f"💾 Rendering {sum(len(t['valid']) for t in traces)} steps at {args.fps} fps on {args.workers} workers...")
+    frames = render_video(traces, args.out, fps=args.fps, workers=args.workers,
+                          size=(args.width, args.height), scale=args.scale)
+    print(f"🎉 Saved {frames} frames to {args.out}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--model", type=str, default="models/final_waymo_agent.zip")
     parser.add_argument("--data", type=str, default="data/waymo_processed")
-    parser.add_argument("--out", type=str, default="chase_cam.gif")
+    parser.add_argument("--out", type=str, default="chase_cam.gif",
+                        help=".gif, or .mp4 with imageio-ffmpeg installed")
+    parser.add_argument("--obs-mode", type=str, default="lidar", choices=["lidar", "log"],
+                        help="Must match what the model was trained on")
+    parser.add_argument("--episodes", type=int, default=2)
+    parser.add_argument("--max-steps", type=int, default=400)
+    parser.add_argument("--fps", type=int, default=20, help="Output frame rate (poses are interpolated between steps)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--scale", type=float, default=5.0, help="Pixels per meter")
+    parser.add_argument("--save-traces", type=str, default=None, help="Also save each episode's trace (.npz) here")
     args = parser.parse_args()
-    
-    visualize(args.model, args.data, args.out)
\ No newline at end of file
+
+    visualize(args)
@@ -1,19 +1,261 @@
+from typing import NamedTuple
+
+import numpy as np
 import torch as th
 import torch.nn.functional as F
 import gymnasium as gym
+from gymnasium import spaces
 from stable_baselines3 import PPO
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.utils import explained_variance
+
+from src.profiling import timers
+
+
+class ExpertRolloutBufferSamples(NamedTuple):
+    observations: th.Tensor
+    actions: th.Tensor
+    old_values: th.Tensor
+    old_log_prob: th.Tensor
+    advantages: th.Tensor
+    returns: th.Tensor
+    expert_actions: th.Tensor
+    expert_mask: th.Tensor
+    sample_mask: th.Tensor
+
+
+class ExpertRolloutBuffer(RolloutBuffer):
+    """
+    Rollout buffer with the expert action for every stored observation.
+
+    Rollouts are collected into preallocated numpy arrays as usual. When training
+    starts, the whole buffer is moved to the training device once; minibatches
+    are then gathered on the device, with no per-minibatch host -> device copy.
+    """
+    _tensor_names = ["observations", "actions", "values", "log_probs", "advantages", "returns",
+                     "expert_actions", "expert_mask", "sample_mask"]
+
+    def reset(self):
+        self.expert_actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32)
+        # 0 where no expert action is known (first step after a reset)
+        self.expert_mask = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        # 0 for steps of an env with nothing to control (info["active"] False, e.g. an
+        # idle multi-agent slot): they take no part in any loss
+        self.sample_mask = np.ones((self.buffer_size, self.n_envs), dtype=np.float32)
+        self._device_tensors = None
+        super().reset()
+
+    def get(self, batch_size=None):
+        assert self.full, ""
+        n = self.buffer_size * self.n_envs
+        if self._device_tensors is None:
+            # Keep the flattened numpy arrays around (PPO logs explained variance from them)
+            for name in self._tensor_names:
+                self.__dict__[name] = self.swap_and_flatten(self.__dict__[name])
+            self.generator_ready = True
+            self._device_tensors = {name: self.to_torch(self.__dict__[name]) for name in self._tensor_names}
+
+        indices = th.randperm(n, device=self.device)
+        if batch_size is None:
+            batch_size = n
+        start_idx = 0
+        while start_idx < n:
+            yield self._get_samples(indices[start_idx:start_idx + batch_size])
+            start_idx += batch_size
+
+    def _get_samples(self, batch_inds, env=None):
+        t = self._device_tensors
+        return ExpertRolloutBufferSamples(
+            observations=t["observations"][batch_inds],
+            actions=t["actions"][batch_inds],
+            old_values=t["values"][batch_inds].flatten(),
+            old_log_prob=t["log_probs"][batch_inds].flatten(),
+            advantages=t["advantages"][batch_inds].flatten(),
+            returns=t["returns"][batch_inds].flatten(),
+            expert_actions=t["expert_actions"][batch_inds],
+            expert_mask=t["expert_mask"][batch_inds].flatten(),
+            sample_mask=t["sample_mask"][batch_inds].flatten(),
+        )
+
 
 class BC_PPO(PPO):
     """
     Custom PPO implementation with Behavior Cloning (BC) loss.
+
+    The env reports info['expert_action'] for the observation it returns. Those
+    actions are stored in an ExpertRolloutBuffer next to the observations, and
+    every PPO minibatch adds
+
+        bc_coef * MSE(policy mean action, expert action)
+
+    computed from the same forward pass as the PPO loss.
     """
     def __init__(self, *args, bc_coef=0.2, **kwargs):
+        kwargs.setdefault("rollout_buffer_class", ExpertRolloutBuffer)
         super().__init__(*args, **kwargs)
         self.bc_coef = bc_coef
 
+    def _excluded_save_params(self):
+        return super()._excluded_save_params() + ["_last_expert_actions", "_last_expert_mask"]
+
+    def _update_info_buffer(self, infos, dones=None):
+        # Called once per rollout step, after env.step() and before the buffer stores
+        # self._last_obs: record the expert action belonging to that observation, which
+        # came with the previous step's info, then keep this step's for the next one.
+        super()._update_info_buffer(infos, dones)
+        buffer = self.rollout_buffer
+        if not isinstance(buffer, ExpertRolloutBuffer):
+            return
+
+        n_envs = len(infos)
+        if getattr(self, "_last_expert_actions", None) is None or len(self._last_expert_actions) != n_envs:
+            self._last_expert_actions = np.zeros((n_envs, buffer.action_dim), dtype=np.float32)
+            self._last_expert_mask = np.zeros(n_envs, dtype=np.float32)
+        buffer.expert_actions[buffer.pos] = self._last_expert_actions
+        buffer.expert_mask[buffer.pos] = self._last_expert_mask
+        # 'active' describes the step just taken, i.e. the observation stored at buffer.pos
+        buffer.sample_mask[buffer.pos] = [float(info.get("active", True)) for info in infos]
+
+        for i, info in enumerate(infos):
+            expert = info.get("expert_action")
+            # After 'done' the next observation is a fresh reset with no expert yet
+            if expert is None or (dones is not None and dones[i]):
+                self._last_expert_mask[i] = 0.0
+            else:
+                self._last_expert_actions[i] = expert
+                self._last_expert_mask[i] = 1.0
+
+    def _evaluate(self, observations, actions):
+        """PPO's evaluate_actions, also returning the distribution for the BC loss."""
+        policy = self.policy
+        features = policy.extract_features(observations)
+        if policy.share_features_extractor:
+            latent_pi, latent_vf = policy.mlp_extractor(features)
+        else:
+            pi_features, vf_features = features
+            latent_pi = policy.mlp_extractor.forward_actor(pi_features)
+            latent_vf = policy.mlp_extractor.forward_critic(vf_features)
+        distribution = policy._get_action_dist_from_latent(latent_pi)
+        values = policy.value_net(latent_vf)
+        return values, distribution.log_prob(actions), distribution.entropy(), distribution
+
+    def _bc_loss(self, distribution, expert_actions, expert_mask):
+        # Mean action of the Gaussian (the env's steering/throttle are already in [-1, 1])
+        predicted = distribution.mode()
+        per_sample = F.mse_loss(predicted, expert_actions, reduction="none").mean(dim=1)
+        return (per_sample * expert_mask).sum() / expert_mask.sum().clamp(min=1.0)
+
+    @staticmethod
+    def _masked_mean(values, mask):
+        return (values * mask).sum() / mask.sum().clamp(min=1.0)
+
+    @timers.timed("ppo/collect_rollouts")
+    def collect_rollouts(self, *args, **kwargs):
+        return super().collect_rollouts(*args, **kwargs)
+
+    @timers.timed("ppo/train")
     def train(self):
         self.policy.set_training_mode(True)
         self._update_learning_rate(self.policy.optimizer)
-        # Note: Full implementation requires subclassing RolloutBuffer 
-        # to store expert actions. This is a structural skeleton.
-        super().train() 
+        clip_range = self.clip_range(self._current_progress_remaining)
+        if self.clip_range_vf is not None:
+            clip_range_vf = self.clip_range_vf(self._current_progress_remaining)
+
+        entropy_losses, pg_losses, value_losses, bc_losses = [], [], [], []
+        clip_fractions = []
+        approx_kl_divs = []
+
+        continue_training = True
+        for epoch in range(self.n_epochs):
+            approx_kl_divs = []
+            for rollout_data in self.rollout_buffer.get(self.batch_size):
+                actions = rollout_data.actions
+                if isinstance(self.action_space, spaces.Discrete):
+                    actions = rollout_data.actions.long().flatten()
+
+                # One forward pass for both the PPO and the BC terms
+                values, log_prob, entropy, distribution = self._evaluate(rollout_data.observations, actions)
+                values = values.flatten()
+                # Rows with nothing to control are left out of every term
+                if isinstance(rollout_data, ExpertRolloutBufferSamples):
+                    mask = rollout_data.sample_mask
+                else:
+                    mask = th.ones_like(values)
+
+                advantages = rollout_data.advantages
+                if self.normalize_advantage and mask.sum() > 1:
+                    mean = self._masked_mean(advantages, mask)
+                    std = self._masked_mean((advantages - mean) ** 2, mask).sqrt()
+                    advantages = (advantages - mean) / (std + 1e-8)
+
+                # 1. Clipped surrogate loss
+                ratio = th.exp(log_prob - rollout_data.old_log_prob)
+                policy_loss_1 = advantages * ratio
+                policy_loss_2 = advantages * th.clamp(ratio, 1 - clip_range, 1 + clip_range)
+                policy_loss = -self._masked_mean(th.min(policy_loss_1, policy_loss_2), mask)
+
+                # 2. Value loss
+                if self.clip_range_vf is None:
+                    values_pred = values
+                else:
+                    values_pred = rollout_data.old_values + th.clamp(
+                        values - rollout_data.old_values, -clip_range_vf, clip_range_vf
+                    )
+                value_loss = self._masked_mean((rollout_data.returns - values_pred) ** 2, mask)
+
+                # 3. Entropy loss
+                if entropy is None:
+                    entropy_loss = -self._masked_mean(-log_prob, mask)
+                else:
+                    entropy_loss = -self._masked_mean(entropy, mask)
+
+                # 4. Behavior cloning loss on the expert actions
+                loss = policy_loss + self.ent_coef * entropy_loss + self.vf_coef * value_loss
+                if isinstance(rollout_data, ExpertRolloutBufferSamples) and self.bc_coef > 0:
+                    bc_loss = self._bc_loss(distribution, rollout_data.expert_actions,
+                                            rollout_data.expert_mask * mask)
+                    loss = loss + self.bc_coef * bc_loss
+                    bc_losses.append(bc_loss.item())
+
+                pg_losses.append(policy_loss.item())
+                value_losses.append(value_loss.item())
+                entropy_losses.append(entropy_loss.item())
+                clip_fractions.append(self._masked_mean((th.abs(ratio - 1) > clip_range).float(), mask).item())
+
+                with th.no_grad():
+                    log_ratio = log_prob - rollout_data.old_log_prob
+                    approx_kl_div = self._masked_mean((th.exp(log_ratio) - 1) - log_ratio, mask).cpu().numpy()
+                    approx_kl_divs.append(approx_kl_div)
+
+                if self.target_kl is not None and approx_kl_div > 1.5 * self.target_kl:
+                    continue_training = False
+                    if self.verbose >= 1:
+                        print(f"Early stopping at step {epoch} due to reaching max kl: {approx_kl_div:.2f}")
+                    break
+
+                self.policy.optimizer.zero_grad()
+                loss.backward()
+                th.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+                self.policy.optimizer.step()
+
+            self._n_updates += 1
+            if not continue_training:
+                break
+
+        explained_var = explained_variance(self.rollout_buffer.values.flatten(), self.rollout_buffer.returns.flatten())
+
+        self.logger.record("train/entropy_loss", np.mean(entropy_losses))
+        self.logger.record("train/policy_gradient_loss", np.mean(pg_losses))
+        self.logger.record("train/value_loss", np.mean(value_losses))
+        if bc_losses:
+            self.logger.record("train/bc_loss", np.mean(bc_losses))
+        self.logger.record("train/approx_kl", np.mean(approx_kl_divs))
+        self.logger.record("train/clip_fraction", np.mean(clip_fractions))
+        self.logger.record("train/loss", loss.item())
+        self.logger.record("train/explained_variance", explained_var)
+        if hasattr(self.policy, "log_std"):
+            self.logger.record("train/std", th.exp(self.policy.log_std).mean().item())
+        self.logger.record("train/n_updates", self._n_updates, exclude="tensorboard")
+        self.logger.record("train/clip_range", clip_range)
+        if self.clip_range_vf is not None:
+            self.logger.record("train/clip_range_vf", clip_range_vf)
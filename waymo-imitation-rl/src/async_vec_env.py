@@ -0,0 +1,467 @@
+"""
+Asynchronous vectorized env with a shared-memory observation transport.
+
+SubprocVecEnv pickles every observation through a pipe and waits for the
+slowest worker on every step, so a single MetaDrive reset on a big Waymo map
+stalls the whole batch. AsyncSharedMemoryVecEnv instead:
+
+- Has workers write observations, rewards, done flags and expert actions into
+  one shared-memory file (a row per worker). Only a small completion record
+  (worker id, info dict) goes through a queue, in the order workers finish.
+- Runs more workers than it exposes env slots. When a slot's episode ends it
+  is handed over to a spare worker that has already reset, and the finished
+  worker resets in the background. The batch only waits for a reset when
+  every spare is busy resetting too.
+- Supports envpool-style partial batches: send(actions, env_ids) and
+  recv(batch_size) return as soon as 'batch_size' slots are ready, together
+  with their env ids.
+
+step_async()/step_wait() (the SB3 VecEnv API) are a send() to every slot and a
+full recv(), with the usual auto-reset semantics (terminal_observation,
+TimeLimit.truncated), so it is a drop-in replacement for SubprocVecEnv.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecEnv, VecEnvWrapper
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+from src.scenario_cache import default_cache_dir
+
+ALIGN = 64
+EXPERT_DIM = 2
+POLL_INTERVAL = 1.0  # s between worker liveness checks while waiting for records
+
+# Completion records: (kind, worker, payload)
+_STEPPED = 0
+_RESET = 1
+_ERROR = 2
+
+
+class SharedArrays:
+    """
+    Named numpy arrays laid out in one file on a shared-memory filesystem
+    (/dev/shm), mapped by every process. Pickles by path, so sending it to a
+    worker attaches it to the same pages.
+    """
+    def __init__(self, specs, path=None):
+        # specs: {key: (shape, dtype)}
+        self.specs = specs
+        self.owner = path is None
+        offsets, total = {}, 0
+        for key, (shape, dtype) in specs.items():
+            total = (total + ALIGN - 1) // ALIGN * ALIGN
+            offsets[key] = total
+            total += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self.owner:
+            fd, path = tempfile.mkstemp(prefix="waymo_vec_env_", dir=os.path.dirname(default_cache_dir()))
+            os.ftruncate(fd, max(total, 1))
+            os.close(fd)
+        self.path = path
+        self._mmap = np.memmap(path, dtype=np.uint8, mode="r+", shape=(max(total, 1),))
+        self.arrays = {
+            key: np.ndarray(shape, dtype, buffer=self._mmap, offset=offsets[key])
+            for key, (shape, dtype) in specs.items()
+        }
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __getstate__(self):
+        return {"specs": self.specs, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["specs"], state["path"])
+
+    def close(self):
+        self.arrays = {}
+        self._mmap = None
+        if self.owner and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _worker(worker, remote, parent_remote, results, env_fn_wrapper):
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    remote.send((env.observation_space, env.action_space))
+    shared = remote.recv()
+
+    def publish_reset(obs, info):
+        shared["reset_obs"][worker] = obs
+        results.put((_RESET, worker, info))
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                obs, reward, terminated, truncated, info = env.step(shared["actions"][worker].copy())
+                shared["obs"][worker] = obs
+                shared["rewards"][worker] = reward
+                shared["terminated"][worker] = terminated
+                shared["truncated"][worker] = truncated
+                expert = info.pop("expert_action", None)
+                shared["expert"][worker] = 0.0 if expert is None else expert
+                results.put((_STEPPED, worker, info))
+                if terminated or truncated:
+                    # Auto-reset right away; the parent hands this worker out once it is done
+                    publish_reset(*env.reset())
+            elif cmd == "reset":
+                seed, options = data
+                publish_reset(*env.reset(seed=seed, **({"options": options} if options else {})))
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            elif cmd == "close":
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        results.put((_ERROR, worker, traceback.format_exc()))
+    finally:
+        env.close()
+        shared.close()
+
+
+class AsyncSharedMemoryVecEnv(VecEnv):
+    """
+    env_fns: one per worker process. num_envs: env slots exposed to the
+    learner (default: all workers, i.e. no spares); the other
+    len(env_fns) - num_envs workers are spares that hide reset latency.
+
+    Slots move between workers at every episode end, so get_attr(),
+    env_method() and env_is_wrapped() reach only the workers currently bound
+    to the requested slots. set_attr() with indices=None also reaches every
+    spare worker, so the next worker to take over a slot is in the same state.
+    env_method(..., include_spares=True) calls every worker and returns one
+    result per worker; use it (through env_method_all_workers()) for methods
+    that collect and reset per-worker state, or the spares' share is lost.
+    """
+    def __init__(self, env_fns, num_envs=None, start_method=None):
+        num_workers = len(env_fns)
+        num_envs = num_workers if num_envs is None else num_envs
+        if not 0 < num_envs <= num_workers:
+            raise ValueError(f"num_envs must be in [1, {num_workers}], got {num_envs}")
+        self.num_workers = num_workers
+        self.closed = False
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        self.results = ctx.Queue()
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_workers)])
+        self.processes = []
+        for worker, (work_remote, remote, env_fn) in enumerate(zip(work_remotes, self.remotes, env_fns)):
+            args = (worker, work_remote, remote, self.results, CloudpickleWrapper(env_fn))
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        # 1. Spaces from the workers, then the shared block sized for them
+        observation_space, action_space = self.remotes[0].recv()
+        for remote in self.remotes[1:]:
+            remote.recv()
+        if not isinstance(observation_space, spaces.Box):
+            raise ValueError(f"Only Box observation spaces are supported, got {observation_space}")
+        self.shared = SharedArrays({
+            "obs": ((num_workers,) + observation_space.shape, observation_space.dtype),
+            "reset_obs": ((num_workers,) + observation_space.shape, observation_space.dtype),
+            "actions": ((num_workers,) + action_space.shape, action_space.dtype),
+            "rewards": ((num_workers,), np.float32),
+            "terminated": ((num_workers,), np.bool_),
+            "truncated": ((num_workers,), np.bool_),
+            "expert": ((num_workers, EXPERT_DIM), np.float32),
+        })
+        for remote in self.remotes:
+            remote.send(self.shared)
+
+        # 2. Slot <-> worker bookkeeping (slot i starts on worker i)
+        self._slot_worker = np.arange(num_envs)
+        self._worker_slot = np.full(num_workers, -1)
+        self._worker_slot[:num_envs] = np.arange(num_envs)
+        self._pending = np.zeros(num_workers, dtype=np.int64)  # records still expected per worker
+        self._idle = deque()          # workers that have reset and are not bound to a slot
+        self._waiting = deque()       # slots whose episode ended, waiting for a reset worker
+        self._done_results = {}       # slot -> (reward, info) of the step that ended its episode
+        self._worker_reset_info = [{} for _ in range(num_workers)]
+        self._ready = {}              # slot -> (obs, reward, done, info)
+        self._in_flight = set()
+        self._stats = {"steps": 0, "episodes": 0, "reset_stalls": 0, "wait_time": 0.0}
+        self._window = (time.perf_counter(), 0, 0.0)
+
+        super().__init__(num_envs, observation_space, action_space)
+
+    # --- Completion records --------------------------------------------------
+
+    def _next_record(self):
+        start = time.perf_counter()
+        while True:
+            try:
+                kind, worker, payload = self.results.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                # A worker killed outright (e.g. a simulator segfault) never reports an error
+                dead = [worker for worker in np.flatnonzero(self._pending)
+                        if not self.processes[worker].is_alive()]
+                if dead:
+                    codes = ", ".join(f"{w} (exit code {self.processes[w].exitcode})" for w in dead)
+                    raise RuntimeError(f"Worker(s) {codes} died with results pending")
+        self._stats["wait_time"] += time.perf_counter() - start
+        self._pending[worker] -= 1
+        if kind == _ERROR:
+            raise RuntimeError(f"Worker {worker} crashed:\n{payload}")
+        return kind, worker, payload
+
+    def _handle(self, kind, worker, payload):
+        buf = self.shared
+        if kind == _RESET:
+            self._worker_reset_info[worker] = payload
+            self._idle.append(worker)
+            self._bind_idle()
+            return
+
+        slot = self._worker_slot[worker]
+        self._in_flight.discard(slot)
+        info = payload
+        info["expert_action"] = buf["expert"][worker].copy()
+        terminated, truncated = bool(buf["terminated"][worker]), bool(buf["truncated"][worker])
+        reward = float(buf["rewards"][worker])
+        self._stats["steps"] += 1
+        if terminated or truncated:
+            info["TimeLimit.truncated"] = truncated and not terminated
+            info["terminal_observation"] = buf["obs"][worker].copy()
+            # The worker is resetting itself now; the slot takes the next reset one
+            self._pending[worker] += 1
+            self._worker_slot[worker] = -1
+            self._done_results[slot] = (reward, info)
+            self._waiting.append(slot)
+            self._stats["episodes"] += 1
+            if not self._idle:
+                self._stats["reset_stalls"] += 1
+            self._bind_idle()
+        else:
+            info["TimeLimit.truncated"] = False
+            self._ready[slot] = (buf["obs"][worker].copy(), reward, False, info)
+
+    def _bind_idle(self):
+        while self._waiting and self._idle:
+            slot, worker = self._waiting.popleft(), self._idle.popleft()
+            self._slot_worker[slot] = worker
+            self._worker_slot[worker] = slot
+            self.reset_infos[slot] = self._worker_reset_info[worker]
+            obs = self.shared["reset_obs"][worker].copy()
+            if slot in self._done_results:
+                reward, info = self._done_results.pop(slot)
+                self._ready[slot] = (obs, reward, True, info)
+            else:
+                self._ready[slot] = (obs, 0.0, False, {})
+
+    def _drain(self):
+        """Waits for every outstanding record (steps and background resets)."""
+        while self._pending.any():
+            self._handle(*self._next_record())
+
+    # --- Partial batches -----------------------------------------------------
+
+    def send(self, actions, env_ids=None):
+        """Starts a step of slots 'env_ids' (default: all) with 'actions' (one row per id)."""
+        env_ids = np.arange(self.num_envs) if env_ids is None else np.asarray(env_ids)
+        for slot, action in zip(env_ids, actions):
+            slot = int(slot)
+            if slot in self._in_flight or slot in self._ready or slot in self._done_results:
+                raise RuntimeError(f"Env {slot} already has a step in progress")
+            worker = self._slot_worker[slot]
+            self.shared["actions"][worker] = action
+            self._pending[worker] += 1
+            self._in_flight.add(slot)
+            self.remotes[worker].send(("step", None))
+
+    def recv(self, batch_size=None):
+        """
+        Blocks until 'batch_size' slots (default: all outstanding ones) have
+        results. Returns env_ids, obs, rewards, dones, infos for those slots,
+        sorted by env id. Slots that finished an episode return the first
+        observation of the next one, as in step_wait().
+        """
+        outstanding = len(self._in_flight) + len(self._waiting) + len(self._ready)
+        batch_size = outstanding if batch_size is None else min(batch_size, outstanding)
+        while len(self._ready) < batch_size:
+            self._handle(*self._next_record())
+
+        env_ids = sorted(self._ready)[:batch_size]
+        obs, rewards, dones, infos = zip(*[self._ready.pop(slot) for slot in env_ids])
+        return (np.array(env_ids), np.stack(obs), np.array(rewards, dtype=np.float32),
+                np.array(dones), list(infos))
+
+    # --- VecEnv API ------------------------------------------------------------
+
+    def reset(self):
+        self._drain()
+        self._ready.clear()
+        self._idle.clear()
+        self._done_results.clear()
+        self._in_flight.clear()
+        self._worker_slot[:] = -1
+        self._waiting = deque(range(self.num_envs))
+        for worker, remote in enumerate(self.remotes):
+            slot_args = (self._seeds[worker], self._options[worker]) if worker < self.num_envs else (None, None)
+            self._pending[worker] += 1
+            remote.send(("reset", slot_args))
+        # Slots go to the first workers that finish; the rest become spares
+        while len(self._ready) < self.num_envs:
+            self._handle(*self._next_record())
+        obs = np.stack([self._ready.pop(slot)[0] for slot in range(self.num_envs)])
+        self._reset_seeds()
+        self._reset_options()
+        return obs
+
+    def step_async(self, actions):
+        self.send(actions)
+
+    def step_wait(self):
+        _, obs, rewards, dones, infos = self.recv()
+        return obs, rewards, dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._drain()
+        except RuntimeError:
+            pass
+        for remote, process in zip(self.remotes, self.processes):
+            if process.is_alive():
+                remote.send(("close", None))
+        for process in self.processes:
+            process.join(timeout=30)
+        self.shared.close()
+        self.closed = True
+
+    def throughput(self):
+        """
+        Env steps/sec since the previous call, and the share of that wall time
+        the caller spent blocked waiting for workers.
+        """
+        now = time.perf_counter()
+        start, steps, wait_time = self._window
+        elapsed = max(now - start, 1e-9)
+        stats = {
+            "steps_per_sec": (self._stats["steps"] - steps) / elapsed,
+            "wait_fraction": (self._stats["wait_time"] - wait_time) / elapsed,
+            "steps": self._stats["steps"],
+            "episodes": self._stats["episodes"],
+            # Episodes that ended with no spare worker ready to take over
+            "reset_stalls": self._stats["reset_stalls"],
+        }
+        self._window = (now, self._stats["steps"], self._stats["wait_time"])
+        return stats
+
+    def _slot_workers(self, indices):
+        return [int(self._slot_worker[i]) for i in self._get_indices(indices)]
+
+    def _call(self, workers, message):
+        for worker in workers:
+            self.remotes[worker].send(message)
+        return [self.remotes[worker].recv() for worker in workers]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call(self._slot_workers(indices), ("get_attr", attr_name))
+
+    def set_attr(self, attr_name, value, indices=None):
+        workers = self._slot_workers(indices)
+        if indices is None:
+            # Also the unbound workers (spares and ones resetting)
+            workers += [int(w) for w in np.flatnonzero(self._worker_slot < 0)]
+        self._call(workers, ("set_attr", (attr_name, value)))
+
+    def env_method(self, method_name, *method_args, indices=None, include_spares=False, **method_kwargs):
+        """
+        Calls 'method_name' on the workers bound to slots 'indices' (one result
+        per slot), or with include_spares=True on every worker (one result per
+        worker, in worker order; indices must be None).
+        """
+        if include_spares:
+            if indices is not None:
+                raise ValueError("include_spares=True calls every worker; indices must be None")
+            workers = list(range(self.num_workers))
+        else:
+            workers = self._slot_workers(indices)
+        return self._call(workers, ("env_method", (method_name, method_args, method_kwargs)))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call(self._slot_workers(indices), ("is_wrapped", wrapper_class))
+
+
+def unwrap_async_env(venv):
+    """The AsyncSharedMemoryVecEnv under any VecEnvWrappers, else None."""
+    while isinstance(venv, VecEnvWrapper):
+        venv = venv.venv
+    return venv if isinstance(venv, AsyncSharedMemoryVecEnv) else None
+
+
+def env_method_all_workers(venv, method_name, *method_args, **method_kwargs):
+    """
+    venv.env_method() on every env process: with an AsyncSharedMemoryVecEnv
+    underneath that includes its spare workers (one result per worker),
+    otherwise it is the plain call (one result per env).
+    """
+    async_env = unwrap_async_env(venv)
+    if async_env is not None:
+        return async_env.env_method(method_name, *method_args, include_spares=True, **method_kwargs)
+    return venv.env_method(method_name, *method_args, **method_kwargs)
+
+
+class ThroughputCallback(BaseCallback):
+    """
+    Logs env-steps/sec every rollout. Works with any VecEnv; with an
+    AsyncSharedMemoryVecEnv underneath it also logs its wait / stall stats.
+    """
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self._start = None
+        self._start_steps = 0
+
+    def _async_env(self):
+        return unwrap_async_env(self.training_env)
+
+    def _on_rollout_start(self):
+        self._start = time.perf_counter()
+        self._start_steps = self.num_timesteps
+        env = self._async_env()
+        if env is not None:
+            env.throughput()  # restart its window, so training time is not counted
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        steps_per_sec = (self.num_timesteps - self._start_steps) / elapsed
+        self.logger.record("throughput/rollout_steps_per_sec", steps_per_sec)
+        env = self._async_env()
+        if env is not None:
+            stats = env.throughput()
+            self.logger.record("throughput/env_steps_per_sec", stats["steps_per_sec"])
+            self.logger.record("throughput/wait_fraction", stats["wait_fraction"])
+            self.logger.record("throughput/reset_stalls", stats["reset_stalls"])
+        if self.verbose:
+            print(f"⏱️ {steps_per_sec:.0f} env-steps/sec")
@@ -0,0 +1,231 @@
+"""
+Compact scenario encoding for the .pkl datasets.
+
+encode_scenario() shrinks a converted scenario by:
+
+- Douglas-Peucker simplification of map polylines, within 'tolerance' m
+  (vectorized over all polylines of the scenario at once)
+- storing per-track constants (size / length / width / height) as scalars
+- storing only the resampled lane points and headings (int16) of the map
+  geometry table; the bounding boxes and grid index are rebuilt on decode
+- optionally quantizing track positions and map geometry to fixed point
+  ('quantum' m steps) relative to the scenario origin, delta-encoded along
+  each array so the compressor sees small integers
+- compressing every array buffer as its own chunk (zlib or lzma)
+
+The result pickles as a call to decode_scenario(), so pickle.load() on a
+compact file returns the ordinary scenario dict. Nothing that reads .pkl
+scenarios (DirectWaymoEnv, build_summary, the scenario cache) needs to know.
+Simplification and quantization are lossy; everything else is exact.
+
+Only the pickle format is compacted: the memory-mapped store keeps raw
+columns so that readers get zero-copy views.
+"""
+
+import lzma
+import pickle
+import zlib
+
+import numpy as np
+
+from src.map_geometry import MAP_KEY, index_lane_points
+
+COMPACT_VERSION = 1
+DEFAULT_TOLERANCE = 0.05   # m, Douglas-Peucker error bound for map polylines
+DEFAULT_QUANTUM = 0.01     # m, fixed-point step (None = keep float32)
+MIN_CHUNK_BYTES = 256      # smaller buffers are stored uncompressed
+HEADING_QUANTUM = np.pi / 32767  # rad, map geometry headings are stored as int16
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    "none": (bytes, bytes),
+}
+
+SIZE_KEYS = ("length", "width", "height")
+GEOMETRY_KEYS = ("spacing", "cell_size", "lane_ids", "lane_offsets", "points")
+
+
+def simplify_polylines(polylines, tolerance=DEFAULT_TOLERANCE):
+    """
+    Douglas-Peucker on many polylines at once. Every round splits all segments
+    whose farthest interior point is more than 'tolerance' away (point-to-segment
+    distance), so the number of rounds is the recursion depth, not the point count.
+    Returns the simplified polylines (endpoints always kept).
+    """
+    if not polylines:
+        return []
+    counts = np.array([len(p) for p in polylines])
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    points = np.concatenate([np.asarray(p, dtype=np.float64) for p in polylines])
+    xy = points[:, :2]
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets[:-1][counts > 0]] = True
+    keep[offsets[1:][counts > 0] - 1] = True
+
+    while True:
+        kept = np.flatnonzero(keep)
+        if len(kept) < 2:
+            break
+        # Segment of every point: between the kept points around it. Kept points of
+        # adjacent polylines are neighbours, so no segment spans two polylines.
+        seg = np.clip(np.searchsorted(kept, np.arange(len(points)), side="right") - 1, 0, len(kept) - 2)
+        a, b = xy[kept[seg]], xy[kept[seg + 1]]
+        ab = b - a
+        t = np.clip(((xy - a) * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0.0, 1.0)
+        dist = np.linalg.norm(xy - (a + t[:, None] * ab), axis=1)
+        dist[keep] = 0.0
+
+        # Farthest point of every segment, split where it exceeds the tolerance
+        order = np.lexsort((-dist, seg))
+        first = order[np.flatnonzero(np.diff(np.concatenate([[-1], seg[order]])))]
+        split = first[dist[first] > tolerance]
+        if len(split) == 0:
+            break
+        keep[split] = True
+
+    return [points[start:end][keep[start:end]] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+# --- Fixed point ------------------------------------------------------------------
+
+def _quantize(array, origin, quantum):
+    """float (N, D) -> int32 (N, D) deltas along axis 0 of the fixed-point values."""
+    fixed = np.round((np.asarray(array, dtype=np.float64) - origin[:array.shape[1]]) / quantum).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, fixed.shape[1]), dtype=np.int64))
+    return deltas.astype(np.int32)
+
+
+def _dequantize(deltas, origin, quantum):
+    fixed = np.cumsum(deltas.astype(np.int64), axis=0)
+    return (fixed * quantum + origin[:deltas.shape[1]]).astype(np.float32)
+
+
+class _Quantized:
+    """Marker for a quantized array inside the encoded scenario."""
+    __slots__ = ("deltas",)
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    def __reduce__(self):
+        return _Quantized, (self.deltas,)
+
+
+# --- Encode / decode ---------------------------------------------------------------
+
+def _encode_track(state, origin, quantum):
+    state = dict(state)
+    size = np.asarray(state["size"])
+    if len(size) and (size == size[0]).all():
+        # Constant over the track: one row, the length/width/height views are rebuilt on decode
+        state["size"] = size[0].copy()
+        for key in SIZE_KEYS:
+            state.pop(key, None)
+    if quantum is not None:
+        state["position"] = _Quantized(_quantize(state["position"], origin, quantum))
+    return state
+
+
+def _decode_track(state, origin, quantum):
+    if isinstance(state["position"], _Quantized):
+        state["position"] = _dequantize(state["position"].deltas, origin, quantum)
+    size = state["size"]
+    if size.ndim == 1:
+        size = np.repeat(size[None].astype(np.float32), len(state["valid"]), axis=0)
+        state["size"] = size
+        for i, key in enumerate(SIZE_KEYS):
+            state[key] = size[:, i].copy()
+    return state
+
+
+def encode_scenario(scenario, tolerance=DEFAULT_TOLERANCE, quantum=DEFAULT_QUANTUM, codec="zlib"):
+    """Returns a CompactScenario; pickle it to get the compact file contents."""
+    sdc = scenario["tracks"].get(scenario["metadata"]["sdc_id"])
+    origin = np.zeros(3)
+    if sdc is not None and len(sdc["state"]["position"]):
+        origin[:2] = np.round(np.asarray(sdc["state"]["position"])[0, :2])
+
+    # 1. Map: simplified polylines, optionally quantized geometry
+    map_features = {}
+    polyline_ids = [f_id for f_id, f in scenario["map_features"].items() if "polyline" in f and len(f["polyline"]) > 2]
+    simplified = simplify_polylines([scenario["map_features"][f_id]["polyline"] for f_id in polyline_ids], tolerance)
+    simplified = dict(zip(polyline_ids, simplified))
+    for f_id, feature in scenario["map_features"].items():
+        feature = dict(feature)
+        if f_id in simplified:
+            feature["polyline"] = simplified[f_id].astype(np.float32)
+        if quantum is not None:
+            for key in ("polyline", "polygon"):
+                if key in feature and len(feature[key]):
+                    feature[key] = _Quantized(_quantize(feature[key], origin, quantum))
+        map_features[f_id] = feature
+
+    # 2. Tracks: scalar constants, optionally quantized positions
+    tracks = {}
+    for t_id, track in scenario["tracks"].items():
+        tracks[t_id] = dict(track, state=_encode_track(track["state"], origin, quantum))
+
+    # 3. Map geometry: the lane points are enough to rebuild the table
+    metadata = dict(scenario["metadata"])
+    if MAP_KEY in metadata:
+        geometry = {key: metadata[MAP_KEY][key] for key in GEOMETRY_KEYS}
+        if quantum is not None and len(geometry["points"]):
+            geometry["points"] = _Quantized(_quantize(geometry["points"], origin, quantum))
+        # Kept rather than recomputed: quantization can flip the direction of very short segments
+        headings = np.asarray(metadata[MAP_KEY]["headings"], dtype=np.float64)
+        geometry["headings"] = np.round(headings / HEADING_QUANTUM).astype(np.int16)
+        metadata[MAP_KEY] = geometry
+
+    encoded = dict(scenario, tracks=tracks, map_features=map_features, metadata=metadata)
+    header = {"version": COMPACT_VERSION, "origin": origin, "quantum": quantum, "codec": codec}
+
+    # 4. Arrays go out of band, each compressed as its own chunk
+    buffers = []
+    stream = pickle.dumps(encoded, protocol=5, buffer_callback=buffers.append)
+    compress = CODECS[codec][0]
+    chunks = []
+    for buffer in buffers:
+        raw = buffer.raw()
+        chunks.append((True, compress(raw)) if raw.nbytes >= MIN_CHUNK_BYTES else (False, bytes(raw)))
+    return CompactScenario(header, compress(stream), chunks)
+
+
+def decode_scenario(header, stream, chunks):
+    if header["version"] != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact scenario version {header['version']}")
+    decompress = CODECS[header["codec"]][1]
+    buffers = [bytearray(decompress(data)) if compressed else bytearray(data) for compressed, data in chunks]
+    scenario = pickle.loads(decompress(stream), buffers=buffers)
+
+    origin, quantum = np.asarray(header["origin"]), header["quantum"]
+    for track in scenario["tracks"].values():
+        _decode_track(track["state"], origin, quantum)
+    for feature in scenario["map_features"].values():
+        for key in ("polyline", "polygon"):
+            if isinstance(feature.get(key), _Quantized):
+                feature[key] = _dequantize(feature[key].deltas, origin, quantum)
+    geometry = scenario["metadata"].get(MAP_KEY)
+    if geometry is not None:
+        if isinstance(geometry["points"], _Quantized):
+            geometry["points"] = _dequantize(geometry["points"].deltas, origin, quantum)
+        table = index_lane_points(geometry["lane_ids"], geometry["lane_offsets"], geometry["points"],
+                                  geometry["spacing"], geometry["cell_size"])
+        table["headings"] = (geometry["headings"] * HEADING_QUANTUM).astype(np.float32)
+        scenario["metadata"][MAP_KEY] = table
+    return scenario
+
+
+class CompactScenario:
+    """Pickles as a decode_scenario() call: unpickling yields the plain scenario dict."""
+    def __init__(self, header, stream, chunks):
+        self.header = header
+        self.stream = stream
+        self.chunks = chunks
+
+    def __reduce__(self):
+        return decode_scenario, (self.header, self.stream, self.chunks)
+
+
+def dumps_compact(scenario, **kwargs):
+    return pickle.dumps(encode_scenario(scenario, **kwargs), protocol=pickle.HIGHEST_PROTOCOL)
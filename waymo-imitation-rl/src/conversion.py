@@ -0,0 +1,256 @@
+"""
+Waymo Scenario -> MetaDrive scenario dict conversion.
+
+Two paths produce the same output:
+
+- convert_scenario_proto: reads the protobuf repeated fields straight into
+  preallocated NumPy arrays (fast path).
+- convert_scenario_dict: the original MessageToDict + per-state loop, kept for
+  dict inputs and as the benchmark baseline.
+"""
+
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+from metadrive.type import MetaDriveType
+
+from src.expert import add_expert_table
+from src.map_geometry import add_map_geometry
+
+# Per-state fields in the order they are packed into the flat state array
+STATE_FIELDS = (
+    "center_x", "center_y", "center_z",
+    "length", "width", "height",
+    "heading", "velocity_x", "velocity_y",
+    "valid",
+)
+_STATE_GETTER = attrgetter(*STATE_FIELDS)
+_POINT_GETTER = attrgetter("x", "y")
+
+# Waymo map feature kind -> (MetaDrive type, proto field, output key)
+MAP_FEATURE_KINDS = {
+    "lane": (MetaDriveType.LANE_SURFACE_STREET, "polyline", "polyline"),
+    "road_line": (MetaDriveType.LINE_UNKNOWN, "polyline", "polyline"),
+    "road_edge": (MetaDriveType.BOUNDARY_LINE, "polyline", "polyline"),
+    "crosswalk": (MetaDriveType.CROSSWALK, "polygon", "polygon"),
+    "driveway": (MetaDriveType.DRIVEWAY, "polygon", "polygon"),
+}
+
+
+def get_metadrive_type(waymo_type):
+    # Waymo: 1=Vehicle, 2=Pedestrian, 3=Cyclist
+    if waymo_type == 1:
+        return MetaDriveType.VEHICLE
+    elif waymo_type == 2:
+        return MetaDriveType.PEDESTRIAN
+    elif waymo_type == 3:
+        return MetaDriveType.CYCLIST
+    else:
+        return MetaDriveType.OTHER
+
+
+def clean_scenario_id(raw_id, base_name, index):
+    """
+    Original ID: "hash|path/to/training.tfrecord-00000"
+    Clean ID: "hash" (We split by | and take the first part)
+    """
+    clean_id = raw_id.split("|")[0] if "|" in raw_id else raw_id
+    # If clean_id is still weird or empty, make a synthetic one
+    if not clean_id or "tfrecord" in clean_id:
+        clean_id = f"{base_name}_{index}"
+    return clean_id
+
+
+def make_state_dict(flat):
+    """
+    Builds the MetaDrive state dict of one track from an (n, len(STATE_FIELDS)) array.
+    """
+    valid = flat[:, 9].astype(np.int8)
+    size = np.ascontiguousarray(flat[:, 3:6])
+    # Invalid states carry placeholder sizes, use the first valid one instead
+    if valid.any() and not valid.all():
+        size[valid == 0] = size[np.argmax(valid)]
+    return {
+        "position": np.ascontiguousarray(flat[:, 0:3]),
+        "heading": np.ascontiguousarray(flat[:, 6]),
+        "velocity": np.ascontiguousarray(flat[:, 7:9]),
+        "size": size,
+        "valid": valid,
+        "length": size[:, 0].copy(),
+        "width": size[:, 1].copy(),
+        "height": size[:, 2].copy(),
+    }
+
+
+def build_scenario(clean_id, sdc_id, timestamps, new_tracks, new_map):
+    scenario = {
+        "length": len(timestamps),
+        "ts": timestamps,
+        "metadata": {
+            "sdc_id": sdc_id,
+            "scenario_id": clean_id,
+            "dataset": "waymo"
+        },
+        "tracks": new_tracks,
+        "map_features": new_map,
+        "dynamic_map_states": {},
+        "id": clean_id,
+        "version": "waymo_v1.2"
+    }
+    if sdc_id in new_tracks:
+        # Expert actions along the logged SDC trajectory, computed once here (see src.expert)
+        add_expert_table(scenario)
+    # Resampled lanes, bounding boxes and grid index, reused by every episode (see src.map_geometry)
+    add_map_geometry(scenario)
+    return scenario
+
+
+# ---------------------------------------------------------------------------
+# Fast path: protobuf -> NumPy
+# ---------------------------------------------------------------------------
+
+def extract_track_states(tracks):
+    """
+    Reads the states of all tracks into one preallocated (total_states, 10) array.
+
+    Returns one state dict per track (None for tracks without states).
+    """
+    counts = np.fromiter((len(t.states) for t in tracks), dtype=np.int64, count=len(tracks))
+    total = int(counts.sum())
+    flat = np.fromiter(
+        chain.from_iterable(map(_STATE_GETTER, chain.from_iterable(t.states for t in tracks))),
+        dtype=np.float32,
+        count=total * len(STATE_FIELDS),
+    ).reshape(total, len(STATE_FIELDS))
+
+    states = []
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        states.append(make_state_dict(flat[start:end]) if end > start else None)
+    return states
+
+
+def extract_points(points):
+    n = len(points)
+    return np.fromiter(
+        chain.from_iterable(map(_POINT_GETTER, points)), dtype=np.float32, count=2 * n
+    ).reshape(n, 2)
+
+
+def process_map_feature_proto(feature):
+    kind = feature.WhichOneof("feature_data")
+    if kind not in MAP_FEATURE_KINDS:
+        return None
+    md_type, field, geometry_key = MAP_FEATURE_KINDS[kind]
+    points = getattr(getattr(feature, kind), field)
+    if not points:
+        return None
+    f_id = str(feature.id)
+    return {"id": f_id, "type": md_type, geometry_key: extract_points(points)}
+
+
+def convert_scenario_proto(scenario, clean_id):
+    """
+    Converts a scenario_pb2.Scenario without going through MessageToDict.
+    Returns None if the SDC track is missing.
+    """
+    tracks_list = scenario.tracks
+    sdc_index = scenario.sdc_track_index
+    timestamps = np.array(scenario.timestamps_seconds, dtype=np.float32)
+
+    sdc_id = "unknown"
+    if len(tracks_list) and sdc_index < len(tracks_list):
+        sdc_id = str(tracks_list[sdc_index].id)
+
+    new_tracks = {}
+    for track, state_dict in zip(tracks_list, extract_track_states(tracks_list)):
+        if state_dict is None:
+            continue
+        t_id = str(track.id)
+        t_type = get_metadrive_type(track.object_type)
+        new_tracks[t_id] = {
+            "type": t_type,
+            "state": state_dict,
+            "metadata": {"track_length": len(state_dict["valid"]), "type": t_type, "object_id": t_id}
+        }
+
+    if sdc_id not in new_tracks:
+        return None
+
+    new_map = {}
+    for feature in scenario.map_features:
+        processed_feat = process_map_feature_proto(feature)
+        if processed_feat:
+            new_map[processed_feat["id"]] = processed_feat
+
+    return build_scenario(clean_id, sdc_id, timestamps, new_tracks, new_map)
+
+
+# ---------------------------------------------------------------------------
+# Dict path: MessageToDict output (baseline)
+# ---------------------------------------------------------------------------
+
+def extract_state_arrays(track_proto):
+    states = track_proto.get("states", [])
+    if not states:
+        return None
+
+    # MessageToDict drops fields that hold their default value (0 / False)
+    rows = [[state.get(field, 0.0) for field in STATE_FIELDS] for state in states]
+    return make_state_dict(np.array(rows, dtype=np.float32))
+
+
+def process_map_feature(feature):
+    f_id = str(feature.get("id", 0))
+    for kind, (md_type, field, geometry_key) in MAP_FEATURE_KINDS.items():
+        if kind in feature:
+            points_raw = feature[kind].get(field, [])
+            if not points_raw:
+                return None
+            pts = [[p.get("x", 0), p.get("y", 0)] for p in points_raw]
+            return {"id": f_id, "type": md_type, geometry_key: np.array(pts, dtype=np.float32)}
+    return None
+
+
+def convert_scenario_dict(scenario_proto, clean_id):
+    """
+    Converts the MessageToDict form of a scenario. Returns None if the SDC track is missing.
+    """
+    sdc_index = scenario_proto.get('sdc_track_index', 0)
+    tracks_list = scenario_proto.get('tracks', [])
+    timestamps = np.array(scenario_proto.get('timestamps_seconds', []), dtype=np.float32)
+
+    sdc_id = "unknown"
+    if tracks_list and sdc_index < len(tracks_list):
+        sdc_id = str(tracks_list[sdc_index].get('id', 0))
+
+    new_tracks = {}
+    for track in tracks_list:
+        t_id = str(track.get('id', 0))
+        t_type = get_metadrive_type(track.get('object_type', 0))
+        state_dict = extract_state_arrays(track)
+        if t_id and state_dict:
+            new_tracks[t_id] = {
+                "type": t_type,
+                "state": state_dict,
+                "metadata": {"track_length": len(state_dict["valid"]), "type": t_type, "object_id": t_id}
+            }
+
+    if sdc_id not in new_tracks:
+        return None
+
+    new_map = {}
+    for feature in scenario_proto.get('map_features', []):
+        processed_feat = process_map_feature(feature)
+        if processed_feat:
+            new_map[processed_feat["id"]] = processed_feat
+
+    return build_scenario(clean_id, sdc_id, timestamps, new_tracks, new_map)
+
+
+def convert_scenario(scenario, clean_id):
+    """Dispatches to the fast path for protobuf messages and the dict path otherwise."""
+    if isinstance(scenario, dict):
+        return convert_scenario_dict(scenario, clean_id)
+    return convert_scenario_proto(scenario, clean_id)
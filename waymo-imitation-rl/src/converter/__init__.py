@@ -0,0 +1,16 @@
+"""
+The scenario converter: Waymo tfrecords -> MetaDrive scenario files.
+
+scripts/convert.py is its command line. From Python:
+
+    from src.converter import Stages, find_sources, run_pipeline
+    stages = Stages.for_format("pkl", filters=[partial(min_sdc_valid_steps, steps=80)])
+    run_pipeline(find_sources("data/waymo_raw"), "data/waymo_processed", "pkl", stages=stages)
+"""
+
+from src.converter.pipeline import ConversionPipeline, find_sources, iter_tfrecord, run_pipeline
+from src.converter.stages import (
+    DECODERS, ENCODERS, WRITERS, PickleWriter, Stages, StoreWriter,
+    crop_map, decode_dict, decode_proto, encode_compact, encode_pickle, encode_store,
+    min_sdc_valid_steps, scenario_ids,
+)
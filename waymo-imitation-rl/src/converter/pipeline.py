@@ -0,0 +1,253 @@
+"""
+Streaming conversion pipeline: reader -> worker pool -> writer.
+
+- The reader thread streams raw scenario records out of the tfrecords.
+- A process pool runs the decode / filter / transform / encode stages (see
+  src.converter.stages) on individual scenarios, so load balance is per
+  scenario rather than per file.
+- The writer thread batches finished scenarios onto disk.
+
+Bounded queues between the stages (and a cap on in-flight work) give
+backpressure, so memory stays flat no matter how large the dataset is.
+Results are handled in completion order.
+
+Finished sources are journaled in a ConversionManifest, so a rerun skips
+unchanged tfrecords and only redoes changed or failed ones. Outputs are
+written atomically (temp file + rename).
+"""
+
+import glob
+import os
+import queue
+import struct
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from tqdm import tqdm
+
+from src.converter.stages import WRITERS, Stages
+from src.manifest import ConversionManifest, new_hasher
+
+_END = object()
+
+
+def iter_tfrecord(path, hasher=None):
+    """
+    Yields the raw records of an uncompressed TFRecord file.
+
+    Format per record: uint64 length, uint32 crc, <length> bytes, uint32 crc.
+    If given, 'hasher' is fed every byte read, i.e. the whole file's content.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(12)
+            if not header:
+                return
+            if len(header) < 12:
+                raise IOError(f"Truncated record header in {path}")
+            (length,) = struct.unpack("<Q", header[:8])
+            data = f.read(length)
+            footer = f.read(4)
+            if len(data) < length or len(footer) < 4:
+                raise IOError(f"Truncated record in {path}")
+            if hasher is not None:
+                hasher.update(header)
+                hasher.update(data)
+                hasher.update(footer)
+            yield data
+
+
+# Stages of the current worker process, set once by the pool initializer
+_stages = None
+
+
+def _init_worker(stages):
+    global _stages
+    _stages = stages
+
+
+def _convert_record(raw, source, index):
+    return _stages.convert(raw, source, index)
+
+
+def find_sources(raw_path):
+    """The .tfrecord files of a directory, searched recursively if there are none at the top."""
+    files = glob.glob(os.path.join(raw_path, "*.tfrecord*"))
+    if not files:
+        files = glob.glob(os.path.join(raw_path, "**", "*.tfrecord*"), recursive=True)
+    return sorted(files)
+
+
+class ConversionPipeline:
+    def __init__(self, output_dir, output_format="pkl", workers=4, queue_size=None, write_batch=32, force=False,
+                 stages=None):
+        self.output_dir = output_dir
+        self.force = force
+        self.output_format = output_format
+        self.stages = stages or Stages.for_format(output_format)
+        self.workers = workers
+        self.queue_size = queue_size or 4 * workers
+        self.write_batch = write_batch
+
+        self.read_queue = queue.Queue(maxsize=self.queue_size)
+        self.write_queue = queue.Queue(maxsize=self.queue_size)
+        os.makedirs(output_dir, exist_ok=True)
+        self.writer = WRITERS[output_format](output_dir)
+        self.manifest = ConversionManifest(output_dir)
+        self.errors = []
+        self.converted = 0
+        self.skipped = 0
+        self.up_to_date = 0
+
+        # source -> [records read, records finished, reader done, failed, digest]
+        self._sources = {}
+        # source -> (scenario ids, output names), owned by the writer thread
+        self._produced = {}
+
+    # --- Stage 1: reader -----------------------------------------------------
+
+    def _read(self, files):
+        for source in files:
+            count = 0
+            hasher = new_hasher()
+            try:
+                for raw in iter_tfrecord(source, hasher):
+                    self.read_queue.put(("record", source, count, raw))
+                    count += 1
+            except Exception as e:
+                self.read_queue.put(("error", source, f"Error reading {source}: {e}"))
+            self.read_queue.put(("end", source, count, hasher.hexdigest()))
+        self.read_queue.put(_END)
+
+    # --- Stage 3: writer -----------------------------------------------------
+
+    def _write(self):
+        while True:
+            batch = [self.write_queue.get()]
+            # Drain whatever else is ready, up to one batch
+            while len(batch) < self.write_batch:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in batch:
+                if item is _END:
+                    self.writer.close()
+                    return
+                kind, source, clean_id, payload = item
+                try:
+                    if kind == "scenario":
+                        name = self.writer.write(source, clean_id, *payload)
+                        ids, outputs = self._produced.setdefault(source, ([], []))
+                        ids.append(clean_id)
+                        if name not in outputs:
+                            outputs.append(name)
+                    elif kind == "source_done":
+                        self.writer.finish_source(source)
+                        self._record_source(source, "done", payload)
+                    elif kind == "source_failed":
+                        self.writer.abort_source(source)
+                        self._record_source(source, "failed", payload)
+                except Exception as e:
+                    self.errors.append(f"Error writing {clean_id or source}: {e}")
+                    if kind != "scenario":
+                        self.writer.abort_source(source)
+                        self._record_source(source, "failed", None, error=str(e))
+
+    def _record_source(self, source, status, digest, error=None):
+        ids, outputs = self._produced.pop(source, ([], []))
+        if status == "failed" and self.output_format == "store":
+            outputs = []  # the shard was aborted
+        previous = self.manifest.record(source, status, digest, ids, outputs, error)
+        # Outputs the previous version of this source produced but this one did not
+        if status == "done" and previous is not None:
+            for name in set(previous["outputs"]) - set(outputs):
+                self.writer.remove(name)
+
+    # --- Stage 2: workers ----------------------------------------------------
+
+    def _source_progress(self, source, finished=0, read_total=None, failed=False, digest=None):
+        state = self._sources.setdefault(source, [0, 0, False, False, None])
+        state[1] += finished
+        state[3] = state[3] or failed
+        if read_total is not None:
+            state[0] = read_total
+            state[2] = True
+            state[4] = digest
+        if state[2] and state[1] == state[0]:
+            del self._sources[source]
+            kind = "source_failed" if state[3] else "source_done"
+            self.write_queue.put((kind, source, None, state[4]))
+
+    def _handle_result(self, future, source):
+        failed = False
+        try:
+            clean_id, payload, metadata = future.result()
+        except Exception as e:
+            # Redo the whole source on the next run
+            self.errors.append(f"Error in {source}: {e}")
+            failed = True
+        else:
+            if payload is None:
+                self.skipped += 1
+            else:
+                self.write_queue.put(("scenario", source, clean_id, (payload, metadata)))
+                self.converted += 1
+        self._source_progress(source, finished=1, failed=failed)
+
+    def run(self, files):
+        # Skip sources the manifest says are already converted and unchanged
+        todo = [f for f in files if self.force or self.manifest.needs_conversion(f)]
+        self.up_to_date = len(files) - len(todo)
+        files = todo
+
+        reader = threading.Thread(target=self._read, args=(files,), daemon=True)
+        writer = threading.Thread(target=self._write, daemon=True)
+        reader.start()
+        writer.start()
+
+        progress = tqdm(unit="scn", desc="Converting")
+        in_flight = {}
+        reading = True
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.stages,)) as executor:
+            while reading or in_flight:
+                # Keep the pool fed, but never more than queue_size tasks in flight
+                while reading and len(in_flight) < self.queue_size:
+                    try:
+                        item = self.read_queue.get(timeout=0.05 if in_flight else None)
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        reading = False
+                    elif item[0] == "end":
+                        self._source_progress(item[1], read_total=item[2], digest=item[3])
+                    elif item[0] == "error":
+                        # A truncated tfrecord must not produce a partial shard
+                        self.errors.append(item[2])
+                        self._source_progress(item[1], failed=True)
+                    else:
+                        _, source, index, raw = item
+                        future = executor.submit(_convert_record, raw, source, index)
+                        in_flight[future] = source
+
+                if not in_flight:
+                    continue
+                # Out-of-order completion: handle whatever finished first
+                done, _ = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._handle_result(future, in_flight.pop(future))
+                    progress.update(1)
+
+        self.write_queue.put(_END)
+        writer.join()
+        progress.close()
+        self.manifest.compact()
+        return self.converted
+
+
+def run_pipeline(files, output_dir, output_format="pkl", workers=4, queue_size=None, force=False, stages=None):
+    pipeline = ConversionPipeline(output_dir, output_format, workers, queue_size, force=force, stages=stages)
+    pipeline.run(files)
+    return pipeline
@@ -0,0 +1,227 @@
+"""
+Pluggable stages of the scenario converter.
+
+    decode     raw scenario record (bytes) -> MetaDrive scenario dict, or None
+    filter     scenario -> bool; a scenario failing any filter is skipped
+    transform  scenario -> scenario
+    encode     scenario -> payload for the writer
+    write      payload -> disk (PickleWriter / StoreWriter, in the writer thread)
+
+Decode, filter, transform and encode run in the worker processes, so they must
+be picklable: module-level functions or functools.partial of them. Stages
+bundles one choice of each and is what the pipeline ships to its workers.
+"""
+
+import glob
+import os
+import pickle
+import shutil
+from functools import partial
+
+import numpy as np
+
+from src.compact import dumps_compact
+from src.conversion import clean_scenario_id, convert_scenario_dict, convert_scenario_proto
+from src.dataset_index import scenario_metadata, sidecar_path, write_sidecar
+from src.manifest import atomic_write
+from src.map_geometry import MAP_KEY, add_map_geometry
+from src.scenario_store import ScenarioShardWriter
+
+
+# --- Decode -------------------------------------------------------------------------
+
+def _parse(raw):
+    from scenarionet.converter.waymo.waymo_protos import scenario_pb2
+
+    scenario = scenario_pb2.Scenario()
+    scenario.ParseFromString(raw)
+    return scenario
+
+
+def decode_proto(raw, source, index):
+    """Fast path: protobuf repeated fields straight into NumPy arrays."""
+    scenario = _parse(raw)
+    clean_id = clean_scenario_id(scenario.scenario_id, os.path.basename(source), index)
+    return convert_scenario_proto(scenario, clean_id)
+
+
+def decode_dict(raw, source, index):
+    """MessageToDict + per-state loops. Slower, kept as a reference for checking the fast path."""
+    from google.protobuf.json_format import MessageToDict
+
+    scenario = _parse(raw)
+    clean_id = clean_scenario_id(scenario.scenario_id, os.path.basename(source), index)
+    scenario_dict = MessageToDict(scenario, preserving_proto_field_name=True, use_integers_for_enums=True)
+    return convert_scenario_dict(scenario_dict, clean_id)
+
+
+DECODERS = {"proto": decode_proto, "dict": decode_dict}
+
+
+# --- Filter -------------------------------------------------------------------------
+
+def min_sdc_valid_steps(scenario, steps):
+    """The SDC is logged (valid) for at least 'steps' steps."""
+    sdc = scenario["tracks"][scenario["metadata"]["sdc_id"]]
+    return int(np.count_nonzero(sdc["state"]["valid"])) >= steps
+
+
+def scenario_ids(scenario, ids):
+    """Only the scenarios in 'ids' (a set), e.g. to reconvert a subset."""
+    return scenario["id"] in ids
+
+
+# --- Transform ----------------------------------------------------------------------
+
+def crop_map(scenario, radius):
+    """Drops map features with no point within 'radius' m of the SDC's logged path."""
+    sdc = scenario["tracks"][scenario["metadata"]["sdc_id"]]["state"]
+    path = np.asarray(sdc["position"])[np.asarray(sdc["valid"]).astype(bool), :2]
+    if not len(path):
+        return scenario
+    low, high = path.min(axis=0) - radius, path.max(axis=0) + radius
+
+    kept = {}
+    for f_id, feature in scenario["map_features"].items():
+        points = feature.get("polyline", feature.get("polygon"))
+        points = np.asarray(points)[:, :2]
+        # Bounding box test first, exact distance only for the survivors
+        inside = ((points >= low) & (points <= high)).all(axis=1)
+        if not inside.any():
+            continue
+        d2 = ((points[inside, None, :] - path[None, ::5, :]) ** 2).sum(axis=2)
+        if d2.min() <= radius * radius:
+            kept[f_id] = feature
+    scenario["map_features"] = kept
+    # The geometry table was derived from the full map
+    scenario["metadata"].pop(MAP_KEY, None)
+    return add_map_geometry(scenario)
+
+
+# --- Encode -------------------------------------------------------------------------
+
+def encode_pickle(scenario):
+    # Serialized in the worker so the writer only moves bytes
+    return pickle.dumps(scenario, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def encode_compact(scenario, **options):
+    """Simplified / quantized / compressed .pkl (see src.compact), same reader."""
+    return dumps_compact(scenario, **options)
+
+
+def encode_store(scenario):
+    # The store writer packs the arrays itself
+    return scenario
+
+
+ENCODERS = {"pkl": encode_pickle, "compact": encode_compact, "store": encode_store}
+
+
+# --- Write --------------------------------------------------------------------------
+
+class PickleWriter:
+    """One sd_waymo_<id>.pkl per scenario."""
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        # Leftovers of a crashed run: scenario pickles and their metadata sidecars
+        for pattern in ("*.pkl.*.tmp", "*.meta.json.*.tmp"):
+            for tmp_path in glob.glob(os.path.join(output_dir, pattern)):
+                os.remove(tmp_path)
+
+    def write(self, source, clean_id, payload, metadata):
+        """Writes one scenario, returns the output name."""
+        name = f"sd_waymo_{clean_id}.pkl"
+        path = os.path.join(self.output_dir, name)
+        # Sidecar first: a .pkl never exists without its metadata
+        write_sidecar(path, metadata)
+        atomic_write(path, payload)
+        return name
+
+    def remove(self, name):
+        path = os.path.join(self.output_dir, name)
+        for stale in (path, sidecar_path(path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    def finish_source(self, source):
+        pass
+
+    def abort_source(self, source):
+        pass
+
+    def close(self):
+        pass
+
+
+class StoreWriter:
+    """One scenario store shard per source tfrecord."""
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._shards = {}
+
+    def write(self, source, clean_id, payload, metadata):
+        """Writes one scenario, returns the output name."""
+        name = os.path.basename(source)
+        shard = self._shards.get(source)
+        if shard is None:
+            shard = self._shards[source] = ScenarioShardWriter(self.output_dir, name)
+        shard.add(payload, summary=metadata)
+        return name
+
+    def remove(self, name):
+        shutil.rmtree(os.path.join(self.output_dir, name), ignore_errors=True)
+
+    def finish_source(self, source):
+        shard = self._shards.pop(source, None)
+        if shard is not None:
+            shard.close()
+
+    def abort_source(self, source):
+        shard = self._shards.pop(source, None)
+        if shard is not None:
+            shard.abort()
+
+    def close(self):
+        # Sources that never finished (errors) must not leave partial shards
+        for shard in self._shards.values():
+            shard.abort()
+        self._shards.clear()
+
+
+WRITERS = {"pkl": PickleWriter, "compact": PickleWriter, "store": StoreWriter}
+
+
+# --- All together -------------------------------------------------------------------
+
+class Stages:
+    """One decoder, any number of filters and transforms (applied in order), one encoder."""
+    def __init__(self, decode=decode_proto, filters=(), transforms=(), encode=encode_pickle):
+        self.decode = decode
+        self.filters = list(filters)
+        self.transforms = list(transforms)
+        self.encode = encode
+
+    @classmethod
+    def for_format(cls, output_format, encode_options=None, **kwargs):
+        encode = ENCODERS[output_format]
+        if encode_options:
+            encode = partial(encode, **encode_options)
+        return cls(encode=encode, **kwargs)
+
+    def convert(self, raw, source, index):
+        """
+        Runs one record through decode -> filters -> transforms -> encode.
+
+        Returns (clean_id, payload, metadata); payload is None for skipped
+        scenarios (no SDC track, or rejected by a filter). metadata is the
+        sidecar record (see src.dataset_index).
+        """
+        scenario = self.decode(raw, source, index)
+        if scenario is None:
+            return None, None, None
+        if not all(keep(scenario) for keep in self.filters):
+            return scenario["id"], None, None
+        for transform in self.transforms:
+            scenario = transform(scenario)
+        return scenario["id"], self.encode(scenario), scenario_metadata(scenario)
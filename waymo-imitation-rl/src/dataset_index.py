@@ -0,0 +1,324 @@
+"""
+Per-scenario metadata sidecars and the dataset summary built from them.
+
+The converter writes 'sd_waymo_<id>.meta.json' next to every scenario pickle
+(and the same record into store shard indices). Building dataset_summary.pkl
+then only reads those small JSON files, in parallel, instead of unpickling
+every scenario.
+
+The scenario index (build_index / ScenarioIndex) goes one step further for
+training: a directory of flat .npy arrays mapping scenario id -> file (or store
+shard + row) plus the numeric metadata. Workers memory-map it instead of
+globbing and sorting the data directory, so opening it costs the same for ten
+scenarios or a million.
+"""
+
+import json
+import os
+import glob
+import hashlib
+import pickle
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.manifest import atomic_write
+from src.scenario_store import ScenarioShard, ScenarioStore, shard_dir
+
+SUMMARY_FILE = "dataset_summary.pkl"
+SIDECAR_SUFFIX = ".meta.json"
+INDEX_DIR = "scenario_index"
+INDEX_META_FILE = "meta.json"
+
+# Metadata fields kept as numeric columns of the scenario index
+INDEX_COLUMNS = {
+    "length": np.int32,
+    "num_tracks": np.int32,
+    "num_map_features": np.int32,
+    "sdc_path_length": np.float32,
+    "sdc_heading_change": np.float32,
+}
+
+
+def scenario_metadata(scenario):
+    """Cheap per-scenario statistics: ids, length, agent / map-feature counts, SDC path."""
+    tracks = scenario["tracks"]
+    sdc_id = scenario["metadata"]["sdc_id"]
+
+    path_length = 0.0
+    heading_change = 0.0
+    sdc = tracks.get(sdc_id)
+    if sdc is not None:
+        state = sdc["state"]
+        valid = np.asarray(state["valid"]).astype(bool)
+        positions = np.asarray(state["position"])[valid, :2]
+        if len(positions) > 1:
+            path_length = float(np.linalg.norm(np.diff(positions, axis=0), axis=1).sum())
+        headings = np.asarray(state["heading"])[valid]
+        if len(headings) > 1:
+            turns = (np.diff(headings) + np.pi) % (2 * np.pi) - np.pi
+            heading_change = float(np.abs(turns).sum())
+
+    return {
+        "id": scenario["id"],
+        "sdc_id": sdc_id,
+        "length": int(scenario["length"]),
+        "num_tracks": len(tracks),
+        "track_types": dict(Counter(str(t["type"]) for t in tracks.values())),
+        "num_map_features": len(scenario["map_features"]),
+        "map_feature_types": dict(Counter(str(f.get("type")) for f in scenario["map_features"].values())),
+        "sdc_path_length": path_length,
+        "sdc_heading_change": heading_change,
+    }
+
+
+def sidecar_path(pkl_path):
+    return pkl_path[:-len(".pkl")] + SIDECAR_SUFFIX
+
+
+def write_sidecar(pkl_path, metadata):
+    atomic_write(sidecar_path(pkl_path), json.dumps(metadata).encode())
+
+
+def read_metadata(pkl_path):
+    """
+    Returns the metadata of one scenario file, from its sidecar if present.
+    Files converted before sidecars existed fall back to a full unpickle.
+    """
+    try:
+        with open(sidecar_path(pkl_path), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        with open(pkl_path, "rb") as f:
+            return scenario_metadata(pickle.load(f))
+
+
+def _read_entry(pkl_path):
+    try:
+        return os.path.basename(pkl_path), read_metadata(pkl_path), None
+    except Exception as e:
+        return os.path.basename(pkl_path), None, f"Error reading {pkl_path}: {e}"
+
+
+def list_scenario_files(data_dir):
+    files = glob.glob(os.path.join(data_dir, "*.pkl"))
+    # Exclude the summary itself if it exists
+    files = [f for f in files if "dataset_summary" not in f]
+    files.sort()
+    return files
+
+
+def load_summary(data_dir):
+    path = os.path.join(data_dir, SUMMARY_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def build_summary(data_dir, workers=None, incremental=False, chunksize=256):
+    """
+    Builds (or, with incremental=True, updates) dataset_summary.pkl in 'data_dir'.
+
+    Returns (summary, number of newly read files, errors).
+    """
+    files = list_scenario_files(data_dir)
+    if not files:
+        return {}, 0, []
+    present = {os.path.basename(f) for f in files}
+
+    summary = {}
+    summary_path = os.path.join(data_dir, SUMMARY_FILE)
+    if incremental and os.path.exists(summary_path):
+        # Keep entries whose files still exist; read new files and files rewritten since.
+        # Entries without "metadata" (summaries from before sidecars) are re-read too.
+        built_at = os.path.getmtime(summary_path)
+        summary = {s_id: e for s_id, e in load_summary(data_dir).items()
+                   if e.get("filename") in present and "metadata" in e}
+        known = {e["filename"] for e in summary.values()}
+        files = [f for f in files if os.path.basename(f) not in known or os.path.getmtime(f) > built_at]
+        rewritten = {os.path.basename(f) for f in files}
+        summary = {s_id: e for s_id, e in summary.items() if e["filename"] not in rewritten}
+
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for filename, meta, error in executor.map(_read_entry, files, chunksize=chunksize):
+            if error is not None:
+                errors.append(error)
+                continue
+            s_id = meta.get("id")
+            if s_id:
+                summary[s_id] = {
+                    "id": s_id,
+                    # Map the ID to the local .pkl filename, not the original tfrecord
+                    "filename": filename,
+                    "length": meta.get("length", 0),
+                    "object_summary": {},
+                    "metadata": meta,
+                }
+
+    atomic_write(summary_path, pickle.dumps(summary, protocol=pickle.HIGHEST_PROTOCOL))
+    return summary, len(files), errors
+
+
+# --- Scenario index -----------------------------------------------------------
+
+def default_index_dir(data_dir):
+    return os.path.join(data_dir, INDEX_DIR)
+
+
+def id_hash(scenario_id):
+    digest = hashlib.blake2b(str(scenario_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _pack_strings(strings):
+    encoded = [s.encode() for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _index_entries(data_dir, workers):
+    """(kind, [(id, path, row, metadata)]) for a .pkl directory or a scenario store."""
+    if ScenarioStore.is_store(data_dir):
+        store = ScenarioStore(data_dir)
+        entries = []
+        for i in range(len(store)):
+            shard, row = store.location(i)
+            record = store.record(i)
+            entries.append((record["id"], shard, row, record.get("summary") or {}))
+        return "store", entries
+
+    # Sidecars make this cheap; the summary is refreshed on the way
+    summary, _, errors = build_summary(data_dir, workers, incremental=True)
+    for error in errors:
+        print(f"⚠️ {error}")
+    entries = [(e["id"], e["filename"], -1, e["metadata"]) for e in summary.values()]
+    # Same order as the sorted glob the env used before
+    entries.sort(key=lambda e: e[1])
+    return "pkl", entries
+
+
+def build_index(data_dir, index_dir=None, workers=None):
+    """
+    Writes the scenario index of 'data_dir' (a .pkl directory or a scenario
+    store) to 'index_dir' (default: <data_dir>/scenario_index). Returns the
+    number of indexed scenarios.
+    """
+    data_dir = os.path.abspath(data_dir)
+    index_dir = index_dir or default_index_dir(data_dir)
+    old_dir = index_dir + ".old"
+    if not os.path.exists(index_dir) and os.path.exists(old_dir):
+        # A previous build crashed between its two renames: put the old index back
+        os.replace(old_dir, index_dir)
+    kind, entries = _index_entries(data_dir, workers)
+    if not entries:
+        return 0
+
+    ids = [str(e[0]) for e in entries]
+    arrays = {}
+    arrays["id_bytes"], arrays["id_offsets"] = _pack_strings(ids)
+    arrays["path_bytes"], arrays["path_offsets"] = _pack_strings([e[1] for e in entries])
+    arrays["rows"] = np.array([e[2] for e in entries], dtype=np.int64)
+    # Sorted id hashes for O(log n) lookups by id
+    hashes = np.array([id_hash(s_id) for s_id in ids], dtype=np.uint64)
+    arrays["id_order"] = np.argsort(hashes, kind="stable").astype(np.int64)
+    arrays["id_hashes"] = hashes[arrays["id_order"]]
+    for key, dtype in INDEX_COLUMNS.items():
+        arrays[key] = np.array([e[3].get(key, 0) for e in entries], dtype=dtype)
+
+    # Build next to the target and swap it in, so a running job never sees half an index
+    tmp_dir = f"{index_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, name + ".npy"), array)
+    meta = {"kind": kind, "root": data_dir, "count": len(entries)}
+    with open(os.path.join(tmp_dir, INDEX_META_FILE), "w") as f:
+        json.dump(meta, f)
+
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(entries)
+
+
+class ScenarioIndex:
+    """
+    Read-only, memory-mapped scenario index (see build_index).
+
+    Opening it reads one small JSON file and maps the arrays; nothing scales
+    with the number of scenarios until an entry is actually used.
+    """
+    def __init__(self, index_dir):
+        self.index_dir = os.path.abspath(index_dir)
+        if not os.path.exists(self.index_dir) and os.path.exists(self.index_dir + ".old"):
+            # Mid-swap (or crashed) build_index: the previous index is still complete.
+            # Read it in place; renaming it back is left to the next build_index.
+            self.index_dir += ".old"
+        meta_path = os.path.join(self.index_dir, INDEX_META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No scenario index found in {self.index_dir} (run scripts/build_index.py)")
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        self.kind = meta["kind"]
+        self.root = meta["root"]
+        self._count = meta["count"]
+        self._arrays = {}
+        self._shards = {}
+
+    def _array(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = np.load(os.path.join(self.index_dir, name + ".npy"), mmap_mode="r")
+            self._arrays[name] = array
+        return array
+
+    @staticmethod
+    def _string(data, offsets, i):
+        return bytes(data[offsets[i]:offsets[i + 1]]).decode()
+
+    def __len__(self):
+        return self._count
+
+    def scenario_id(self, index):
+        return self._string(self._array("id_bytes"), self._array("id_offsets"), index)
+
+    def location(self, index):
+        """(path relative to root, row). row is -1 for a .pkl file, else the row in that store shard."""
+        path = self._string(self._array("path_bytes"), self._array("path_offsets"), index)
+        return path, int(self._array("rows")[index])
+
+    def path(self, index):
+        return os.path.join(self.root, self.location(index)[0])
+
+    def load(self, index):
+        """Loads scenario 'index'. Store shards are opened on first use."""
+        path, row = self.location(index)
+        if row < 0:
+            with open(os.path.join(self.root, path), "rb") as f:
+                return pickle.load(f)
+        shard = self._shards.get(path)
+        if shard is None:
+            shard = self._shards[path] = ScenarioShard(shard_dir(self.root, path))
+        return shard[row]
+
+    def index_of(self, scenario_id):
+        hashes = self._array("id_hashes")
+        h = np.uint64(id_hash(scenario_id))
+        pos = int(np.searchsorted(hashes, h))
+        while pos < len(hashes) and hashes[pos] == h:
+            index = int(self._array("id_order")[pos])
+            if self.scenario_id(index) == str(scenario_id):
+                return index
+            pos += 1
+        raise KeyError(scenario_id)
+
+    def column(self, name):
+        """Numeric metadata column (one of INDEX_COLUMNS) for all scenarios."""
+        if name not in INDEX_COLUMNS:
+            raise KeyError(name)
+        return self._array(name)
@@ -3,49 +3,270 @@ import numpy as np
 import os
 import glob
 import pickle
+from collections import OrderedDict, deque
 from metadrive.envs.scenario_env import ScenarioEnv
-from src.utils import get_expert_action
+from src.expert import expert_action_at, expert_table
+from src.scenario_store import ScenarioStore
+from src.dataset_index import ScenarioIndex
+from src.samplers import make_sampler
+from src.observations import OBSERVATION_DIM, ScenarioFeatures, observation_space
+from src.metrics import trajectory_metrics
+from src.prefetch import ScenarioPrefetcher
+from src.scenario_cache import SharedScenarioCache
+from src.map_manager import CachedScenarioMapManager
+from src.profiling import SamplingProfiler, timers
+
+class CachedMapScenarioEnv(ScenarioEnv):
+    """ScenarioEnv whose map manager keeps the maps of recent scenarios (see src.map_manager)."""
+    def __init__(self, config, map_cache_size):
+        self.map_cache_size = map_cache_size
+        super().__init__(config)
+
+    def setup_engine(self):
+        super().setup_engine()
+        self.engine.update_manager("map_manager", CachedScenarioMapManager(self.map_cache_size))
+
 
 class DirectWaymoEnv(gym.Wrapper):
     def __init__(self, config):
-        data_dir = config.get("data_directory")
-        
-        # 1. Scan files ourselves
-        self.scenario_files = glob.glob(os.path.join(data_dir, "*.pkl"))
-        self.scenario_files = [f for f in self.scenario_files if "dataset_summary" not in f]
-        self.scenario_files.sort()
-        
-        if len(self.scenario_files) == 0:
-            raise FileNotFoundError(f"No .pkl files found in {data_dir}")
+        # Wrapper-only keys must not reach MetaDrive's strict config
+        md_config = config.copy()
+        data_dir = md_config.get("data_directory")
+        store_dir = md_config.pop("scenario_store", None)
+        # Prebuilt index (scripts/build_index.py): no directory scan at startup
+        index_dir = md_config.pop("scenario_index", None)
+        # Scenarios decoded ahead of time on a background thread (0 = load inside reset)
+        self.prefetch_depth = md_config.pop("prefetch_depth", 2)
+        self.prefetcher = None
+        # Optional LRU cache in shared memory, reused by every worker (see SharedScenarioCache)
+        cache_dir = md_config.pop("scenario_cache", None)
+        self.scenario_cache = SharedScenarioCache(cache_dir) if cache_dir else None
+        # "uniform", "difficulty", "prioritized" or {"type": ..., **kwargs} (see src.samplers)
+        sampler_spec = md_config.pop("scenario_sampler", "uniform")
+        self._current_index = None
+        # (index, scenario_data, file_name) of the current episode; resetting onto the same
+        # scenario again (e.g. evaluating several checkpoints on it) skips the reload
+        self._current = None
+        # "lidar" = MetaDrive's observation, "log" = src.observations features (what offline BC trains on)
+        self.obs_mode = md_config.pop("obs_mode", "lidar")
+        if self.obs_mode == "log":
+            # MetaDrive's own observation is discarded: don't cast lidar rays for it every step
+            vehicle_config = dict(md_config.get("vehicle_config", {}))
+            vehicle_config["lidar"] = dict(vehicle_config.get("lidar", {}), num_lasers=0, num_others=0)
+            md_config["vehicle_config"] = vehicle_config
+        # Preallocated row the log observation is built in
+        self._obs_buffer = np.zeros((1, OBSERVATION_DIM), dtype=np.float32)
+        self._features = None
+        self._expert = None
+        # Expert tables / log features of the last few scenarios, reused when one comes up again
+        self.features_cache_size = md_config.pop("features_cache_size", 16)
+        self._features_cache = OrderedDict()
+        # Built MetaDrive maps of the last few scenarios, re-attached instead of rebuilt (0 = off)
+        self.map_cache_size = md_config.pop("map_cache_size", 8)
+        # Finished episodes kept for trajectory_metrics() (ego poses vs. the log, see src.metrics); 0 = off
+        self.metrics_episodes = md_config.pop("trajectory_metrics", 0)
+        self._finished = deque(maxlen=max(self.metrics_episodes, 1))
+        self._trajectory = None
+        # Directory for a sampling-profiler dump of this worker, written on close (None = off)
+        self.profile_dump = md_config.pop("profile_dump", None)
+        self.profiler = SamplingProfiler().start() if self.profile_dump else None
+
+        # 1. Open the index (or the memory-mapped store, or scan files ourselves)
+        self.scenario_index = None
+        self.scenario_store = None
+        self.scenario_files = []
+        if index_dir:
+            self.scenario_index = ScenarioIndex(index_dir)
+            if len(self.scenario_index) == 0:
+                raise FileNotFoundError(f"Scenario index {index_dir} is empty")
+        elif store_dir:
+            self.scenario_store = ScenarioStore(store_dir)
+        else:
+            self.scenario_files = glob.glob(os.path.join(data_dir, "*.pkl"))
+            self.scenario_files = [f for f in self.scenario_files if "dataset_summary" not in f]
+            self.scenario_files.sort()
+
+            if len(self.scenario_files) == 0:
+                raise FileNotFoundError(f"No .pkl files found in {data_dir}")
+
+        self.sampler = make_sampler(sampler_spec, self.num_scenarios, self.scenario_index)
 
         # 2. Config for MetaDrive
         # We tell MetaDrive to look at the dir, so it finds the summary file we just made
-        md_config = config.copy()
         # IMPORTANT: Set num_scenarios to 1 so it doesn't try to load files that aren't in the summary
         md_config["num_scenarios"] = 1 
         
-        env = ScenarioEnv(md_config)
+        if self.map_cache_size > 0:
+            env = CachedMapScenarioEnv(md_config, self.map_cache_size)
+        else:
+            env = ScenarioEnv(md_config)
         super().__init__(env)
+        if self.obs_mode == "log":
+            self.observation_space = observation_space()
+
+    @property
+    def num_scenarios(self):
+        if self.scenario_index is not None:
+            return len(self.scenario_index)
+        if self.scenario_store is not None:
+            return len(self.scenario_store)
+        return len(self.scenario_files)
+
+    @timers.timed("env/load_scenario")
+    def _load_scenario(self, index):
+        """Returns (scenario_data, file_name) for scenario 'index'."""
+        if self.scenario_store is not None:
+            # Arrays are views into the shared memory map, nothing is copied
+            return self.scenario_store[index], self.scenario_store.scenario_name(index)
+
+        if self.scenario_index is not None:
+            path, row = self.scenario_index.location(index)
+            if row >= 0:
+                # Only the shards this worker actually samples from are opened
+                return self.scenario_index.load(index), f"{path}/{self.scenario_index.scenario_id(index)}"
+            file_path = os.path.join(self.scenario_index.root, path)
+        else:
+            file_path = self.scenario_files[index]
+        if self.scenario_cache is not None:
+            # Decoded by some worker already: zero-copy views onto the shared pages
+            scenario_data = self.scenario_cache.get(file_path)
+            if scenario_data is not None:
+                return scenario_data, os.path.basename(file_path)
+
+        with open(file_path, "rb") as f:
+            scenario_data = pickle.load(f)
+        if self.scenario_cache is not None:
+            self.scenario_cache.put(file_path, scenario_data)
+        return scenario_data, os.path.basename(file_path)
+
+    def _scenario_features(self, index, scenario_data):
+        """(expert table, log features) of scenario 'index', built once per scenario and cached."""
+        cached = self._features_cache.get(index)
+        if cached is not None:
+            self._features_cache.move_to_end(index)
+            return cached
+        features = ScenarioFeatures(scenario_data) if self.obs_mode == "log" or self.metrics_episodes else None
+        cached = (expert_table(scenario_data), features)
+        if self.features_cache_size > 0:
+            self._features_cache[index] = cached
+            if len(self._features_cache) > self.features_cache_size:
+                self._features_cache.popitem(last=False)
+        return cached
+
+    def _start_prefetcher(self):
+        # Own RNG: np_random belongs to the env thread
+        rng = np.random.default_rng(self.env.np_random.integers(2**63))
+        self.prefetcher = ScenarioPrefetcher(
+            self._load_scenario,
+            lambda: self.sampler.sample(rng),
+            depth=self.prefetch_depth,
+        )
+
+    def prefetch_stats(self):
+        return self.prefetcher.stats() if self.prefetcher is not None else {}
+
+    def sampler_stats(self):
+        return self.sampler.stats()
+
+    @property
+    def current_scenario(self):
+        """The scenario dict of the current episode (None before the first reset)."""
+        return self._current[1] if self._current is not None else None
+
+    def trajectory_metrics(self, include_current=False):
+        """
+        Metrics of the episodes finished since the previous call, computed in one
+        batch ({name: list}, see src.metrics). Needs config["trajectory_metrics"] > 0.
+        include_current also scores (and closes) the episode still running.
+        """
+        episodes, self._finished = list(self._finished), deque(maxlen=self._finished.maxlen)
+        if include_current and self._trajectory is not None and self._trajectory[1]:
+            episodes.append(self._trajectory)
+            self._trajectory = None
+        if not episodes:
+            return {}
+        T = max(len(e[1]) for e in episodes)
+        positions = np.zeros((len(episodes), T, 2))
+        headings = np.zeros((len(episodes), T))
+        steps = np.zeros((len(episodes), T), dtype=np.int64)
+        for i, (_, pos, head, step) in enumerate(episodes):
+            positions[i, :len(pos)], headings[i, :len(pos)], steps[i, :len(pos)] = pos, head, step
+        metrics = trajectory_metrics(positions, headings, [e[0] for e in episodes],
+                                     lengths=np.array([len(e[1]) for e in episodes]), steps=steps)
+        return {name: values.tolist() for name, values in metrics.items()}
+
+    def cache_stats(self):
+        return self.scenario_cache.stats() if self.scenario_cache is not None else {}
+
+    def map_cache_stats(self):
+        engine = self.env.engine
+        if self.map_cache_size <= 0 or engine is None:
+            return {}
+        return engine.map_manager.stats()
+
+    def timing_stats(self):
+        """This worker's timers since the previous call (see src.profiling)."""
+        return timers.snapshot()
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            path = self.profiler.dump(os.path.join(self.profile_dump, f"worker_{os.getpid()}.folded"))
+            print(f"🔬 Profile written to {path}")
+            self.profiler = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        if self.scenario_cache is not None:
+            self.scenario_cache.close()
+        return super().close()
         
+    @timers.timed("env/step")
     def step(self, action):
-        obs, reward, terminated, truncated, info = self.env.step(action)
-        
-        try:
-            if self.env.engine and self.env.engine.map_manager:
-                expert_traj = self.env.engine.map_manager.current_sdc_route
-                if expert_traj is not None and len(expert_traj) > 0:
-                    target_pos = expert_traj[-1] 
-                    expert_action = get_expert_action(self.env.vehicle, target_pos)
-                else:
-                    expert_action = np.zeros(2)
-                info['expert_action'] = expert_action
+        # Physics and MetaDrive's own observation (lidar) together
+        with timers.time("env/metadrive_step"):
+            obs, reward, terminated, truncated, info = self.env.step(action)
+
+        # Lookahead point from the precomputed table + correction for the vehicle's pose
+        with timers.time("env/expert"):
+            if self._expert is not None:
+                vehicle = self.env.vehicle
+                info['expert_action'] = expert_action_at(
+                    self._expert, self.env.engine.episode_step, vehicle.position, vehicle.heading_theta
+                )
             else:
-                info['expert_action'] = np.zeros(2)
-        except Exception:
-            info['expert_action'] = np.zeros(2)
+                info['expert_action'] = np.zeros(2, dtype=np.float32)
+
+        if self._trajectory is not None:
+            vehicle = self.env.vehicle
+            self._trajectory[1].append(vehicle.position[:2])
+            self._trajectory[2].append(vehicle.heading_theta)
+            self._trajectory[3].append(self.env.engine.episode_step)
 
-        return obs, reward, terminated, truncated, info
+        if terminated or truncated:
+            if self._current_index is not None:
+                # Episode outcome feeds the (prioritized) sampler
+                self.sampler.update(self._current_index, info)
+            if self._trajectory is not None and self._trajectory[1]:
+                self._finished.append(self._trajectory)
+                self._trajectory = None
 
+        return self._observation(obs), reward, terminated, truncated, info
+
+    def _observation(self, obs):
+        if self.obs_mode != "log":
+            return obs
+        if self._features is None:
+            return np.zeros(self.observation_space.shape, dtype=np.float32)
+        vehicle = self.env.vehicle
+        step = self.env.engine.episode_step
+        with timers.time("env/log_observation"):
+            self._features.observations(
+                [step], [vehicle.position], [vehicle.heading_theta], [vehicle.velocity], out=self._obs_buffer
+            )
+        # Callers may keep the observation; the buffer is reused next step
+        return self._obs_buffer[0].copy()
+
+    @timers.timed("env/reset")
     def reset(self, *, seed=None, options=None):
         # 1. Ensure Engine is Ready
         if self.env.engine is None:
@@ -54,27 +275,50 @@ class DirectWaymoEnv(gym.Wrapper):
             self.env.lazy_init()
 
         # 2. Select our target file
-        if seed is None:
-            seed = self.env.np_random.integers(0, len(self.scenario_files))
+        # Random picks come from the prefetcher; an explicit seed loads that file directly
+        scenario_data, load_error = None, None
+        if seed is None and self.prefetch_depth > 0:
+            if self.prefetcher is None:
+                self._start_prefetcher()
+            with timers.time("env/prefetch_wait"):
+                seed, scenario_data, file_name, load_error = self.prefetcher.get()
+        elif seed is None:
+            seed = self.sampler.sample(self.env.np_random)
         
-        file_index = seed % len(self.scenario_files)
-        file_path = self.scenario_files[file_index]
+        file_index = seed % self.num_scenarios
+        self._current_index = file_index
 
         # 3. Manual Load & Inject
+        self._features = None
+        self._expert = None
+        previous, self._current = self._current, None
         try:
-            with open(file_path, "rb") as f:
-                scenario_data = pickle.load(f)
+            if load_error is not None:
+                raise load_error
+            if scenario_data is None and previous is not None and previous[0] == file_index:
+                _, scenario_data, file_name = previous
+            if scenario_data is None:
+                scenario_data, file_name = self._load_scenario(file_index)
+            self._current = (file_index, scenario_data, file_name)
                 
             # --- THE STEALTH SWAP ---
             # We overwrite the data manager's internal state just before reset
             self.env.engine.data_manager.current_scenario_data = scenario_data
-            self.env.engine.data_manager.current_scenario_file_name = os.path.basename(file_path)
+            self.env.engine.data_manager.current_scenario_file_name = file_name
             # We also trick the manager into thinking it "randomly selected" this file
             # by setting internal indices if necessary, but injecting data is usually enough.
-            
+            with timers.time("env/scenario_features"):
+                self._expert, self._features = self._scenario_features(file_index, scenario_data)
+
         except Exception as e:
-            print(f"❌ Read Error {file_path}: {e}")
+            print(f"❌ Read Error {file_index}: {e}")
         
         # 4. Reset
         # MetaDrive sees 'current_scenario_data' is populated and uses it
-        return self.env.reset(seed=seed)
\ No newline at end of file
+        with timers.time("env/metadrive_reset"):
+            obs, info = self.env.reset(seed=seed)
+        # (log features, positions, headings, log steps) of the ego along this episode
+        self._trajectory = None
+        if self.metrics_episodes and self._features is not None:
+            self._trajectory = (self._features, [], [], [])
+        return self._observation(obs), info
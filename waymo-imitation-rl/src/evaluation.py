@@ -0,0 +1,199 @@
+"""
+Headless batch evaluation of checkpoints.
+
+Every (checkpoint x scenario) pair is one deterministic episode. Jobs are
+grouped by scenario: a worker process takes a scenario and plays it once per
+checkpoint, back to back, so the scenario is decoded once and MetaDrive keeps
+its map (consecutive resets on the same seed reuse the stored map). The parent
+holds all the policies and, at every step, runs one batched
+predict(deterministic=True) per checkpoint over all workers currently on it.
+
+Per episode: route completion, collision, off-road and arrival as MetaDrive
+reports them, and the log-based metrics of src.metrics (ADE / FDE against the
+logged SDC track, time-to-collision, lane deviation). The env must be created
+with config["trajectory_metrics"] > 0.
+"""
+
+import multiprocessing as mp
+import os
+import re
+import traceback
+from collections import defaultdict, deque
+
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+from src.dataset_index import id_hash
+
+# MetaDrive reports collisions per object kind
+CRASH_KEYS = ("crash", "crash_vehicle", "crash_object", "crash_building", "crash_human", "crash_sidewalk")
+# Log-based metrics of src.metrics reported per episode
+LOG_METRIC_KEYS = ("ade", "fde", "min_ttc", "lane_deviation", "heading_error")
+SUMMARY_KEYS = ("route_completion", "collision", "off_road", "arrive_dest", "steps") + LOG_METRIC_KEYS
+
+
+def checkpoint_steps(path):
+    """Training steps of an SB3 CheckpointCallback file (bc_ppo_<n>_steps.zip), else -1."""
+    match = re.search(r"_(\d+)_steps", os.path.basename(path))
+    return int(match.group(1)) if match else -1
+
+
+def holdout_scenarios(scenario_index, percent=10, limit=None):
+    """Indices of the scenarios whose id hash falls in the held-out 'percent' (stable across runs)."""
+    held_out = [i for i in range(len(scenario_index))
+                if id_hash(scenario_index.scenario_id(i)) % 100 < percent]
+    return held_out[:limit] if limit else held_out
+
+
+def _episode_result(env, info, length):
+    scenario = env.current_scenario
+    result = {
+        "scenario_id": scenario["id"] if scenario is not None else None,
+        "steps": length,
+        "route_completion": float(info.get("route_completion", float("nan"))),
+        "collision": float(any(info.get(key, False) for key in CRASH_KEYS)),
+        "off_road": float(info.get("out_of_road", False)),
+        "arrive_dest": float(info.get("arrive_dest", False)),
+    }
+    # Against the log: this episode's ego trajectory, scored by src.metrics
+    # (include_current: an episode cut at max_steps has not ended in the env)
+    metrics = env.trajectory_metrics(include_current=True)
+    for key in LOG_METRIC_KEYS:
+        result[key] = float(metrics[key][0]) if metrics else float("nan")
+    return result
+
+
+def _worker(remote, env_fn_wrapper, max_steps):
+    env = env_fn_wrapper.var()
+    steps = 0
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "reset":
+                obs, _ = env.reset(seed=int(data))
+                steps = 0
+                remote.send(("obs", obs))
+            elif cmd == "step":
+                steps += 1
+                obs, _, terminated, truncated, info = env.step(data)
+                if terminated or truncated or steps >= max_steps:
+                    remote.send(("done", _episode_result(env, info, steps)))
+                else:
+                    remote.send(("obs", obs))
+            elif cmd == "close":
+                break
+    except EOFError:
+        pass
+    except Exception:
+        remote.send(("error", traceback.format_exc()))
+    finally:
+        env.close()
+        remote.close()
+
+
+class Evaluator:
+    """
+    Evaluates 'policies' ({name: model with predict()}) on scenario indices with
+    'workers' processes, each running env_fn() (a headless DirectWaymoEnv).
+    """
+    def __init__(self, env_fn, policies, workers=4, max_steps=1000, start_method=None):
+        self.policies = policies
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        self.remotes, self.processes = [], []
+        for _ in range(workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(work_remote, CloudpickleWrapper(env_fn), max_steps), daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def _recv(self, worker):
+        kind, payload = self.remotes[worker].recv()
+        if kind == "error":
+            raise RuntimeError(f"Evaluation worker {worker} crashed:\n{payload}")
+        return kind, payload
+
+    def run(self, scenarios, progress=None):
+        """Returns one result dict per (checkpoint, scenario) episode."""
+        names = list(self.policies)
+        pending = deque(scenarios)
+        # worker -> [scenario, position in 'names', observation]
+        jobs = {}
+        results = []
+
+        def start(workers):
+            # Next checkpoint on the worker's scenario, else its next scenario
+            for worker in workers:
+                job = jobs.get(worker)
+                if job is not None and job[1] + 1 < len(names):
+                    job[1] += 1
+                elif pending:
+                    job = jobs[worker] = [pending.popleft(), 0, None]
+                else:
+                    jobs.pop(worker, None)
+                    continue
+                self.remotes[worker].send(("reset", job[0]))
+            for worker in workers:
+                if worker in jobs:
+                    jobs[worker][2] = self._recv(worker)[1]
+
+        start(range(len(self.remotes)))
+        while jobs:
+            # 1. One batched deterministic predict per checkpoint
+            by_policy = defaultdict(list)
+            for worker, (_, position, _) in jobs.items():
+                by_policy[names[position]].append(worker)
+            for name, workers in by_policy.items():
+                obs = np.stack([jobs[w][2] for w in workers])
+                actions, _ = self.policies[name].predict(obs, deterministic=True)
+                for worker, action in zip(workers, actions):
+                    self.remotes[worker].send(("step", action))
+
+            # 2. Step results; finished episodes move on to their next job
+            finished = []
+            for worker in list(jobs):
+                kind, payload = self._recv(worker)
+                if kind == "done":
+                    scenario, position, _ = jobs[worker]
+                    results.append(dict(payload, checkpoint=names[position], scenario=int(scenario)))
+                    finished.append(worker)
+                    if progress is not None:
+                        progress.update(1)
+                else:
+                    jobs[worker][2] = payload
+            if finished:
+                start(finished)
+        return results
+
+    def close(self):
+        for remote in self.remotes:
+            try:
+                remote.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+
+def summarize(results):
+    """
+    {checkpoint: {metric: mean over its episodes, "episodes": n}}; NaNs (e.g. no log
+    overlap) and infinities (min_ttc with nothing in the ego's path) are skipped.
+    """
+    by_checkpoint = defaultdict(list)
+    for result in results:
+        by_checkpoint[result["checkpoint"]].append(result)
+    summary = {}
+    for name, episodes in by_checkpoint.items():
+        row = {"episodes": len(episodes)}
+        for key in SUMMARY_KEYS:
+            values = np.array([e[key] for e in episodes], dtype=np.float64)
+            values[np.isinf(values)] = np.nan
+            row[key] = float(np.nanmean(values)) if np.isfinite(values).any() else float("nan")
+        summary[name] = row
+    return summary
@@ -0,0 +1,113 @@
+"""
+Precomputed expert tables.
+
+The expert steers toward a lookahead point on the logged SDC trajectory,
+LOOKAHEAD_STEPS ahead of the current timestep. Everything that only depends on
+the log is computed once per scenario, vectorized over all timesteps, and stored
+in scenario["metadata"][EXPERT_KEY]:
+
+    lookahead   (T, 2)  lookahead point for every timestep
+    actions     (T, 2)  expert [steering, throttle] at the logged SDC pose
+    final_step  ()      last valid timestep; from there on the expert does not steer
+
+Online, the expert action for the simulated vehicle is a table lookup of the
+lookahead point plus a heading correction for the vehicle's actual pose
+(expert_action_at), a handful of scalar operations per step.
+"""
+
+import math
+
+import numpy as np
+
+from src.utils import get_expert_actions
+
+EXPERT_KEY = "expert_table"
+LOOKAHEAD_STEPS = 10  # 1 s at 10 Hz
+STEERING_GAIN = 1.5
+
+
+def last_valid_steps(valid_steps, steps):
+    """For each of 'steps' (any shape), the last valid step at or before it (else the first valid one)."""
+    pos = np.searchsorted(valid_steps, steps, side="right") - 1
+    return valid_steps[np.clip(pos, 0, None)]
+
+
+def compute_expert_table(sdc_state, lookahead_steps=LOOKAHEAD_STEPS):
+    """Expert table for one SDC track state dict (position, heading, valid)."""
+    positions = np.asarray(sdc_state["position"], dtype=np.float64)[:, :2]
+    headings = np.asarray(sdc_state["heading"], dtype=np.float64)
+    valid_steps = np.flatnonzero(np.asarray(sdc_state["valid"]).astype(bool))
+    steps = np.arange(len(positions))
+
+    if len(valid_steps) == 0:
+        return {"lookahead": np.zeros((len(steps), 2), dtype=np.float32),
+                "actions": np.zeros((len(steps), 2), dtype=np.float32),
+                "final_step": np.int64(0)}
+
+    # Clamp lookahead to the final valid point, so the expert heads for the goal at the end
+    ahead = last_valid_steps(valid_steps, np.minimum(steps + lookahead_steps, valid_steps[-1]))
+    current = last_valid_steps(valid_steps, steps)
+    lookahead = positions[ahead]
+    here = positions[current]
+
+    actions = get_expert_actions(here, headings[current], lookahead)
+    # At the final point the lookahead is the vehicle itself: no steering
+    actions[np.linalg.norm(lookahead - here, axis=1) < 1e-3, 0] = 0.0
+    return {
+        "lookahead": lookahead.astype(np.float32),
+        "actions": actions,
+        "final_step": np.int64(valid_steps[-1]),
+    }
+
+
+def expert_table(scenario):
+    """The stored table, or computed on the fly for scenarios converted before tables existed."""
+    table = scenario["metadata"].get(EXPERT_KEY)
+    if table is None:
+        sdc_id = scenario["metadata"]["sdc_id"]
+        table = compute_expert_table(scenario["tracks"][sdc_id]["state"])
+    elif "final_step" not in table:
+        # Stored before final_step existed: the steering is zeroed from the final step on
+        steering = np.flatnonzero(np.asarray(table["actions"])[:, 0])
+        table = dict(table, final_step=np.int64(steering[-1] + 1 if len(steering) else 0))
+    return table
+
+
+def add_expert_table(scenario):
+    scenario["metadata"][EXPERT_KEY] = expert_table(scenario)
+    return scenario
+
+
+def expert_action_at(table, step, position, heading):
+    """[steering, throttle] for a vehicle at 'position' / 'heading' at log timestep 'step'."""
+    lookahead = table["lookahead"]
+    step = min(max(int(step), 0), len(lookahead) - 1)
+    tx, ty = lookahead[step]
+    dx, dy = float(tx) - position[0], float(ty) - position[1]
+    heading_error = math.atan2(dy, dx) - heading
+    heading_error = (heading_error + math.pi) % (2 * math.pi) - math.pi
+
+    steering = min(max(heading_error * STEERING_GAIN, -1.0), 1.0)
+    throttle = 0.6 if abs(steering) < 0.3 else 0.3
+    if step >= table["final_step"]:
+        # Past the end of the log the lookahead is the final point itself: no steering (as in the table)
+        steering = 0.0
+    return np.array([steering, throttle], dtype=np.float32)
+
+
+def expert_actions_at(lookaheads, steps, positions, headings, final_steps, controller=None):
+    """
+    Batched expert_action_at for N vehicles, each with its own table:
+    lookaheads (N, T, 2) stacked table["lookahead"] arrays, steps (N,) or scalar,
+    positions (N, 2), headings (N,), final_steps (N,) their table["final_step"].
+    Pass an ExpertController to use its PID state.
+    """
+    lookaheads = np.asarray(lookaheads)
+    steps = np.clip(np.broadcast_to(np.asarray(steps, dtype=np.int64), (len(lookaheads),)), 0, lookaheads.shape[1] - 1)
+    targets = lookaheads[np.arange(len(lookaheads)), steps]
+    if controller is not None:
+        actions = controller.get_actions(positions, headings, targets)
+    else:
+        actions = get_expert_actions(positions, headings, targets)
+    actions[steps >= np.asarray(final_steps), 0] = 0.0
+    return actions
@@ -0,0 +1,123 @@
+"""
+Conversion manifest: which source tfrecords are converted, and into what.
+
+The manifest is an append-only JSON-lines journal in the output directory. Every
+finished (or failed) source appends one line with its size, mtime, content hash
+and the scenarios/output files it produced; the last line for a source wins. A
+crash can at worst tear the final line, which is ignored on load.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "conversion_manifest.jsonl"
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def file_digest(path):
+    hasher = new_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    Write bytes to 'path' via a temp file + rename, so readers never see a
+    partial file. Both the data and the rename are fsynced, so after a power
+    loss 'path' is either the old file or the complete new one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def fsync_dir(path):
+    """Persist the entries (renames, new files) of directory 'path', where the OS allows it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows cannot open directories
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ConversionManifest:
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write from a crash
+                    self.entries[entry["source"]] = entry
+
+    @staticmethod
+    def key(source):
+        return os.path.abspath(source)
+
+    def get(self, source):
+        return self.entries.get(self.key(source))
+
+    def needs_conversion(self, source):
+        """
+        True unless 'source' was converted successfully and is unchanged.
+
+        size + mtime is the cheap check; if only those differ the content hash
+        decides, so a touched-but-identical file is not converted again.
+        """
+        entry = self.get(source)
+        if entry is None or entry["status"] != "done":
+            return True
+        stat = os.stat(source)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            return False
+        if stat.st_size != entry["size"] or file_digest(source) != entry["hash"]:
+            return True
+        self._append(dict(entry, mtime=stat.st_mtime))
+        return False
+
+    def _append(self, entry):
+        self.entries[entry["source"]] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, source, status, digest=None, scenarios=(), outputs=(), error=None):
+        """Journal the result of converting 'source'. Returns the previous entry (if any)."""
+        previous = self.get(source)
+        stat = os.stat(source)
+        self._append({
+            "source": self.key(source),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": digest,
+            "status": status,
+            "scenarios": list(scenarios),
+            "outputs": list(outputs),
+            "error": error,
+        })
+        return previous
+
+    def compact(self):
+        """Rewrite the journal with one line per source."""
+        data = "".join(json.dumps(e) + "\n" for e in self.entries.values())
+        atomic_write(self.path, data.encode())
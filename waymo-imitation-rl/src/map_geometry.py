@@ -0,0 +1,188 @@
+"""
+Precomputed map geometry.
+
+Raw Waymo lane polylines have irregular point spacing and no spatial
+structure, so every consumer (log observations, metrics, rendering) used to
+concatenate and brute-force search them again at every reset. The converter
+now derives, once per scenario, and stores in scenario["metadata"][MAP_KEY]:
+
+    lane_ids        (L,)    map feature id of every lane
+    lane_offsets    (L+1,)  CSR offsets of each lane's points
+    points          (P, 2)  lane centerlines resampled every SPACING m
+    headings        (P,)    lane direction at each point
+    lane_bbox       (L, 4)  [xmin, ymin, xmax, ymax] per lane
+    segment_start   (S,)    first point of every lane segment (point i -> i + 1)
+    segment_bbox    (S, 4)  bounding box per segment
+    grid_origin     (2,)    uniform grid over the points, CELL_SIZE m cells
+    grid_shape      (2,)
+    cell_start      (C+1,)  CSR offsets into cell_points, cells in row-major order
+    cell_points     (P,)    point indices sorted by cell
+
+MapGeometry wraps such a table with radius / nearest-point queries that only
+look at the grid cells around the query.
+"""
+
+import numpy as np
+
+MAP_KEY = "map_geometry"
+SPACING = 2.0      # m between resampled lane points
+CELL_SIZE = 25.0   # m, grid cell edge
+
+
+def is_lane(feature):
+    return "LANE" in str(feature.get("type", "")) and "polyline" in feature and len(feature["polyline"])
+
+
+def resample_polyline(polyline, spacing=SPACING):
+    """Points every 'spacing' m along a polyline (both ends kept)."""
+    polyline = np.asarray(polyline, dtype=np.float64)[:, :2]
+    if len(polyline) < 2:
+        return polyline
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(polyline, axis=0), axis=1))])
+    if arc[-1] <= 0:
+        return polyline[:1]
+    stations = np.append(np.arange(0.0, arc[-1], spacing), arc[-1])
+    return np.stack([np.interp(stations, arc, polyline[:, 0]), np.interp(stations, arc, polyline[:, 1])], axis=1)
+
+
+def compute_map_geometry(map_features, spacing=SPACING, cell_size=CELL_SIZE):
+    lane_ids, lanes = [], []
+    for f_id, feature in map_features.items():
+        if is_lane(feature):
+            lane_ids.append(str(f_id))
+            lanes.append(resample_polyline(feature["polyline"], spacing))
+
+    # 1. Lanes as CSR point arrays
+    counts = np.array([len(lane) for lane in lanes], dtype=np.int64)
+    lane_offsets = np.concatenate([[0], np.cumsum(counts)])
+    points = np.concatenate(lanes) if lanes else np.zeros((0, 2))
+    return index_lane_points(lane_ids, lane_offsets, points, spacing, cell_size)
+
+
+def index_lane_points(lane_ids, lane_offsets, points, spacing=SPACING, cell_size=CELL_SIZE):
+    """The full geometry table from the resampled lane points alone (everything else is derived)."""
+    lane_offsets = np.asarray(lane_offsets, dtype=np.int64)
+    points = np.asarray(points, dtype=np.float64)
+    counts = np.diff(lane_offsets)
+    lane_of_point = np.repeat(np.arange(len(lane_ids)), counts)
+
+    # 2. Segments: consecutive points of the same lane
+    segment_start = np.flatnonzero(lane_of_point[:-1] == lane_of_point[1:]) if len(points) > 1 else np.zeros(0, np.int64)
+    seg_a, seg_b = points[segment_start], points[segment_start + 1]
+    segment_bbox = np.concatenate([np.minimum(seg_a, seg_b), np.maximum(seg_a, seg_b)], axis=1)
+
+    # Heading of the segment starting at each point; a lane's last point takes the one before it
+    headings = np.zeros(len(points))
+    delta = seg_b - seg_a
+    headings[segment_start] = np.arctan2(delta[:, 1], delta[:, 0])
+    last = lane_offsets[1:][counts > 1] - 1
+    headings[last] = headings[last - 1]
+
+    lane_bbox = np.zeros((len(lane_ids), 4))
+    if len(lane_ids):
+        nonempty = counts > 0
+        lane_bbox[nonempty, :2] = np.minimum.reduceat(points, lane_offsets[:-1][nonempty])
+        lane_bbox[nonempty, 2:] = np.maximum.reduceat(points, lane_offsets[:-1][nonempty])
+
+    # 3. Uniform grid, points bucketed by cell (CSR)
+    origin = points.min(axis=0) if len(points) else np.zeros(2)
+    cells_xy = np.floor((points - origin) / cell_size).astype(np.int64)
+    shape = cells_xy.max(axis=0) + 1 if len(points) else np.ones(2, dtype=np.int64)
+    cell = cells_xy[:, 0] * shape[1] + cells_xy[:, 1]
+    cell_points = np.argsort(cell, kind="stable")
+    cell_start = np.searchsorted(cell[cell_points], np.arange(shape[0] * shape[1] + 1))
+
+    return {
+        "spacing": float(spacing),
+        "cell_size": float(cell_size),
+        "lane_ids": list(lane_ids),
+        "lane_offsets": lane_offsets,
+        "points": points.astype(np.float32),
+        "headings": headings.astype(np.float32),
+        "lane_bbox": lane_bbox.astype(np.float32),
+        "segment_start": segment_start.astype(np.int32),
+        "segment_bbox": segment_bbox.astype(np.float32),
+        "grid_origin": origin.astype(np.float32),
+        "grid_shape": shape.astype(np.int64),
+        "cell_start": cell_start.astype(np.int64),
+        "cell_points": cell_points.astype(np.int32),
+    }
+
+
+def map_geometry(scenario):
+    """The stored geometry, or computed on the fly for scenarios converted before it existed."""
+    table = scenario["metadata"].get(MAP_KEY)
+    if table is None:
+        table = compute_map_geometry(scenario["map_features"])
+    return table
+
+
+def add_map_geometry(scenario):
+    scenario["metadata"][MAP_KEY] = map_geometry(scenario)
+    return scenario
+
+
+class MapGeometry:
+    """Spatial queries over a map geometry table."""
+    def __init__(self, table):
+        self.table = table
+        self.points = np.asarray(table["points"], dtype=np.float64)
+        self.headings = np.asarray(table["headings"], dtype=np.float64)
+        self.lane_offsets = np.asarray(table["lane_offsets"])
+        self.cell_size = float(table["cell_size"])
+        self.origin = np.asarray(table["grid_origin"], dtype=np.float64)
+        self.shape = np.asarray(table["grid_shape"])
+        self.cell_start = np.asarray(table["cell_start"])
+        self.cell_points = np.asarray(table["cell_points"])
+
+    def __len__(self):
+        return len(self.points)
+
+    def regrid(self, cell_size):
+        """The same lanes indexed with another grid cell size (e.g. finer, for short-range queries)."""
+        table = index_lane_points(self.table["lane_ids"], self.lane_offsets, self.points,
+                                  self.table["spacing"], cell_size)
+        table["headings"] = self.table["headings"]
+        return MapGeometry(table)
+
+    @property
+    def point_lane(self):
+        """Lane index of every point."""
+        return np.repeat(np.arange(len(self.lane_offsets) - 1), np.diff(self.lane_offsets))
+
+    def candidates(self, center, radius):
+        """
+        Indices of all points in the grid cells overlapping the square around
+        'center' ('radius' may also be a per-axis (x, y) half-extent).
+        """
+        if len(self.points) == 0:
+            return np.zeros(0, dtype=np.int64)
+        low = np.floor((np.asarray(center[:2]) - radius - self.origin) / self.cell_size).astype(np.int64)
+        high = np.floor((np.asarray(center[:2]) + radius - self.origin) / self.cell_size).astype(np.int64)
+        low = np.maximum(low, 0)
+        high = np.minimum(high, self.shape - 1)
+        if (high < low).any():
+            return np.zeros(0, dtype=np.int64)
+        # Cells of one grid row are contiguous in cell_points
+        rows = np.arange(low[0], high[0] + 1) * self.shape[1]
+        starts = self.cell_start[rows + low[1]]
+        ends = self.cell_start[rows + high[1] + 1]
+        return np.concatenate([self.cell_points[s:e] for s, e in zip(starts, ends)])
+
+    def query_radius(self, center, radius):
+        """Indices of the points within 'radius' of 'center'."""
+        idx = self.candidates(center, radius)
+        d2 = ((self.points[idx] - np.asarray(center[:2])) ** 2).sum(axis=1)
+        return idx[d2 <= radius * radius]
+
+    def nearest(self, center, k, radius):
+        """(indices, distances) of the up to k nearest points within 'radius', nearest first."""
+        idx = self.candidates(center, radius)
+        dist = np.linalg.norm(self.points[idx] - np.asarray(center[:2]), axis=1)
+        keep = dist <= radius
+        idx, dist = idx[keep], dist[keep]
+        if len(idx) > k:
+            part = np.argpartition(dist, k - 1)[:k]
+            idx, dist = idx[part], dist[part]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+from metadrive.component.map.scenario_map import ScenarioMap
+from metadrive.manager.scenario_map_manager import ScenarioMapManager
+
+
+class CachedScenarioMapManager(ScenarioMapManager):
+    """
+    ScenarioMapManager that keeps the built maps of the last 'capacity' scenarios.
+
+    Building a ScenarioMap (lane meshes, physics bodies, road network) is most of
+    a MetaDrive reset. MetaDrive's own store_map keeps maps by engine seed, but
+    DirectWaymoEnv runs the engine with num_scenarios=1 and swaps the scenario in
+    itself, so one seed stands for many maps. Here maps are keyed by scenario id:
+    a later episode on the same scenario re-attaches the stored map, and the
+    least recently used map is destroyed once more than 'capacity' are kept.
+    """
+    def __init__(self, capacity):
+        super().__init__()
+        assert capacity > 0, "use ScenarioMapManager when maps are not cached"
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._maps = OrderedDict()
+
+    def reset(self):
+        if self._no_map:
+            return super().reset()
+        seed = self.engine.global_random_seed
+        self.current_sdc_route = None
+        self.sdc_dest_point = None
+
+        # Same scenario the parent class builds from, so both agree on the map
+        scenario = self.engine.data_manager.get_scenario(seed, should_copy=False)
+        key = scenario["id"]
+        new_map = self._maps.pop(key, None)
+        if new_map is None:
+            self.misses += 1
+            new_map = ScenarioMap(map_index=seed, map_data=scenario["map_features"])
+        else:
+            self.hits += 1
+        self._maps[key] = new_map
+        # Only the map just inserted is attached, the evicted ones are detached already
+        while len(self._maps) > self.capacity:
+            _, old_map = self._maps.popitem(last=False)
+            old_map.destroy()
+
+        self.load_map(new_map)
+        self.update_route()
+
+    def unload_map(self, map):
+        # The current map is always in the cache: it is destroyed on eviction, not here
+        map.detach_from_world()
+        self.current_map = None
+
+    def clear_stored_maps(self):
+        super().clear_stored_maps()
+        for m in self._maps.values():
+            m.destroy()
+        self._maps = OrderedDict()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "maps": len(self._maps),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,302 @@
+"""
+Vectorized trajectory metrics against the Waymo logs.
+
+trajectory_metrics() scores a batch of driven ego trajectories (rollouts of E
+episodes, T samples each) against the logged scenarios they were driven in, all
+episodes at once:
+
+    ade, fde               displacement from the ego's own logged track
+    min_ttc                forward time-to-collision with the logged agents
+                           (constant velocities, agents in the ego's path)
+    collision              oriented bounding-box overlap with a logged agent
+    collision_step         first sample with an overlap (-1 if none)
+    lane_deviation         mean / max distance to the nearest lane centerline
+    max_lane_deviation     (preferring lanes heading the ego's way)
+    heading_error          mean |ego heading - lane heading| at that point
+    off_road               max_lane_deviation > OFF_ROAD_DISTANCE
+
+The logs come from ScenarioFeatures (one per episode; episodes on the same
+scenario share it), padded across scenarios so the agent terms are a single
+(E, agents, T) pass. Lane queries go through a grid index of the map geometry
+(see src.map_geometry), one vectorized pass per distinct scenario.
+
+TrajectoryMetricsCallback logs them during training, for the episodes every
+DirectWaymoEnv worker finished in the rollout.
+"""
+
+import weakref
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+from src.async_vec_env import env_method_all_workers
+
+DT = 0.1                  # s between log steps
+OFF_ROAD_DISTANCE = 3.0   # m from the nearest lane centerline
+LANE_SEARCH_RADIUS = 5.0  # m; farther from every lane counts as LANE_SEARCH_RADIUS
+HEADING_TOLERANCE = np.pi / 3  # rad; lanes turned further than this from the ego are a fallback
+
+# Map geometry -> the same lanes on a grid of LANE_SEARCH_RADIUS cells. The stored
+# 25 m grid would put ~5x more candidate points in range of every query.
+_lane_grids = weakref.WeakKeyDictionary()
+
+METRIC_KEYS = ("ade", "fde", "min_ttc", "collision", "collision_step",
+               "lane_deviation", "max_lane_deviation", "heading_error", "off_road")
+
+
+def _wrap(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def _stack_logs(scenarios):
+    """Per-scenario log arrays padded to (S, max agents, max steps, ...), float32."""
+    S = len(scenarios)
+    A = max(len(f.track_ids) for f in scenarios)
+    L = max(f.length for f in scenarios)
+    position = np.zeros((S, A, L, 2), dtype=np.float32)
+    velocity = np.zeros((S, A, L, 2), dtype=np.float32)
+    heading = np.zeros((S, A, L), dtype=np.float32)
+    valid = np.zeros((S, A, L), dtype=bool)
+    size = np.zeros((S, A, 2), dtype=np.float32)
+    for s, f in enumerate(scenarios):
+        n, t = f.position.shape[:2]
+        position[s, :n, :t] = f.position
+        velocity[s, :n, :t] = f.velocity
+        heading[s, :n, :t] = f.heading
+        valid[s, :n, :t] = f.valid
+        size[s, :n] = f.size
+    return position, velocity, heading, valid, size
+
+
+def box_overlap(lon, lat, d_heading, ego_half, other_half):
+    """
+    Separating-axis test of oriented boxes. (lon, lat) is the other box's center in
+    the ego frame, d_heading its heading relative to the ego; *_half are
+    (..., 2) half lengths / widths. All broadcast together.
+    """
+    cos, sin = np.cos(d_heading), np.sin(d_heading)
+    c, s = np.abs(cos), np.abs(sin)
+    el, ew = ego_half[..., 0], ego_half[..., 1]
+    ol, ow = other_half[..., 0], other_half[..., 1]
+    return ((np.abs(lon) <= el + ol * c + ow * s)
+            & (np.abs(lat) <= ew + ol * s + ow * c)
+            & (np.abs(lon * cos + lat * sin) <= ol + el * c + ew * s)
+            & (np.abs(-lon * sin + lat * cos) <= ow + el * s + ew * c))
+
+
+def lane_deviation(geometry, points, headings=None, radius=LANE_SEARCH_RADIUS):
+    """
+    (distance, lane heading) from each of 'points' (N, 2) to the nearest lane
+    centerline segment within 'radius'. With 'headings' (N,), segments whose
+    direction is within HEADING_TOLERANCE of the point's heading are preferred
+    (where lanes cross or run side by side in opposite directions, the nearest
+    one is often not the one being driven); the nearest segment of any heading
+    is the fallback. Points with no lane in range get (radius, nan).
+
+    Vectorized over all points: candidate cell ranges are expanded into
+    (query, lane point) pairs, every candidate point into the segments that
+    start and end at it, and each query is projected onto its segments.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    distance = np.full(n, float(radius))
+    lane_heading = np.full(n, np.nan)
+    if n == 0 or len(geometry) == 0:
+        return distance, lane_heading
+    # A segment within 'radius' has an endpoint within radius + its length (<= spacing)
+    reach = radius + float(geometry.table["spacing"])
+
+    # 1. Cell rows overlapping each query's square; a grid row's cells are contiguous
+    low = np.floor((points - reach - geometry.origin) / geometry.cell_size).astype(np.int64)
+    high = np.floor((points + reach - geometry.origin) / geometry.cell_size).astype(np.int64)
+    low = np.maximum(low, 0)
+    high = np.minimum(high, geometry.shape - 1)
+    rows_per_query = np.maximum(high[:, 0] - low[:, 0] + 1, 0) * (high[:, 1] >= low[:, 1])
+    query = np.repeat(np.arange(n), rows_per_query)
+    row = low[query, 0] + (np.arange(len(query)) - np.repeat(np.cumsum(rows_per_query) - rows_per_query, rows_per_query))
+    start = geometry.cell_start[row * geometry.shape[1] + low[query, 1]]
+    end = geometry.cell_start[row * geometry.shape[1] + high[query, 1] + 1]
+
+    # 2. Expand the ranges into (query, point) pairs, then into (query, segment) pairs:
+    # the segments starting at the point and ending at it (named by their start point)
+    counts = end - start
+    query = np.repeat(query, counts)
+    if len(query) == 0:
+        return distance, lane_heading
+    offset = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+    candidate = geometry.cell_points[np.repeat(start, counts) + offset].astype(np.int64)
+    is_start = np.zeros(len(geometry) + 1, dtype=bool)
+    is_start[geometry.table["segment_start"]] = True
+    segment = np.stack([np.where(is_start[candidate], candidate, -1),
+                        np.where(is_start[np.maximum(candidate - 1, 0)] & (candidate > 0), candidate - 1, -1)], axis=1)
+    query = np.repeat(query, 2)[segment.ravel() >= 0]
+    segment = segment.ravel()[segment.ravel() >= 0]
+    if len(query) == 0:
+        return distance, lane_heading
+
+    # 3. Point-to-segment distance
+    a = geometry.points[segment]
+    ab = geometry.points[segment + 1] - a
+    ap = points[query] - a
+    t = np.clip((ap * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0.0, 1.0)
+    d2 = ((ap - t[:, None] * ab) ** 2).sum(axis=1)
+    key = np.where(d2 <= radius * radius, d2, np.inf)
+    if headings is not None:
+        # Heading-consistent segments first: the others rank behind every one of them
+        aligned = np.abs(_wrap(np.asarray(headings, dtype=np.float64)[query] - geometry.headings[segment]))
+        key = np.where(aligned <= HEADING_TOLERANCE, key, key + 2 * radius * radius)
+
+    # 4. Best segment per query (pairs are grouped by query already)
+    group_start = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+    best = np.minimum.reduceat(key, group_start)
+    is_best = key == np.repeat(best, np.diff(np.r_[group_start, len(query)]))
+    first = np.flatnonzero(is_best)
+    first = first[np.r_[True, query[first][1:] != query[first][:-1]]]
+    hit = first[np.isfinite(best)]  # one 'first' per group, in group order
+    distance[query[hit]] = np.sqrt(d2[hit])
+    lane_heading[query[hit]] = geometry.headings[segment[hit]]
+    return distance, lane_heading
+
+
+def trajectory_metrics(positions, headings, features, lengths=None, steps=None, ego_index=None, ego_size=None):
+    """
+    Per-episode metrics of E rollouts, as {name: (E,) array} (see METRIC_KEYS).
+
+    positions (E, T, 2) and headings (E, T): the driven ego poses, sampled
+    every log step. features: a ScenarioFeatures per episode (shared objects
+    for episodes on the same scenario). lengths (E,): valid samples per
+    episode (default T). steps (E, T): log step of every sample (default
+    0..T-1). ego_index (E,): the ego's logged track (default the SDC), excluded
+    from the agents and used for ADE / FDE. ego_size (E, 2): length / width
+    (default the logged track's).
+    """
+    positions = np.asarray(positions, dtype=np.float64)[..., :2]
+    headings = np.asarray(headings, dtype=np.float64)
+    E, T = headings.shape
+    lengths = np.full(E, T) if lengths is None else np.asarray(lengths)
+    steps = np.broadcast_to(np.arange(T), (E, T)) if steps is None else np.asarray(steps)
+    sample = np.arange(T) < lengths[:, None]
+
+    # Distinct scenarios, padded
+    scenarios, scenario_of = [], np.zeros(E, dtype=np.int64)
+    slot = {}
+    for e, f in enumerate(features):
+        scenario_of[e] = slot.setdefault(id(f), len(scenarios))
+        if scenario_of[e] == len(scenarios):
+            scenarios.append(f)
+    log_position, log_velocity, log_heading, log_valid, log_size = _stack_logs(scenarios)
+    A, L = log_valid.shape[1:]
+    steps = np.clip(steps, 0, L - 1)
+    if ego_index is None:
+        ego_index = np.array([f.sdc_index for f in features])
+    ego_index = np.asarray(ego_index)
+    if ego_size is None:
+        ego_size = log_size[scenario_of, ego_index]
+    ego_half = np.asarray(ego_size, dtype=np.float32)[:, None, None, :] / 2  # (E, 1, 1, 2)
+
+    # 1. Displacement from the ego's logged track
+    s_e, st = scenario_of[:, None], steps
+    own = log_position[s_e, ego_index[:, None], st]
+    compared = sample & log_valid[s_e, ego_index[:, None], st]
+    error = np.linalg.norm(positions - own, axis=2)
+    count = compared.sum(axis=1)
+    ade = np.where(count > 0, (error * compared).sum(axis=1) / np.maximum(count, 1), np.nan)
+    last = T - 1 - np.argmax(compared[:, ::-1], axis=1)
+    fde = np.where(count > 0, error[np.arange(E), last], np.nan)
+
+    # 2. Logged agents at every sample, in the ego frame: (E, A, T), one flat gather per array
+    a = np.arange(A)[None, :, None]
+    flat = (scenario_of[:, None, None] * A + a) * L + steps[:, None, :]
+    present = np.take(log_valid, flat) & sample[:, None, :] & (a != ego_index[:, None, None])
+    pos32 = positions.astype(np.float32)
+    dx = np.take(log_position[..., 0], flat) - pos32[:, None, :, 0]
+    dy = np.take(log_position[..., 1], flat) - pos32[:, None, :, 1]
+    cos, sin = np.cos(headings).astype(np.float32)[:, None], np.sin(headings).astype(np.float32)[:, None]
+    lon = cos * dx + sin * dy
+    lat = cos * dy - sin * dx
+    d_heading = np.take(log_heading, flat) - headings.astype(np.float32)[:, None]
+    other_half = log_size[scenario_of][:, :, None, :] / 2  # (E, A, 1, 2)
+
+    # 3. Bounding-box overlap
+    overlap = present & box_overlap(lon, lat, d_heading, ego_half, other_half)
+    overlap_any = overlap.any(axis=1)
+    collision = overlap_any.any(axis=1)
+    collision_step = np.where(collision, np.argmax(overlap_any, axis=1), -1)
+
+    # 4. Forward time-to-collision: agents ahead whose footprint overlaps the ego's lane
+    ego_velocity = (np.gradient(positions, axis=1) / DT if T > 1 else np.zeros_like(positions)).astype(np.float32)
+    vx = np.take(log_velocity[..., 0], flat) - ego_velocity[:, None, :, 0]
+    vy = np.take(log_velocity[..., 1], flat) - ego_velocity[:, None, :, 1]
+    closing = -(cos * vx + sin * vy)
+    gap = np.maximum(lon - (ego_half[..., 0] + other_half[..., 0]), 0.0)
+    in_path = present & (lon > 0) & (np.abs(lat) < ego_half[..., 1] + other_half[..., 1]) & (closing > 0)
+    ttc = np.full(in_path.shape, np.inf, dtype=np.float32)
+    ttc[in_path] = gap[in_path] / closing[in_path]
+    ttc[overlap] = 0.0
+    min_ttc = ttc.min(axis=(1, 2))
+
+    # 5. Lane deviation, one grid query per distinct scenario
+    deviation = np.zeros((E, T))
+    heading_error = np.full((E, T), np.nan)
+    for s, f in enumerate(scenarios):
+        episodes = np.flatnonzero(scenario_of == s)
+        grid = _lane_grids.get(f.map)
+        if grid is None:
+            grid = _lane_grids[f.map] = f.map.regrid(LANE_SEARCH_RADIUS)
+        dist, lane_heading = lane_deviation(grid, positions[episodes].reshape(-1, 2),
+                                            headings[episodes].reshape(-1))
+        deviation[episodes] = dist.reshape(len(episodes), T)
+        heading_error[episodes] = np.abs(_wrap(headings[episodes] - lane_heading.reshape(len(episodes), T)))
+    samples = np.maximum(sample.sum(axis=1), 1)
+    lane_mean = (deviation * sample).sum(axis=1) / samples
+    lane_max = np.where(sample, deviation, 0.0).max(axis=1)
+    known = sample & np.isfinite(heading_error)
+    heading_mean = np.where(known.any(axis=1),
+                            np.where(known, heading_error, 0.0).sum(axis=1) / np.maximum(known.sum(axis=1), 1), np.nan)
+
+    return {
+        "ade": ade,
+        "fde": fde,
+        "min_ttc": min_ttc,
+        "collision": collision,
+        "collision_step": collision_step,
+        "lane_deviation": lane_mean,
+        "max_lane_deviation": lane_max,
+        "heading_error": heading_mean,
+        "off_road": lane_max > OFF_ROAD_DISTANCE,
+    }
+
+
+class TrajectoryMetricsCallback(BaseCallback):
+    """
+    Logs the mean of every metric over the episodes finished during the rollout,
+    under trajectory/. Each worker (spares included) scores its own episodes in
+    one batch (DirectWaymoEnv.trajectory_metrics, enabled by
+    config["trajectory_metrics"]).
+    """
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self._available = True
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        if not self._available:
+            return
+        try:
+            per_worker = env_method_all_workers(self.training_env, "trajectory_metrics")
+        except AttributeError:
+            self._available = False
+            return
+        merged = {}
+        for metrics in per_worker:
+            for name, values in metrics.items():
+                merged.setdefault(name, []).extend(values)
+        for name, values in merged.items():
+            values = np.asarray(values, dtype=np.float64)
+            if name == "collision_step" or not np.isfinite(values).any():
+                continue
+            self.logger.record(f"trajectory/{name}", float(np.nanmean(np.where(np.isinf(values), np.nan, values))))
+        if self.verbose and merged:
+            print(f"📏 {len(merged['ade'])} episodes scored against the logs")
@@ -0,0 +1,383 @@
+"""
+Multi-agent log-replay environment: many logged vehicles of one scenario are
+controlled by the policy at the same time.
+
+MetaDrive's ScenarioEnv only controls the SDC, so this mode runs its own
+lightweight simulation in NumPy: controlled vehicles follow a kinematic bicycle
+model, all other tracks replay the log. Observations are the log-based features
+of src.observations (obs_mode="log"), so policies move freely between this env,
+DirectWaymoEnv(obs_mode="log") and offline BC.
+
+Exposed as an SB3 VecEnv: every (scene, slot) pair is one "env". A scene holds
+one scenario; its slots control different vehicles. When a vehicle's episode
+ends, its slot takes over another vehicle of the same scenario, so one scenario
+load yields agents_per_scene episodes at a time.
+
+A slot without a vehicle (the scenario has fewer controllable vehicles than
+slots) is idle: it reports done=True every step, with an all-zero observation
+and info["active"] = False, and tries to take over a vehicle again on the next
+step. No episode spans an idle stretch, and BC_PPO leaves idle rows out of its
+losses. Wrap the env in ActiveVecMonitor rather than VecMonitor, so the idle
+steps are not logged as one-step episodes either.
+"""
+
+import time
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv, VecMonitor
+
+from src.dataset_index import ScenarioIndex
+from src.observations import OBSERVATION_DIM, ScenarioFeatures, observation_space
+from src.prefetch import ScenarioPrefetcher
+from src.profiling import timers
+from src.samplers import make_sampler
+from src.utils import ExpertController
+
+DT = 0.1
+MAX_STEER = 0.7          # rad at steering = 1
+MAX_ACCEL = 3.0          # m/s^2 at throttle = 1
+MAX_BRAKE = 6.0          # m/s^2 at throttle = -1
+MAX_SPEED = 30.0
+MAX_DEVIATION = 10.0     # m from the logged position before "out of road"
+ARRIVE_DISTANCE = 5.0
+MIN_REMAINING = 20       # logged steps a vehicle needs left to be taken over
+CONTROLLABLE_TYPES = ("VEHICLE",)
+
+CRASH_PENALTY = 5.0
+OUT_OF_ROAD_PENALTY = 5.0
+
+
+class _Scene:
+    """One scenario with 'num_slots' controlled vehicles."""
+    def __init__(self, load_fn, pick_fn, num_slots, prefetch_depth, rng):
+        self.num_slots = num_slots
+        self.rng = rng
+        self.load_fn = load_fn
+        self.pick_fn = pick_fn
+        self.prefetcher = ScenarioPrefetcher(load_fn, pick_fn, depth=prefetch_depth) if prefetch_depth > 0 else None
+        self.controller = ExpertController(num_slots)
+        self.index = None
+        self.outcomes = []
+
+    # --- Scenario / slot management ------------------------------------------
+
+    def _next_scenario(self):
+        while True:
+            if self.prefetcher is not None:
+                index, scenario, _, error = self.prefetcher.get()
+            else:
+                index, error = self.pick_fn(), None
+                try:
+                    scenario, _ = self.load_fn(index)
+                except Exception as e:
+                    error = e
+            if error is None:
+                return index, scenario
+            print(f"❌ Read Error {index}: {error}")
+
+    def load_next(self):
+        index, scenario = self._next_scenario()
+        f = ScenarioFeatures(scenario)
+        self.index = index
+        self.features = f
+        self.step_count = 0
+        self.outcomes = []
+
+        # Simulated state of every track; only controlled rows are integrated
+        self.position = f.position[:, 0].copy()
+        self.heading = f.heading[:, 0].copy()
+        self.speed = np.linalg.norm(f.velocity[:, 0], axis=1)
+        self.controlled = np.zeros(len(f.track_ids), dtype=bool)
+        self.used = np.zeros(len(f.track_ids), dtype=bool)
+        states = [scenario["tracks"][t_id]["state"] for t_id in f.track_ids]
+        self.width = np.array([float(np.max(s["width"])) if len(s["width"]) else 2.0 for s in states])
+        self.length_m = np.array([float(np.max(s["length"])) if len(s["length"]) else 4.5 for s in states])
+        self.controllable = np.array([t.endswith(CONTROLLABLE_TYPES) for t in f.track_types])
+
+        self.slot_track = np.full(self.num_slots, -1, dtype=np.int64)
+        self.lookaheads = np.zeros((self.num_slots, f.length, 2), dtype=np.float32)
+        self.final_steps = np.zeros(self.num_slots, dtype=np.int64)
+        self.controller.reset()
+        for slot in range(self.num_slots):
+            self._assign(slot)
+
+    def _assign(self, slot):
+        """Gives 'slot' a vehicle that is valid now and has enough log left (unused ones first)."""
+        f, t = self.features, self.step_count
+        candidates = (self.controllable & ~self.controlled & f.valid[:, t]
+                      & (f.last_valid - t >= MIN_REMAINING))
+        fresh = candidates & ~self.used
+        pool = np.flatnonzero(fresh if fresh.any() else candidates)
+        if f.sdc_index in pool and not self.used[f.sdc_index]:
+            track = f.sdc_index
+        elif len(pool):
+            track = int(self.rng.choice(pool))
+        else:
+            self.slot_track[slot] = -1
+            return
+
+        self.slot_track[slot] = track
+        self.controlled[track] = True
+        self.used[track] = True
+        self.position[track] = f.position[track, t]
+        self.heading[track] = f.heading[track, t]
+        self.speed[track] = np.linalg.norm(f.velocity[track, t])
+        table = f.expert_table(track)
+        self.lookaheads[slot] = table["lookahead"]
+        self.final_steps[slot] = table["final_step"]
+        self.controller.reset(slot)
+
+    def _release(self, slot):
+        track = self.slot_track[slot]
+        if track >= 0:
+            self.controlled[track] = False
+        self.slot_track[slot] = -1
+
+    # --- Simulation -----------------------------------------------------------
+
+    def _replay_log(self):
+        f, t = self.features, self.step_count
+        replay = ~self.controlled
+        self.position[replay] = f.position[replay, t]
+        self.heading[replay] = f.heading[replay, t]
+        self.speed[replay] = np.linalg.norm(f.velocity[replay, t], axis=1)
+
+    def _integrate(self, tracks, actions):
+        steer = np.clip(actions[:, 0], -1.0, 1.0) * MAX_STEER
+        throttle = np.clip(actions[:, 1], -1.0, 1.0)
+        accel = np.where(throttle >= 0, throttle * MAX_ACCEL, throttle * MAX_BRAKE)
+        speed = np.clip(self.speed[tracks] + accel * DT, 0.0, MAX_SPEED)
+        wheelbase = np.maximum(0.6 * self.length_m[tracks], 1.0)
+        heading = self.heading[tracks] + speed / wheelbase * np.tan(steer) * DT
+        self.position[tracks] += speed[:, None] * np.stack([np.cos(heading), np.sin(heading)], axis=1) * DT
+        self.heading[tracks] = heading
+        self.speed[tracks] = speed
+
+    def _present(self):
+        return self.controlled | self.features.valid[:, min(self.step_count, self.features.length - 1)]
+
+    def observe(self):
+        f = self.features
+        active = self.slot_track >= 0
+        obs = np.zeros((self.num_slots, OBSERVATION_DIM), dtype=np.float32)
+        if active.any():
+            tracks = self.slot_track[active]
+            velocity = self.speed[:, None] * np.stack([np.cos(self.heading), np.sin(self.heading)], axis=1)
+            rows = f.observations(
+                np.full(len(tracks), self.step_count),
+                self.position[tracks], self.heading[tracks], velocity[tracks],
+                ego_index=tracks,
+                agents=(self.position, velocity, self.heading, self._present()),
+                # Every slot driving: build straight into the returned array
+                out=obs if active.all() else None,
+            )
+            if not active.all():
+                obs[active] = rows
+        return obs
+
+    def step(self, actions):
+        f = self.features
+        active = self.slot_track >= 0
+        tracks = self.slot_track[active]
+
+        # 1. Move: controlled vehicles by the policy, everyone else by the log
+        self.step_count += 1
+        t = min(self.step_count, f.length - 1)
+        self._integrate(tracks, actions[active])
+        self._replay_log()
+
+        # 2. Per-slot outcome
+        rewards = np.zeros(self.num_slots, dtype=np.float32)
+        terminated = np.zeros(self.num_slots, dtype=bool)
+        infos = [{"active": bool(a)} for a in active]
+        if active.any():
+            logged = f.position[tracks, f.filled_step[tracks, t]]
+            deviation = np.linalg.norm(self.position[tracks] - logged, axis=1)
+
+            present = self._present()
+            gap = np.linalg.norm(self.position[tracks, None] - self.position[None], axis=-1)
+            gap[np.arange(len(tracks)), tracks] = np.inf
+            gap[:, ~present] = np.inf
+            crash = (gap < 0.5 * (self.width[tracks, None] + self.width[None])).any(axis=1)
+            out_of_road = deviation > MAX_DEVIATION
+            arrive = (t >= f.last_valid[tracks]) & (deviation < ARRIVE_DISTANCE)
+
+            # Tracking reward: 1 on the logged trajectory, 0 at MAX_DEVIATION
+            reward = 1.0 - np.minimum(deviation / MAX_DEVIATION, 1.0)
+            reward -= CRASH_PENALTY * crash + OUT_OF_ROAD_PENALTY * out_of_road
+            rewards[active] = reward
+            terminated[active] = crash | out_of_road | arrive
+
+            # Batched expert: steer at each vehicle's lookahead point, hold its logged speed.
+            # The controller keeps per-slot state, so it sees every slot, inactive ones masked.
+            slot_tracks = np.maximum(self.slot_track, 0)
+            target_speed = np.zeros(self.num_slots)
+            target_speed[active] = np.linalg.norm(f.velocity[tracks, f.filled_step[tracks, t]], axis=1)
+            expert = self.controller.get_actions(
+                self.position[slot_tracks], self.heading[slot_tracks], self.lookaheads[:, t],
+                speeds=self.speed[slot_tracks], target_speeds=target_speed, mask=active,
+            )
+            expert[t >= self.final_steps, 0] = 0.0  # no steering at the log's final point
+            for i, slot in enumerate(np.flatnonzero(active)):
+                infos[slot].update({
+                    "track_id": f.track_ids[tracks[i]],
+                    "crash": bool(crash[i]),
+                    "out_of_road": bool(out_of_road[i]),
+                    "arrive_dest": bool(arrive[i]),
+                    "expert_action": expert[slot],
+                })
+
+        # 3. End of the log: every active vehicle is truncated
+        truncated = active & ~terminated & (self.step_count >= f.length - MIN_REMAINING)
+        return rewards, terminated, truncated, infos
+
+    @property
+    def log_ended(self):
+        return self.step_count >= self.features.length - MIN_REMAINING
+
+    def finish(self, slots, infos):
+        """
+        Releases finished (and idle) slots and, while the log lasts, hands them
+        other vehicles of the same scenario. Returns False once the scenario is used up.
+        """
+        for slot in slots:
+            if infos[slot]["active"]:
+                # Reaching the end of the log without crashing counts as a success
+                self.outcomes.append(infos[slot].get("arrive_dest", False) or infos[slot].get("TimeLimit.truncated", False))
+            self._release(slot)
+        if self.log_ended:
+            return False
+        for slot in slots:
+            self._assign(slot)
+        return bool((self.slot_track >= 0).any())
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+
+
+class MultiAgentWaymoVecEnv(VecEnv):
+    """
+    num_envs = num_scenes * agents_per_scene controlled vehicles, stepped in
+    one call. Scenarios come from a scenario index through a sampler, like
+    DirectWaymoEnv; a finished scenario is replaced by the next sampled one.
+    """
+    render_mode = None
+
+    def __init__(self, scenario_index, agents_per_scene=16, num_scenes=1, scenario_sampler="uniform",
+                 prefetch_depth=2, seed=0):
+        self.scenario_index = ScenarioIndex(scenario_index)
+        self.sampler = make_sampler(scenario_sampler, len(self.scenario_index), self.scenario_index)
+        self.agents_per_scene = agents_per_scene
+        self.rng = np.random.default_rng(seed)
+
+        def load(index):
+            return self.scenario_index.load(index), self.scenario_index.scenario_id(index)
+
+        self.scenes = []
+        for i in range(num_scenes):
+            scene_rng = np.random.default_rng(self.rng.integers(2**63))
+            self.scenes.append(_Scene(load, lambda r=scene_rng: self.sampler.sample(r), agents_per_scene,
+                                      prefetch_depth, scene_rng))
+
+        super().__init__(num_scenes * agents_per_scene, observation_space(),
+                         spaces.Box(-1.0, 1.0, (2,), dtype=np.float32))
+        self._actions = None
+
+    def _slots(self, scene):
+        return slice(scene * self.agents_per_scene, (scene + 1) * self.agents_per_scene)
+
+    def reset(self):
+        for scene in self.scenes:
+            scene.load_next()
+        self._reset_seeds()
+        self._reset_options()
+        return np.concatenate([scene.observe() for scene in self.scenes])
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, -1)
+
+    @timers.timed("env/multi_agent_step")
+    def step_wait(self):
+        obs, rewards, dones, infos = [], [], [], []
+        for i, scene in enumerate(self.scenes):
+            rew, terminated, truncated, scene_infos = scene.step(self._actions[self._slots(i)])
+            # Idle slots end an (empty) episode every step, so the next vehicle starts a fresh one
+            idle = np.array([not info["active"] for info in scene_infos])
+            done = terminated | truncated | idle
+            scene_obs = scene.observe()
+            finished = np.flatnonzero(done)
+            for slot in finished:
+                scene_infos[slot]["terminal_observation"] = scene_obs[slot]
+                scene_infos[slot]["TimeLimit.truncated"] = bool(truncated[slot] and not terminated[slot])
+
+            # At the end of the log every active slot is done (truncated), so
+            # a used-up scenario never cuts an episode short
+            if len(finished) or scene.log_ended:
+                if not scene.finish(finished, scene_infos):
+                    # Feed the scenario's outcome back to the sampler, then move on
+                    if scene.outcomes:
+                        self.sampler.update(scene.index, {"arrive_dest": np.mean(scene.outcomes) >= 0.5})
+                    scene.load_next()
+                scene_obs = scene.observe()
+
+            obs.append(scene_obs)
+            rewards.append(rew)
+            dones.append(done)
+            infos.extend(scene_infos)
+        return np.concatenate(obs), np.concatenate(rewards), np.concatenate(dones), infos
+
+    def close(self):
+        for scene in self.scenes:
+            scene.close()
+
+    # --- VecEnv plumbing: all slots share this one object ---------------------
+
+    def _count(self, indices):
+        return len(self._get_indices(indices))
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * self._count(indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * self._count(indices)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * self._count(indices)
+
+    def sampler_stats(self):
+        return self.sampler.stats()
+
+
+class ActiveVecMonitor(VecMonitor):
+    """
+    VecMonitor that only counts active rows (info["active"], default True):
+    idle multi-agent slots neither add steps or reward to an episode nor
+    report the one-step "episodes" their per-step dones would otherwise
+    produce in rollout/ep_rew_mean and ep_len_mean.
+    """
+    def step_wait(self):
+        obs, rewards, dones, infos = self.venv.step_wait()
+        active = np.array([info.get("active", True) for info in infos], dtype=bool)
+        self.episode_returns += np.where(active, rewards, 0.0).astype(self.episode_returns.dtype)
+        self.episode_lengths += active
+        new_infos = list(infos)
+        for i in np.flatnonzero(np.asarray(dones) & active):
+            info = infos[i].copy()
+            episode_info = {"r": self.episode_returns[i], "l": self.episode_lengths[i],
+                            "t": round(time.time() - self.t_start, 6)}
+            for key in self.info_keywords:
+                episode_info[key] = info[key]
+            info["episode"] = episode_info
+            self.episode_count += 1
+            self.episode_returns[i] = 0
+            self.episode_lengths[i] = 0
+            if self.results_writer:
+                self.results_writer.write_row(episode_info)
+            new_infos[i] = info
+        return obs, rewards, dones, new_infos
@@ -0,0 +1,220 @@
+"""
+Log-based observations: an ego-centric feature vector built from the scenario
+data alone, with no simulator sensors.
+
+    ego        velocity in the ego frame                           2
+    route      logged ego positions 1..NUM_ROUTE_POINTS s ahead    2 * NUM_ROUTE_POINTS
+    goal       final logged ego position                           2
+    agents     NUM_AGENTS nearest other agents: position,          7 * NUM_AGENTS
+               velocity, heading (sin, cos), mask
+    lanes      NUM_LANE_POINTS nearest (resampled) lane points:    3 * NUM_LANE_POINTS
+               position, mask
+
+Everything is expressed in the ego frame (x forward, y left) and scaled to
+roughly [-1, 1]. Because the features only need the ego pose and the log, the
+same vector is computed online by DirectWaymoEnv (obs_mode="log", ego pose from
+the simulator), by the multi-agent env for every controlled vehicle, and offline
+for every logged SDC (or vehicle) state (src.offline_bc), which is what lets a
+policy pretrained offline be fine-tuned with PPO.
+"""
+
+import gymnasium as gym
+import numpy as np
+
+from src.expert import compute_expert_table, expert_table
+from src.map_geometry import MapGeometry, map_geometry
+
+NUM_ROUTE_POINTS = 5
+ROUTE_STEP = 10  # frames (10 Hz logs -> 1 s)
+NUM_AGENTS = 8
+NUM_LANE_POINTS = 32
+RADIUS = 50.0
+
+POSITION_SCALE = 50.0
+GOAL_SCALE = 200.0
+SPEED_SCALE = 20.0
+
+OBSERVATION_DIM = 2 + 2 * NUM_ROUTE_POINTS + 2 + 7 * NUM_AGENTS + 3 * NUM_LANE_POINTS
+
+# Column ranges of the parts in the observation vector
+EGO = slice(0, 2)
+ROUTE = slice(EGO.stop, EGO.stop + 2 * NUM_ROUTE_POINTS)
+GOAL = slice(ROUTE.stop, ROUTE.stop + 2)
+AGENTS = slice(GOAL.stop, GOAL.stop + 7 * NUM_AGENTS)
+LANES = slice(AGENTS.stop, AGENTS.stop + 3 * NUM_LANE_POINTS)
+
+
+def _to_ego(vectors, cos, sin):
+    """Rotates world-frame (..., 2) vectors into the ego frame; cos/sin broadcast over the leading axes."""
+    x, y = vectors[..., 0], vectors[..., 1]
+    return np.stack([cos * x + sin * y, -sin * x + cos * y], axis=-1)
+
+
+def _nearest(dist, k):
+    """Indices (T, k) of the k smallest entries per row of dist (T, N), nearest first."""
+    n = dist.shape[1]
+    if n > k:
+        idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), (len(dist), n))
+    order = np.argsort(np.take_along_axis(dist, idx, axis=1), axis=1)
+    return np.take_along_axis(idx, order, axis=1)
+
+
+class ScenarioFeatures:
+    """
+    Per-scenario arrays for building observations, prepared once (per episode
+    online, per scenario offline); observations() is then vectorized over rows.
+
+    Any track can be the ego vehicle (ego_index); by default it is the SDC.
+    """
+    def __init__(self, scenario):
+        tracks = scenario["tracks"]
+        self.track_ids = list(tracks)
+        self.track_types = [str(tracks[t_id]["type"]) for t_id in self.track_ids]
+        self.sdc_index = self.track_ids.index(scenario["metadata"]["sdc_id"])
+        self._scenario = scenario
+        self._experts = {}
+
+        # 1. All tracks, stacked (N, T, ...)
+        states = [tracks[t_id]["state"] for t_id in self.track_ids]
+        self.position = np.stack([np.asarray(s["position"], dtype=np.float64)[:, :2] for s in states])
+        self.velocity = np.stack([np.asarray(s["velocity"], dtype=np.float64)[:, :2] for s in states])
+        self.heading = np.stack([np.asarray(s["heading"], dtype=np.float64) for s in states])
+        self.valid = np.stack([np.asarray(s["valid"]).astype(bool) for s in states])
+        self.length = self.position.shape[1]
+        # (length, width) per track, taken at its first valid step
+        first = np.argmax(self.valid, axis=1)
+        self.size = np.stack([np.asarray(s["size"], dtype=np.float64)[i, :2] for s, i in zip(states, first)])
+
+        # 2. Last valid step at or before every step (first valid one before it starts)
+        steps = np.where(self.valid, np.arange(self.length), -1)
+        filled = np.maximum.accumulate(steps, axis=1)
+        first_valid = np.argmax(self.valid, axis=1)
+        self.filled_step = np.where(filled < 0, first_valid[:, None], filled)
+        self.last_valid = np.where(self.valid.any(axis=1), self.length - 1 - np.argmax(self.valid[:, ::-1], axis=1), 0)
+        rows = np.arange(len(self.track_ids))
+        self.goal = self.position[rows, self.last_valid]
+
+        # SDC shorthands
+        self.sdc_position = self.position[self.sdc_index]
+        self.sdc_heading = self.heading[self.sdc_index]
+        self.sdc_velocity = self.velocity[self.sdc_index]
+        self.valid_steps = np.flatnonzero(self.valid[self.sdc_index])
+        self.expert = self.expert_table(self.sdc_index)
+
+        # 3. Lane centerline points, resampled at conversion time (see src.map_geometry)
+        self.map = MapGeometry(map_geometry(scenario))
+        self.lane_points = self.map.points
+
+    def expert_table(self, track):
+        """Expert table of track index 'track' (the stored one for the SDC)."""
+        table = self._experts.get(track)
+        if table is None:
+            if track == self.sdc_index:
+                table = expert_table(self._scenario)
+            else:
+                table = compute_expert_table(self._scenario["tracks"][self.track_ids[track]]["state"])
+            self._experts[track] = table
+        return table
+
+    def observations(self, steps, ego_position, ego_heading, ego_velocity, ego_index=None, agents=None, out=None):
+        """
+        Observations (T, OBSERVATION_DIM) for ego poses at log timesteps 'steps'.
+        steps (T,), ego_position (T, 2), ego_heading (T,), ego_velocity (T, 2).
+
+        ego_index (T,) selects the ego track of every row (default: the SDC).
+        agents = (position (N, 2), velocity (N, 2), heading (N,), valid (N,))
+        replaces the logged state of all tracks, for every row, e.g. when
+        several of them are simulated.
+        out: preallocated float32 (T, OBSERVATION_DIM) array to fill and return.
+        """
+        steps = np.clip(np.asarray(steps, dtype=np.int64), 0, self.length - 1)
+        ego_position = np.asarray(ego_position, dtype=np.float64)[:, :2]
+        ego_heading = np.asarray(ego_heading, dtype=np.float64)
+        ego_velocity = np.asarray(ego_velocity, dtype=np.float64)[:, :2]
+        T = len(steps)
+        if out is None:
+            out = np.empty((T, OBSERVATION_DIM), dtype=np.float32)
+        if ego_index is None:
+            ego_index = np.full(T, self.sdc_index)
+        ego_index = np.asarray(ego_index, dtype=np.int64)
+        rows = np.arange(T)[:, None]
+        cos, sin = np.cos(ego_heading), np.sin(ego_heading)
+
+        # 1. Ego
+        out[:, EGO] = _to_ego(ego_velocity, cos, sin) / SPEED_SCALE
+
+        # 2. Route and goal
+        ahead = np.minimum(steps[:, None] + ROUTE_STEP * np.arange(1, NUM_ROUTE_POINTS + 1), self.length - 1)
+        route = self.position[ego_index[:, None], self.filled_step[ego_index[:, None], ahead]]
+        route = route - ego_position[:, None]
+        out[:, ROUTE] = _to_ego(route, cos[:, None], sin[:, None]).reshape(T, -1) / POSITION_SCALE
+        out[:, GOAL] = _to_ego(self.goal[ego_index] - ego_position, cos, sin) / GOAL_SCALE
+
+        # 3. K nearest agents (never the ego itself)
+        if agents is None:
+            position = self.position[:, steps].transpose(1, 0, 2)                      # (T, N, 2)
+            valid = self.valid[:, steps].T.copy()
+        else:
+            position = np.asarray(agents[0], dtype=np.float64)[None, :, :2]         # (1, N, 2)
+            valid = np.broadcast_to(np.asarray(agents[3], dtype=bool), (T, len(self.track_ids))).copy()
+        valid[np.arange(T), ego_index] = False
+
+        agents_out = out[:, AGENTS].reshape(T, NUM_AGENTS, 7)
+        agents_out[:] = 0.0
+        rel = position - ego_position[:, None]
+        dist = np.linalg.norm(rel, axis=-1)
+        dist[~valid | (dist > RADIUS)] = np.inf
+        idx = _nearest(dist, NUM_AGENTS)
+        k = idx.shape[1]
+        found = np.isfinite(dist[rows, idx])
+        if agents is None:
+            vel = self.velocity[idx, steps[:, None]]
+            heading = self.heading[idx, steps[:, None]]
+        else:
+            vel = np.asarray(agents[1], dtype=np.float64)[:, :2][idx]
+            heading = np.asarray(agents[2], dtype=np.float64)[idx]
+        rel = np.broadcast_to(rel, (T,) + rel.shape[1:])[rows, idx]
+        agents_out[:, :k, 0:2] = _to_ego(rel, cos[:, None], sin[:, None]) / POSITION_SCALE
+        agents_out[:, :k, 2:4] = _to_ego(vel - ego_velocity[:, None], cos[:, None], sin[:, None]) / SPEED_SCALE
+        agents_out[:, :k, 4] = np.sin(heading - ego_heading[:, None])
+        agents_out[:, :k, 5] = np.cos(heading - ego_heading[:, None])
+        agents_out[:, :k, 6] = 1.0
+        agents_out[:, :k] *= found[..., None]
+
+        # 4. Nearest lane points, among those in the grid cells the rows can reach
+        lanes = out[:, LANES].reshape(T, NUM_LANE_POINTS, 3)
+        lanes[:] = 0.0
+        if len(self.lane_points) and T:
+            low, high = ego_position.min(axis=0), ego_position.max(axis=0)
+            candidates = self.map.candidates((low + high) / 2, (high - low) / 2 + RADIUS)
+            rel = self.lane_points[candidates][None] - ego_position[:, None]             # (T, C, 2)
+            dist = np.linalg.norm(rel, axis=-1)
+            dist[dist > RADIUS] = np.inf
+            idx = _nearest(dist, NUM_LANE_POINTS)
+            k = idx.shape[1]
+            found = np.isfinite(dist[rows, idx])
+            lanes[:, :k, 0:2] = _to_ego(rel[rows, idx], cos[:, None], sin[:, None]) / POSITION_SCALE
+            lanes[:, :k, 2] = 1.0
+            lanes[:, :k] *= found[..., None]
+
+        return out
+
+    def log_observations(self, track=None):
+        """(steps, observations) for every valid logged state of 'track' (default: the SDC)."""
+        track = self.sdc_index if track is None else track
+        steps = np.flatnonzero(self.valid[track])
+        obs = self.observations(
+            steps, self.position[track, steps], self.heading[track, steps], self.velocity[track, steps],
+            ego_index=np.full(len(steps), track),
+        )
+        return steps, obs
+
+    def log_expert_actions(self, steps, track=None):
+        """The online expert's actions (from the precomputed expert table) at the logged states 'steps'."""
+        return self.expert_table(self.sdc_index if track is None else track)["actions"][steps]
+
+
+def observation_space():
+    return gym.spaces.Box(-np.inf, np.inf, (OBSERVATION_DIM,), dtype=np.float32)
@@ -0,0 +1,175 @@
+"""
+Offline behavior cloning from the converted scenarios, with no simulator.
+
+Every logged SDC state becomes one (observation, expert action) pair, using the
+log-based observations of src.observations and the same expert rule the online
+env reports in info['expert_action']. DataLoader workers each featurize their own
+slice of the scenario index and emit shuffled, ready-made batches, so the
+training loop only moves one batch per step to the device.
+
+The result is an SB3 ActorCriticPolicy checkpoint that scripts/train_parallel.py
+loads into BC_PPO (with obs_mode="log") as a warm start.
+"""
+
+import time
+
+import numpy as np
+import torch as th
+import torch.nn.functional as F
+from gymnasium import spaces
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+from stable_baselines3.common.policies import ActorCriticPolicy
+
+from src.dataset_index import ScenarioIndex
+from src.observations import ScenarioFeatures, observation_space
+
+ACTION_SPACE = spaces.Box(-1.0, 1.0, (2,), dtype=np.float32)
+
+
+def scenario_demonstrations(scenario, all_vehicles=False):
+    """
+    (observations (T, D), expert actions (T, 2)) for the logged SDC states of one
+    scenario, or with all_vehicles=True for every logged vehicle as the ego.
+    """
+    features = ScenarioFeatures(scenario)
+    tracks = [features.sdc_index]
+    if all_vehicles:
+        tracks += [i for i, t in enumerate(features.track_types)
+                   if t.endswith("VEHICLE") and i != features.sdc_index and features.valid[i].sum() > 1]
+    obs, actions = [], []
+    for track in tracks:
+        steps, track_obs = features.log_observations(track)
+        obs.append(track_obs)
+        actions.append(features.log_expert_actions(steps, track))
+    return np.concatenate(obs), np.concatenate(actions)
+
+
+class DemonstrationDataset(IterableDataset):
+    """
+    Streams (observations, actions) batches out of a scenario index.
+
+    Each DataLoader worker takes every num_workers-th scenario of a per-epoch
+    permutation, mixes their samples in a shuffle buffer of 'shuffle_samples'
+    and yields numpy batches of 'batch_size'.
+    """
+    def __init__(self, index_dir, batch_size=4096, shuffle_samples=65536, seed=0, all_vehicles=False):
+        self.index_dir = index_dir
+        self.all_vehicles = all_vehicles
+        self.batch_size = batch_size
+        self.shuffle_samples = shuffle_samples
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        # Scenario count; the number of batches depends on the scenario lengths
+        return len(ScenarioIndex(self.index_dir))
+
+    def _scenarios(self):
+        index = ScenarioIndex(self.index_dir)
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        order = np.random.default_rng((self.seed, self.epoch)).permutation(len(index))
+        for i in order[worker_id::num_workers]:
+            try:
+                yield index.load(int(i))
+            except Exception as e:
+                print(f"⚠️ Skipping scenario {i}: {e}")
+
+    def __iter__(self):
+        worker = get_worker_info()
+        rng = np.random.default_rng((self.seed, self.epoch, worker.id if worker else 0))
+        obs_parts, act_parts, buffered = [], [], 0
+
+        for scenario in self._scenarios():
+            obs, actions = scenario_demonstrations(scenario, self.all_vehicles)
+            obs_parts.append(obs)
+            act_parts.append(actions)
+            buffered += len(obs)
+            if buffered >= self.shuffle_samples:
+                obs_parts, act_parts, buffered = yield from self._drain(rng, obs_parts, act_parts, final=False)
+
+        yield from self._drain(rng, obs_parts, act_parts, final=True)
+
+    def _drain(self, rng, obs_parts, act_parts, final):
+        """Yields full shuffled batches; returns the leftover (as new buffer state)."""
+        if not obs_parts:
+            return [], [], 0
+        obs = np.concatenate(obs_parts)
+        actions = np.concatenate(act_parts)
+        perm = rng.permutation(len(obs))
+        obs, actions = obs[perm], actions[perm]
+
+        n_full = len(obs) // self.batch_size * self.batch_size
+        for start in range(0, n_full, self.batch_size):
+            yield obs[start:start + self.batch_size], actions[start:start + self.batch_size]
+        if final and n_full < len(obs):
+            yield obs[n_full:], actions[n_full:]
+            return [], [], 0
+        return [obs[n_full:]], [actions[n_full:]], len(obs) - n_full
+
+
+def make_policy(learning_rate=3e-4, device="auto", **policy_kwargs):
+    """The same MlpPolicy network BC_PPO builds for the log observation space."""
+    policy = ActorCriticPolicy(observation_space(), ACTION_SPACE, lambda _: learning_rate, **policy_kwargs)
+    return policy.to(device if device != "auto" else ("cuda" if th.cuda.is_available() else "cpu"))
+
+
+def bc_loss(policy, observations, expert_actions):
+    # Same objective as BC_PPO's BC term: MSE of the mean action
+    return F.mse_loss(policy.get_distribution(observations).mode(), expert_actions)
+
+
+def pretrain(index_dir, out_path, epochs=5, batch_size=4096, workers=4, learning_rate=3e-4,
+             device="auto", shuffle_samples=65536, seed=0, log_every=100, all_vehicles=False):
+    """Trains a policy by offline BC and saves it to 'out_path'. Returns the policy."""
+    policy = make_policy(learning_rate, device)
+    device = policy.device
+    dataset = DemonstrationDataset(index_dir, batch_size, shuffle_samples, seed, all_vehicles)
+    print(f"📚 {len(dataset)} scenarios, {workers} loader workers, training on {device}")
+
+    policy.set_training_mode(True)
+    step = 0
+    for epoch in range(epochs):
+        # Workers get a fresh copy of the dataset (and its epoch) every iteration
+        dataset.epoch = epoch
+        loader = DataLoader(
+            dataset,
+            batch_size=None,
+            num_workers=workers,
+            pin_memory=device.type == "cuda",
+            prefetch_factor=4 if workers > 0 else None,
+        )
+        start, samples, losses = time.perf_counter(), 0, []
+        for obs, actions in loader:
+            obs = th.as_tensor(obs).to(device, non_blocking=True)
+            actions = th.as_tensor(actions).to(device, non_blocking=True)
+
+            loss = bc_loss(policy, obs, actions)
+            policy.optimizer.zero_grad()
+            loss.backward()
+            th.nn.utils.clip_grad_norm_(policy.parameters(), 0.5)
+            policy.optimizer.step()
+
+            losses.append(loss.item())
+            samples += len(obs)
+            step += 1
+            if log_every and step % log_every == 0:
+                print(f"   step {step}: bc loss {np.mean(losses[-log_every:]):.4f}")
+
+        elapsed = time.perf_counter() - start
+        print(f"🧠 Epoch {epoch + 1}/{epochs}: bc loss {np.mean(losses) if losses else float('nan'):.4f}, "
+              f"{samples} samples, {samples / max(elapsed, 1e-9):.0f} samples/s")
+        policy.save(out_path)
+
+    return policy
+
+
+def load_pretrained(model, path):
+    """Copies the weights of a pretrain() checkpoint into 'model' (a BC_PPO / PPO)."""
+    pretrained = ActorCriticPolicy.load(path, device=model.device)
+    if pretrained.observation_space.shape != model.observation_space.shape:
+        raise ValueError(
+            f"Checkpoint observations {pretrained.observation_space.shape} do not match the env's "
+            f"{model.observation_space.shape} (train with obs_mode='log')"
+        )
+    model.policy.load_state_dict(pretrained.state_dict())
@@ -0,0 +1,87 @@
+import queue
+import threading
+
+
+class ScenarioPrefetcher:
+    """
+    Loads upcoming scenarios on a background thread.
+
+    'pick_fn()' chooses the next scenario index and 'load_fn(index)' returns
+    (scenario_data, file_name). Up to 'depth' decoded scenarios wait in a ready
+    queue, so an episode reset only has to pop one.
+
+    A load error is handed to the caller with its index. A pick_fn error stops
+    the thread and is re-raised by get(), as is the thread dying for any other
+    reason, so a reset never waits on a loader that is gone.
+    """
+    def __init__(self, load_fn, pick_fn, depth=2):
+        self.load_fn = load_fn
+        self.pick_fn = pick_fn
+        self.depth = depth
+        self.hits = 0
+        self.misses = 0
+        self._error = None
+
+        self._ready = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="scenario-prefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                index = self.pick_fn()
+            except Exception as e:
+                # Without an index there is nothing to retry; get() re-raises
+                self._error = e
+                return
+            try:
+                scenario_data, file_name = self.load_fn(index)
+                item = (index, scenario_data, file_name, None)
+            except Exception as e:
+                item = (index, None, None, e)
+
+            # Block while the queue is full, but keep checking for close()
+            while not self._stop.is_set():
+                try:
+                    self._ready.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def get(self):
+        """
+        Returns (index, scenario_data, file_name, error) of the next scenario.
+        A miss means reset had to wait for the loader thread.
+        """
+        try:
+            item = self._ready.get_nowait()
+            self.hits += 1
+            return item
+        except queue.Empty:
+            self.misses += 1
+
+        # Wait in short slices so a dead loader thread surfaces as an error
+        while True:
+            try:
+                return self._ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            if not self._thread.is_alive() and self._ready.empty():
+                if self._error is not None:
+                    raise RuntimeError("Scenario prefetch thread failed") from self._error
+                raise RuntimeError("Scenario prefetch thread is not running")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "depth": self.depth,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "ready": self._ready.qsize(),
+        }
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
@@ -0,0 +1,180 @@
+"""
+Low-overhead hot-path instrumentation.
+
+Named timers (perf_counter, a lock and two adds per call) accumulate in a
+per-process registry, 'timers'. Every env worker exposes its own through
+DirectWaymoEnv.timing_stats(); TimingCallback collects them at the end of each
+rollout, together with the trainer's, and logs them to TensorBoard:
+
+    timing/<name>/mean_ms           mean duration of one call, over all workers
+    timing/<name>/total_s           time spent in it since the last rollout, summed over workers
+    timing/<name>/slowest_worker_s  the largest per-worker total (stragglers)
+
+For one-off deep dives, SamplingProfiler samples the Python stacks of a
+process every few milliseconds on a background thread and dumps them in the
+folded-stack format read by flamegraph.pl and speedscope.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+from src.async_vec_env import env_method_all_workers
+
+
+class Timers:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # name -> [calls, total seconds, max seconds]
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of time()."""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+        return decorator
+
+    def snapshot(self, reset=True):
+        """{name: {"calls", "total_s", "max_s"}}; reset=True starts a new window."""
+        with self._lock:
+            stats = {name: {"calls": c, "total_s": t, "max_s": m} for name, (c, t, m) in self._stats.items()}
+            if reset:
+                self._stats = {}
+        return stats
+
+
+# One registry per process (each env worker has its own)
+timers = Timers()
+
+
+def merge_snapshots(snapshots):
+    """Aggregates per-worker snapshots into {name: {mean_ms, total_s, slowest_worker_s, calls}}."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, stats in snapshot.items():
+            entry = merged.setdefault(name, {"calls": 0, "total_s": 0.0, "slowest_worker_s": 0.0})
+            entry["calls"] += stats["calls"]
+            entry["total_s"] += stats["total_s"]
+            entry["slowest_worker_s"] = max(entry["slowest_worker_s"], stats["total_s"])
+    for entry in merged.values():
+        entry["mean_ms"] = 1000.0 * entry["total_s"] / max(entry["calls"], 1)
+    return merged
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a daemon thread snapshots the stacks of all other
+    threads of this process every 'interval' seconds via sys._current_frames()
+    and counts identical stacks. The profiled code runs unmodified.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def dump(self, path):
+        """Writes 'stack count' lines (folded stacks), most frequent first."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class TimingCallback(BaseCallback):
+    """
+    Logs the trainer's timers and every env worker's (collected through
+    env_method("timing_stats"), spare workers included) under timing/ at the
+    end of each rollout.
+    Envs without timing_stats() only contribute the trainer's timers.
+    """
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self._worker_timers = True
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        snapshots = [timers.snapshot()]
+        if self._worker_timers:
+            try:
+                snapshots += env_method_all_workers(self.training_env, "timing_stats")
+            except AttributeError:
+                self._worker_timers = False
+        merged = merge_snapshots(snapshots)
+        for name, stats in sorted(merged.items()):
+            self.logger.record(f"timing/{name}/mean_ms", stats["mean_ms"])
+            self.logger.record(f"timing/{name}/total_s", stats["total_s"])
+            self.logger.record(f"timing/{name}/slowest_worker_s", stats["slowest_worker_s"])
+        if self.verbose and merged:
+            top = sorted(merged.items(), key=lambda item: -item[1]["total_s"])[:5]
+            print("⏱️ " + ", ".join(f"{name} {stats['total_s']:.1f}s" for name, stats in top))
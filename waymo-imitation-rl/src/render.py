@@ -0,0 +1,384 @@
+"""
+Top-down video rendering, off the simulation loop.
+
+During a rollout, TraceRecorder keeps only compact per-step state: the pose
+(x, y, heading) of every object, its box size and which one is the ego.
+Nothing is drawn while the simulator runs. Afterwards, render_video()
+rasterizes the frames at the target frame rate in a worker pool. Poses are
+interpolated between simulation steps, and the map polylines and oriented
+agent boxes are drawn with NumPy (no MetaDrive, no pygame). Frames are
+streamed to the imageio writer in order. Only a few chunks per worker are in
+flight at any time, so memory does not grow with the episode length.
+
+The same rasterizer replays logs without a simulator: scenario_trace() turns a
+converted scenario dict into a trace, thumbnail() draws one still of a whole
+scene, and render_file() is the per-file job of scripts/render_dataset.py.
+Traces can be saved with save_trace() (scripts/visualize.py --save-traces) and
+rendered again later.
+
+A trace is a plain dict of arrays:
+
+    position      (T, N, 2)  float32
+    heading       (T, N)     float32
+    valid         (T, N)     bool
+    size          (N, 2)     float32 box length, width
+    ego           ()         column of the ego (drawn in its own color, camera follows it)
+    dt            ()         seconds between steps
+    map_points    (P, 2)     float32 map polylines, concatenated
+    map_offsets   (F+1,)     CSR offsets of each feature's points
+    map_kinds     (F,)       uint8 index into MAP_COLORS
+"""
+
+import multiprocessing as mp
+import os
+import pickle
+from collections import deque
+
+import imageio
+import numpy as np
+
+DT = 0.1  # s, Waymo logs / MetaDrive ScenarioEnv step
+
+# Map feature kinds, drawn in this order (later ones on top)
+LANE, ROAD_LINE, AREA, ROAD_EDGE = range(4)
+MAP_COLORS = np.array([[70, 70, 70], [130, 130, 130], [90, 80, 50], [220, 220, 220]], dtype=np.uint8)
+BACKGROUND = np.array([25, 25, 25], dtype=np.uint8)
+AGENT_COLOR = np.array([60, 130, 230], dtype=np.uint8)
+EGO_COLOR = np.array([230, 70, 60], dtype=np.uint8)
+
+FRAMES_PER_TASK = 8
+FIT_MARGIN = 10.0  # m around the agents when the camera fits the whole scene
+
+
+def map_kind(feature):
+    """MAP_COLORS index of a converted map feature (by its MetaDrive type)."""
+    kind = str(feature.get("type", "")).upper()
+    if "LANE" in kind:
+        return LANE
+    if "BOUNDARY" in kind or "EDGE" in kind:
+        return ROAD_EDGE
+    if "polygon" in feature:
+        return AREA
+    return ROAD_LINE
+
+
+def map_arrays(map_features):
+    """(map_points, map_offsets, map_kinds) of a scenario's map_features; polygons are closed."""
+    lines, kinds = [], []
+    for feature in map_features.values():
+        points = feature.get("polyline", feature.get("polygon"))
+        if points is None or not len(points):
+            continue
+        points = np.asarray(points, dtype=np.float32)[:, :2]
+        if "polygon" in feature and "polyline" not in feature:
+            points = np.concatenate([points, points[:1]])
+        lines.append(points)
+        kinds.append(map_kind(feature))
+    counts = [len(line) for line in lines]
+    return (np.concatenate(lines) if lines else np.zeros((0, 2), dtype=np.float32),
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            np.array(kinds, dtype=np.uint8))
+
+
+def metadrive_objects(env):
+    """{object id: (x, y, heading, length, width)} of the vehicles / pedestrians / cyclists in a MetaDrive env."""
+    objects = {}
+    for obj_id, obj in env.engine.get_objects().items():
+        if not hasattr(obj, "heading_theta"):
+            continue  # traffic lights, static props
+        length = getattr(obj, "top_down_length", None) or getattr(obj, "LENGTH", 1.0)
+        width = getattr(obj, "top_down_width", None) or getattr(obj, "WIDTH", 1.0)
+        x, y = obj.position[:2]
+        objects[obj_id] = (x, y, obj.heading_theta, length, width)
+    return objects
+
+
+class TraceRecorder:
+    """
+    Collects one episode's trace. Call record() once per step (including right
+    after reset) with the objects of that step, then trace() at the end.
+    """
+    def __init__(self, map_features, dt=DT):
+        self.dt = dt
+        self.map = map_arrays(map_features)
+        self._columns = {}  # object id -> column
+        self._sizes = []
+        self._steps = []    # per step: (columns (k,), poses (k, 3))
+        self._ego = None
+
+    def record(self, objects, ego_id):
+        """'objects': {id: (x, y, heading, length, width)}, e.g. from metadrive_objects()."""
+        columns = np.empty(len(objects), dtype=np.int32)
+        poses = np.empty((len(objects), 3), dtype=np.float32)
+        for i, (obj_id, (x, y, heading, length, width)) in enumerate(objects.items()):
+            column = self._columns.get(obj_id)
+            if column is None:
+                column = self._columns[obj_id] = len(self._sizes)
+                self._sizes.append((length, width))
+            columns[i] = column
+            poses[i] = (x, y, heading)
+        self._ego = self._columns.get(ego_id, self._ego)
+        self._steps.append((columns, poses))
+
+    def __len__(self):
+        return len(self._steps)
+
+    def trace(self):
+        T, N = len(self._steps), len(self._sizes)
+        position = np.zeros((T, N, 2), dtype=np.float32)
+        heading = np.zeros((T, N), dtype=np.float32)
+        valid = np.zeros((T, N), dtype=bool)
+        for t, (columns, poses) in enumerate(self._steps):
+            position[t, columns] = poses[:, :2]
+            heading[t, columns] = poses[:, 2]
+            valid[t, columns] = True
+        map_points, map_offsets, map_kinds = self.map
+        return {
+            "position": position, "heading": heading, "valid": valid,
+            "size": np.array(self._sizes, dtype=np.float32).reshape(N, 2),
+            "ego": -1 if self._ego is None else self._ego, "dt": self.dt,
+            "map_points": map_points, "map_offsets": map_offsets, "map_kinds": map_kinds,
+        }
+
+
+def scenario_trace(scenario):
+    """Trace of a converted scenario's log (all tracks, the SDC as ego), no simulator needed."""
+    tracks = scenario["tracks"]
+    track_ids = list(tracks)
+    states = [tracks[t_id]["state"] for t_id in track_ids]
+    valid = np.stack([np.asarray(s["valid"]).astype(bool) for s in states], axis=1)
+    first = np.argmax(valid, axis=0)
+    sizes = []
+    for state, step in zip(states, first):
+        size = np.asarray(state["size"], dtype=np.float32)
+        sizes.append(size[:2] if size.ndim == 1 else size[step, :2])
+    map_points, map_offsets, map_kinds = map_arrays(scenario["map_features"])
+    sdc_id = scenario["metadata"].get("sdc_id")
+    return {
+        "position": np.stack([np.asarray(s["position"], dtype=np.float32)[:, :2] for s in states], axis=1),
+        "heading": np.stack([np.asarray(s["heading"], dtype=np.float32) for s in states], axis=1),
+        "valid": valid,
+        "size": np.array(sizes, dtype=np.float32).reshape(len(states), 2),
+        "ego": track_ids.index(sdc_id) if sdc_id in tracks else -1, "dt": DT,
+        "map_points": map_points, "map_offsets": map_offsets, "map_kinds": map_kinds,
+    }
+
+
+def save_trace(path, trace):
+    np.savez_compressed(path, **trace)
+
+
+def load_trace(path):
+    with np.load(path) as data:
+        trace = {key: data[key] for key in data.files}
+    trace["ego"], trace["dt"] = int(trace["ego"]), float(trace["dt"])
+    return trace
+
+
+def thumbnail(trace, size=(256, 256), time=0.0):
+    """One still of the whole scene: map, every logged trajectory and the boxes at 'time' s."""
+    return Rasterizer(trace, size, scale=None).frame(time, trails=True)
+
+
+def _densify(points, offsets, kinds, spacing):
+    """Points every <= 'spacing' m along each polyline, with the kind of their feature."""
+    feature = np.repeat(np.arange(len(kinds)), np.diff(offsets))
+    # Segments i -> i + 1 inside a feature
+    inner = np.flatnonzero(feature[:-1] == feature[1:]) if len(points) > 1 else np.zeros(0, dtype=np.int64)
+    start, delta = points[inner], points[inner + 1] - points[inner]
+    count = np.maximum(np.ceil(np.linalg.norm(delta, axis=1) / spacing).astype(np.int64), 1)
+    segment = np.repeat(np.arange(len(inner)), count)
+    t = (np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)) / count[segment]
+    dense = np.concatenate([start[segment] + delta[segment] * t[:, None], points])
+    dense_kinds = np.concatenate([kinds[feature[inner]][segment], kinds[feature]])
+    # Draw order: later kinds over earlier ones
+    order = np.argsort(dense_kinds, kind="stable")
+    return dense[order].astype(np.float32), dense_kinds[order]
+
+
+class Rasterizer:
+    """
+    Draws frames of one trace: 'size' (width, height) pixels, north up,
+    'scale' pixels per m centered on the ego (or on the scene when the trace
+    has none). scale=None fits a fixed camera to everything the agents cover.
+    """
+    def __init__(self, trace, size=(400, 400), scale=5.0):
+        self.trace = trace
+        self.width, self.height = size
+        position, valid = trace["position"], trace["valid"]
+        ego = int(trace["ego"])
+
+        if scale is None:
+            # Whole scene: bounding box of all valid positions plus a margin
+            points = position[valid] if valid.any() else np.zeros((1, 2), dtype=np.float32)
+            low, high = points.min(axis=0) - FIT_MARGIN, points.max(axis=0) + FIT_MARGIN
+            scale = min(self.width / (high[0] - low[0]), self.height / (high[1] - low[1]))
+            self.center = np.broadcast_to((low + high) / 2, (len(valid), 2))
+        elif ego >= 0:
+            # Camera holds the last valid ego position over gaps
+            steps = np.where(valid[:, ego], np.arange(len(valid)), 0)
+            self.center = position[np.maximum.accumulate(steps), ego]
+        else:
+            counts = np.maximum(valid.sum(axis=1, keepdims=True), 1)
+            self.center = (position * valid[..., None]).sum(axis=1) / counts
+        self.scale = scale
+        self.map_points, self.map_kinds = _densify(trace["map_points"], trace["map_offsets"],
+                                                   trace["map_kinds"], 0.5 / scale)
+        self.map_colors = MAP_COLORS[self.map_kinds]
+        # Patch wide enough for the largest box at any heading
+        half = int(np.ceil(np.hypot(*trace["size"].max(axis=0, initial=1.0)) * scale / 2)) + 1
+        grid = np.arange(-half, half + 1)
+        self._patch = np.stack(np.meshgrid(grid, grid, indexing="ij"), axis=-1).reshape(-1, 2)
+
+    def state(self, time):
+        """(position, heading, valid, camera center) at 'time' s, linearly interpolated between steps."""
+        trace = self.trace
+        x = min(max(time / trace["dt"], 0.0), len(trace["valid"]) - 1)
+        i = int(x)
+        j, f = min(i + 1, len(trace["valid"]) - 1), x - i
+        valid = trace["valid"][i]
+        both = valid & trace["valid"][j]
+        position = trace["position"][i].copy()
+        heading = trace["heading"][i].copy()
+        if f > 0 and both.any():
+            position[both] += f * (trace["position"][j, both] - position[both])
+            turn = (trace["heading"][j, both] - heading[both] + np.pi) % (2 * np.pi) - np.pi
+            heading[both] += f * turn
+        center = self.center[i] + f * (self.center[j] - self.center[i])
+        return position, heading, valid, center
+
+    def _to_pixels(self, points, center):
+        # x right, y up
+        px = (points[..., 0] - center[0]) * self.scale + self.width / 2
+        py = self.height / 2 - (points[..., 1] - center[1]) * self.scale
+        return px, py
+
+    def _draw_points(self, image, points, colors, center):
+        px, py = self._to_pixels(points, center)
+        px, py = np.floor(px).astype(np.int64), np.floor(py).astype(np.int64)
+        inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+        image[py[inside], px[inside]] = colors[inside] if colors.ndim > 1 else colors
+
+    def frame(self, time, trails=False):
+        """(height, width, 3) uint8 image at 'time' s; trails=True also draws every logged position."""
+        image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        image[:] = BACKGROUND
+        position, heading, valid, center = self.state(time)
+
+        # 1. Map (and trajectories)
+        self._draw_points(image, self.map_points, self.map_colors, center)
+        if trails:
+            trace, ego = self.trace, int(self.trace["ego"])
+            others = trace["valid"].copy()
+            if ego >= 0:
+                others[:, ego] = False
+            self._draw_points(image, trace["position"][others], AGENT_COLOR // 2, center)
+            if ego >= 0:
+                self._draw_points(image, trace["position"][trace["valid"][:, ego], ego], EGO_COLOR // 2, center)
+
+        # 2. Boxes: every pixel of a patch around each agent, kept if it falls in the box
+        agents = np.flatnonzero(valid)
+        ego = int(self.trace["ego"])
+        agents = np.concatenate([agents[agents != ego], [ego] if ego >= 0 and valid[ego] else []]).astype(np.int64)
+        if len(agents):
+            cx, cy = self._to_pixels(position[agents], center)
+            pixels = np.round(np.stack([cx, cy], axis=-1))[:, None, :] + self._patch[None]   # (A, K, 2)
+            # Pixel p covers [p, p + 1)
+            dx = (pixels[..., 0] + 0.5 - cx[:, None]) / self.scale
+            dy = -(pixels[..., 1] + 0.5 - cy[:, None]) / self.scale
+            cos, sin = np.cos(heading[agents])[:, None], np.sin(heading[agents])[:, None]
+            lon, lat = dx * cos + dy * sin, -dx * sin + dy * cos
+            size = self.trace["size"][agents]
+            hit = ((np.abs(lon) <= size[:, :1] / 2) & (np.abs(lat) <= size[:, 1:] / 2)
+                   & (pixels[..., 0] >= 0) & (pixels[..., 0] < self.width)
+                   & (pixels[..., 1] >= 0) & (pixels[..., 1] < self.height))
+            colors = np.where((agents == ego)[:, None], EGO_COLOR, AGENT_COLOR)
+            a, k = np.nonzero(hit)  # row-major: the ego (last) is written last
+            image[pixels[a, k, 1].astype(np.int64), pixels[a, k, 0].astype(np.int64)] = colors[a]
+        return image
+
+
+# Per-process rasterizers, set by _init_worker
+_RASTERIZERS = None
+
+
+def _init_worker(traces, size, scale):
+    global _RASTERIZERS
+    _RASTERIZERS = [Rasterizer(trace, size, scale) for trace in traces]
+
+
+def _render_frames(clip, times):
+    rasterizer = _RASTERIZERS[clip]
+    return np.stack([rasterizer.frame(t) for t in times])
+
+
+def frame_times(trace, fps):
+    """Frame timestamps of a trace played back in real time at 'fps'."""
+    duration = (len(trace["valid"]) - 1) * trace["dt"]
+    return np.arange(int(np.floor(duration * fps + 1e-6)) + 1) / fps
+
+
+def render_video(traces, path, fps=20, workers=None, size=(400, 400), scale=5.0, start_method=None, **writer_options):
+    """
+    Rasterizes 'traces' back to back into one video at 'path' (any format imageio
+    can write, e.g. .gif; .mp4 needs imageio-ffmpeg) with 'workers' processes
+    (0 = in this process). Returns the number of frames written.
+    """
+    if workers is None:
+        workers = mp.cpu_count()
+    tasks = [(clip, times[i:i + FRAMES_PER_TASK])
+             for clip, trace in enumerate(traces)
+             for times in [frame_times(trace, fps)]
+             for i in range(0, len(times), FRAMES_PER_TASK)]
+    if path.lower().endswith(".gif"):
+        writer_options.setdefault("loop", 0)
+
+    written = 0
+    with imageio.get_writer(path, fps=fps, **writer_options) as writer:
+        if workers <= 0:
+            _init_worker(traces, size, scale)
+            for task in tasks:
+                for frame in _render_frames(*task):
+                    writer.append_data(frame)
+                    written += 1
+            return written
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        with mp.get_context(start_method).Pool(workers, _init_worker, (traces, size, scale)) as pool:
+            # Bounded window of chunks in flight, written strictly in order
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_render_frames, task))
+                if len(pending) >= 2 * workers:
+                    for frame in pending.popleft().get():
+                        writer.append_data(frame)
+                        written += 1
+            while pending:
+                for frame in pending.popleft().get():
+                    writer.append_data(frame)
+                    written += 1
+    return written
+
+
+def render_file(path, out_dir, fmt="png", size=(256, 256), scale=None, fps=10, time=0.0):
+    """
+    Renders one converted scenario (.pkl) or saved trace (.npz) into 'out_dir':
+    a thumbnail (fmt="png") or its whole replay (fmt="gif"). Returns (output path, error).
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    out_path = os.path.join(out_dir, f"{name}.{fmt}")
+    try:
+        if path.endswith(".npz"):
+            trace = load_trace(path)
+        else:
+            with open(path, "rb") as f:
+                trace = scenario_trace(pickle.load(f))
+        if fmt == "gif":
+            render_video([trace], out_path, fps=fps, workers=0, size=size, scale=scale)
+        else:
+            imageio.imwrite(out_path, thumbnail(trace, size, time) if scale is None
+                            else Rasterizer(trace, size, scale).frame(time, trails=True))
+        return out_path, None
+    except Exception as e:
+        return out_path, f"Error rendering {path}: {e}"
@@ -0,0 +1,235 @@
+"""
+Scenario samplers: which scenario the next episode is played on.
+
+    uniform       every scenario equally often
+    difficulty    weighted by scenario metadata (length, agent density, curvature)
+    prioritized   weighted by the recent failure rate of each scenario, fed back
+                  from the episode-end info dict
+
+Weighted samplers keep their weights in a SumTree, so drawing a scenario and
+changing one weight are both O(log n), also with millions of scenarios.
+"""
+
+import threading
+
+import numpy as np
+
+
+class SumTree:
+    """
+    Binary tree over 'capacity' non-negative weights where every node holds the
+    sum of its children. Leaf i lives at node capacity + i (capacity is rounded
+    up to a power of two); the root (node 1) holds the total.
+    """
+    def __init__(self, capacity):
+        self.size = capacity
+        self.capacity = 1 << max(0, int(capacity - 1).bit_length())
+        self.nodes = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, index):
+        return self.nodes[self.capacity + np.asarray(index)]
+
+    def set_all(self, weights):
+        """Replaces every weight at once, O(n)."""
+        weights = np.asarray(weights, dtype=np.float64)
+        self.nodes[:] = 0.0
+        self.nodes[self.capacity:self.capacity + len(weights)] = weights
+        level = self.capacity
+        while level > 1:
+            # Parents of nodes [level, 2 * level) are [level // 2, level)
+            children = self.nodes[level:2 * level]
+            self.nodes[level // 2:level] = children[0::2] + children[1::2]
+            level //= 2
+
+    def update(self, index, weight):
+        # Recompute the path to the root from the children (no drift from += deltas)
+        nodes = self.nodes
+        node = self.capacity + int(index)
+        nodes[node] = weight
+        node //= 2
+        while node >= 1:
+            nodes[node] = nodes[2 * node] + nodes[2 * node + 1]
+            node //= 2
+
+    def find_one(self, value):
+        """Scalar find(): a plain loop beats array ops for a single draw."""
+        nodes = self.nodes
+        node = 1
+        while node < self.capacity:
+            left = nodes[2 * node]
+            if value >= left:
+                value -= left
+                node = 2 * node + 1
+            else:
+                node = 2 * node
+        return min(node - self.capacity, self.size - 1)
+
+    def find(self, values):
+        """Leaf indices whose cumulative-weight interval contains each of 'values'."""
+        values = np.array(values, dtype=np.float64, ndmin=1)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            left_sum = self.nodes[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        # Guard against rounding at the right edge landing on a zero-weight leaf
+        return np.minimum(nodes - self.capacity, self.size - 1)
+
+    def sample(self, rng, n=1):
+        return self.find(rng.random(n) * self.total)
+
+
+class ScenarioSampler:
+    """
+    Base class. Subclasses implement sample(rng) and optionally update(); both
+    may be called from different threads (the prefetcher samples ahead).
+    """
+    def __init__(self, num_scenarios):
+        self.num_scenarios = num_scenarios
+        self._lock = threading.Lock()
+
+    def sample(self, rng):
+        raise NotImplementedError
+
+    def update(self, index, info):
+        """Feedback at the end of an episode played on scenario 'index'."""
+
+    def stats(self):
+        return {}
+
+
+class UniformSampler(ScenarioSampler):
+    def sample(self, rng):
+        return int(rng.integers(0, self.num_scenarios))
+
+
+class WeightedSampler(ScenarioSampler):
+    """Samples proportionally to fixed (or externally updated) weights."""
+    def __init__(self, num_scenarios, weights=None):
+        super().__init__(num_scenarios)
+        self.tree = SumTree(num_scenarios)
+        self.tree.set_all(np.ones(num_scenarios) if weights is None else weights)
+
+    def sample(self, rng):
+        with self._lock:
+            return self.tree.find_one(rng.random() * self.tree.total)
+
+    def set_weight(self, index, weight):
+        with self._lock:
+            self.tree.update(index, weight)
+
+    def probability(self, index):
+        return self.tree.get(index) / self.tree.total
+
+
+class DifficultySampler(WeightedSampler):
+    """
+    Weights scenarios by metadata from the scenario index. Every feature is
+    rank-normalized to [0, 1]; the weight is
+
+        floor + sum(feature_weight * normalized_feature)
+
+    so 'floor' keeps easy scenarios in the mix.
+    """
+    DEFAULT_FEATURES = {"length": 1.0, "agent_density": 1.0, "curvature": 1.0}
+
+    def __init__(self, scenario_index, features=None, floor=0.1):
+        features = features or self.DEFAULT_FEATURES
+        self.features = features
+        raw = difficulty_features(scenario_index)
+        weights = np.full(len(scenario_index), floor, dtype=np.float64)
+        for name, w in features.items():
+            weights += w * _rank_normalize(raw[name])
+        super().__init__(len(scenario_index), weights)
+
+
+class PrioritizedSampler(WeightedSampler):
+    """
+    Prioritized by recent failure rate. Each scenario keeps an exponential moving
+    average of its episode failures (an episode fails unless the agent reached
+    its destination); its weight is (failure_rate + eps) ** alpha.
+
+    Unplayed scenarios start at failure rate 'initial', so new data gets visited.
+    """
+    def __init__(self, num_scenarios, alpha=1.0, eps=0.05, decay=0.7, initial=1.0,
+                 success_key="arrive_dest"):
+        self.alpha = alpha
+        self.eps = eps
+        self.decay = decay
+        self.success_key = success_key
+        self.failure_rate = np.full(num_scenarios, initial, dtype=np.float32)
+        self.episodes = np.zeros(num_scenarios, dtype=np.int32)
+        super().__init__(num_scenarios, self._priority(self.failure_rate))
+
+    def _priority(self, failure_rate):
+        return (np.asarray(failure_rate, dtype=np.float64) + self.eps) ** self.alpha
+
+    def update(self, index, info):
+        failed = 0.0 if info.get(self.success_key, False) else 1.0
+        with self._lock:
+            rate = failed if self.episodes[index] == 0 else (
+                self.decay * self.failure_rate[index] + (1.0 - self.decay) * failed)
+            self.failure_rate[index] = rate
+            self.episodes[index] += 1
+            self.tree.update(index, self._priority(rate))
+
+    def stats(self):
+        played = self.episodes > 0
+        return {
+            "played": int(played.sum()),
+            "mean_failure_rate": float(self.failure_rate[played].mean()) if played.any() else 0.0,
+        }
+
+
+def _rank_normalize(values):
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return np.zeros(len(values))
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="stable")] = np.arange(len(values))
+    return ranks / (len(values) - 1)
+
+
+def difficulty_features(scenario_index):
+    """Per-scenario difficulty features from the scenario index metadata columns."""
+    num_tracks = np.asarray(scenario_index.column("num_tracks"), dtype=np.float64)
+    path_length = np.asarray(scenario_index.column("sdc_path_length"), dtype=np.float64)
+    heading_change = np.asarray(scenario_index.column("sdc_heading_change"), dtype=np.float64)
+    return {
+        "length": np.asarray(scenario_index.column("length"), dtype=np.float64),
+        # Waymo clips cover similar areas, so the agent count stands in for density
+        "agent_density": num_tracks,
+        # Total turning of the SDC per meter driven
+        "curvature": heading_change / np.maximum(path_length, 1.0),
+    }
+
+
+SAMPLERS = {
+    "uniform": UniformSampler,
+    "difficulty": DifficultySampler,
+    "prioritized": PrioritizedSampler,
+}
+
+
+def make_sampler(spec, num_scenarios, scenario_index=None):
+    """
+    Builds a sampler from a name or a {"type": name, **kwargs} dict, e.g.
+    {"type": "prioritized", "alpha": 0.6}. A sampler instance is returned as is.
+    """
+    if isinstance(spec, ScenarioSampler):
+        return spec
+    spec = {"type": spec or "uniform"} if not isinstance(spec, dict) else dict(spec)
+    kind = spec.pop("type", "uniform")
+    if kind not in SAMPLERS:
+        raise ValueError(f"Unknown scenario sampler '{kind}' (choose from {', '.join(SAMPLERS)})")
+    if kind == "difficulty":
+        if scenario_index is None:
+            raise ValueError("The 'difficulty' sampler needs a scenario index (scripts/build_index.py)")
+        return DifficultySampler(scenario_index, **spec)
+    return SAMPLERS[kind](num_scenarios, **spec)
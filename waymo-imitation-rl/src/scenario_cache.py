@@ -0,0 +1,233 @@
+"""
+Size-bounded LRU scenario cache shared by all vectorized workers.
+
+Every cached scenario is one file on a shared-memory filesystem (/dev/shm):
+
+    [header][pickle-5 stream][out-of-band array buffers, 64-byte aligned]
+
+The arrays are pickled out of band, so a reader mmaps the file and gets its
+numpy arrays as zero-copy views onto the shared pages; only the small dict
+structure is unpickled. A fixed-size index table (also mmapped) records the
+key, size and last use of every entry. Inserts evict least-recently-used
+entries until the total fits the byte budget. Table updates are serialized
+with flock, so any process can attach to the cache knowing only its path.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from itertools import count
+
+import numpy as np
+
+TABLE_FILE = "index.bin"
+LOCK_FILE = "lock"
+ALIGN = 64
+
+_HEADER = struct.Struct("<QQ")  # pickle length, number of buffers
+_BUFFER = struct.Struct("<QQ")  # buffer offset, buffer length
+
+# Header of the index table: budget, capacity, resident bytes, clock, hits, misses, evictions
+_TABLE_HEADER = 8
+_SLOT = np.dtype([("key", "<u8"), ("nbytes", "<i8"), ("last_used", "<i8"), ("generation", "<i8")])
+
+
+def default_cache_dir(name="waymo_scenario_cache"):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, name)
+
+
+def cache_key(key):
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    # 0 marks an empty slot
+    return int.from_bytes(digest, "little") or 1
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class SharedScenarioCache:
+    def __init__(self, path=None, budget_bytes=4 * 1024**3, capacity=65536):
+        self.path = path or default_cache_dir()
+        os.makedirs(self.path, exist_ok=True)
+        # flock excludes other processes, threads of this one share the lock file
+        self._thread_lock = threading.Lock()
+        self._generations = count(1)
+        self._lock_fd = os.open(os.path.join(self.path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+
+        table_path = os.path.join(self.path, TABLE_FILE)
+        table_bytes = _TABLE_HEADER * 8 + capacity * _SLOT.itemsize
+        with self._locked():
+            # The first process creates the table, everyone else attaches to it
+            if not os.path.exists(table_path) or os.path.getsize(table_path) < _TABLE_HEADER * 8:
+                with open(table_path, "wb") as f:
+                    f.truncate(table_bytes)
+                self._map_table(table_path)
+                self._header[0] = budget_bytes
+                self._header[1] = capacity
+            else:
+                self._map_table(table_path)
+
+        self.budget_bytes = int(self._header[0])
+        self.capacity = int(self._header[1])
+
+    def _map_table(self, table_path):
+        with open(table_path, "r+b") as f:
+            self._table_mm = mmap.mmap(f.fileno(), 0)
+        self._header = np.frombuffer(self._table_mm, dtype="<i8", count=_TABLE_HEADER)
+        self._slots = np.frombuffer(self._table_mm, dtype=_SLOT, offset=_TABLE_HEADER * 8)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _entry_path(self, key, generation):
+        return os.path.join(self.path, f"{key:016x}_{generation}.bin")
+
+    def _tick(self):
+        self._header[3] += 1
+        return self._header[3]
+
+    # --- Reading ---------------------------------------------------------------
+
+    def get(self, key):
+        """Returns the cached object for 'key' or None."""
+        k = cache_key(key)
+        with self._locked():
+            hit = np.flatnonzero(self._slots["key"] == k)
+            if len(hit) == 0:
+                self._header[5] += 1
+                return None
+            slot = hit[0]
+            self._slots["last_used"][slot] = self._tick()
+            entry_path = self._entry_path(k, self._slots["generation"][slot])
+
+        # Counted once the outcome is known
+        try:
+            value = self._read(entry_path)
+        except (FileNotFoundError, ValueError):
+            # Evicted between the lookup and the read
+            with self._locked():
+                self._header[5] += 1
+            return None
+        with self._locked():
+            self._header[4] += 1
+        return value
+
+    @staticmethod
+    def _read(entry_path):
+        with open(entry_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        pickle_len, n_buffers = _HEADER.unpack_from(view, 0)
+        pos = _HEADER.size
+        buffers = []
+        for _ in range(n_buffers):
+            offset, length = _BUFFER.unpack_from(view, pos)
+            buffers.append(view[offset:offset + length])
+            pos += _BUFFER.size
+        # Arrays are rebuilt as read-only views onto the mapping (no copy)
+        return pickle.loads(view[pos:pos + pickle_len], buffers=buffers)
+
+    # --- Writing ---------------------------------------------------------------
+
+    def put(self, key, obj):
+        """Caches 'obj' under 'key'. Returns False if it does not fit the budget."""
+        buffers = []
+        payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+
+        pos = _HEADER.size + _BUFFER.size * len(raws) + len(payload)
+        layout = []
+        for raw in raws:
+            pos = _align(pos)
+            layout.append((pos, raw.nbytes))
+            pos += raw.nbytes
+        nbytes = pos
+        if nbytes > self.budget_bytes:
+            return False
+
+        k = cache_key(key)
+        # Unique per process and call, so concurrent writers never share a file name
+        generation = (os.getpid() << 20) + next(self._generations)
+        entry_path = self._entry_path(k, generation)
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(len(payload), len(raws)))
+            for offset, length in layout:
+                f.write(_BUFFER.pack(offset, length))
+            f.write(payload)
+            for (offset, _), raw in zip(layout, raws):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(raw)
+
+        with self._locked():
+            if np.any(self._slots["key"] == k):
+                # Another worker cached it first
+                os.remove(tmp_path)
+                return True
+            self._evict_until(self.budget_bytes - nbytes)
+            empty = np.flatnonzero(self._slots["key"] == 0)
+            if len(empty) == 0:
+                self._evict_one()
+                empty = np.flatnonzero(self._slots["key"] == 0)
+            slot = empty[0]
+            os.replace(tmp_path, entry_path)
+            self._slots[slot] = (k, nbytes, self._tick(), generation)
+            self._header[2] += nbytes
+        return True
+
+    def _evict_one(self):
+        used = np.flatnonzero(self._slots["key"] != 0)
+        if len(used) == 0:
+            return False
+        slot = used[np.argmin(self._slots["last_used"][used])]
+        key, nbytes, _, generation = self._slots[slot]
+        try:
+            # Readers that already mapped the file keep their pages
+            os.remove(self._entry_path(int(key), int(generation)))
+        except FileNotFoundError:
+            pass
+        self._slots[slot] = (0, 0, 0, 0)
+        self._header[2] -= nbytes
+        self._header[6] += 1
+        return True
+
+    def _evict_until(self, max_resident):
+        while self._header[2] > max_resident and self._evict_one():
+            pass
+
+    # --- Stats / lifecycle -----------------------------------------------------
+
+    def stats(self):
+        hits, misses = int(self._header[4]), int(self._header[5])
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "resident_bytes": int(self._header[2]),
+            "budget_bytes": self.budget_bytes,
+            "entries": int(np.count_nonzero(self._slots["key"])),
+            "evictions": int(self._header[6]),
+        }
+
+    def close(self):
+        os.close(self._lock_fd)
+
+    def destroy(self):
+        """Removes the cache and all its entries (call once, from the owning process)."""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
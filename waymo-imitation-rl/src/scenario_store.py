@@ -0,0 +1,372 @@
+"""
+Columnar, memory-mapped scenario store.
+
+Instead of one pickle per scenario, scenarios are packed into shards:
+
+    <root>/<shard>/index.pkl            small per-scenario records (ids, offsets, metadata)
+    <root>/<shard>/<column>.bin         raw column data, rows appended back to back
+
+Track states and map polylines of every scenario in a shard live in a handful of
+contiguous typed columns. Readers np.memmap those columns, so rebuilding the
+scenario dict MetaDrive expects only creates views (no copies) and every
+SubprocVecEnv worker shares the same physical pages through the OS page cache.
+"""
+
+import os
+import pickle
+import shutil
+from typing import NamedTuple
+
+import numpy as np
+
+from src.manifest import fsync_dir
+
+INDEX_FILE = "index.pkl"
+STORE_VERSION = 1
+
+# Column name -> (dtype, per-row shape)
+COLUMNS = {
+    "track_position": (np.float32, (3,)),
+    "track_heading": (np.float32, ()),
+    "track_velocity": (np.float32, (2,)),
+    "track_size": (np.float32, (3,)),
+    "track_valid": (np.int8, ()),
+    "map_points": (np.float32, (2,)),
+    "blob": (np.uint8, ()),  # any other ndarray (timestamps, metadata arrays, ...)
+}
+
+# Track state keys that map 1:1 onto a column
+STATE_COLUMNS = {
+    "position": "track_position",
+    "heading": "track_heading",
+    "velocity": "track_velocity",
+    "size": "track_size",
+    "valid": "track_valid",
+}
+
+# Track state keys rebuilt as views of the "size" column
+SIZE_VIEWS = {"length": 0, "width": 1, "height": 2}
+
+GEOMETRY_KEYS = ("polyline", "polygon")
+
+
+class BlobRef(NamedTuple):
+    """Reference to an ndarray stored in the 'blob' column."""
+    start: int
+    nbytes: int
+    dtype: str
+    shape: tuple
+
+
+class ScenarioShardWriter:
+    """
+    Appends converted scenario dicts to one shard.
+
+    The shard is written to '<name>.tmp' and renamed into place on close(), so
+    readers never see a half-written shard.
+    """
+    def __init__(self, root, name):
+        recover_shard(root, name)
+        self.root = root
+        self.final_dir = os.path.join(root, name)
+        self.tmp_dir = self.final_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+
+        self._files = {c: open(os.path.join(self.tmp_dir, c + ".bin"), "wb") for c in COLUMNS}
+        self._rows = {c: 0 for c in COLUMNS}
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _append(self, column, array):
+        dtype, shape = COLUMNS[column]
+        arr = np.ascontiguousarray(array, dtype=dtype).reshape((-1,) + shape)
+        start = self._rows[column]
+        self._files[column].write(arr.tobytes())
+        self._rows[column] += len(arr)
+        return start, len(arr)
+
+    def _pack(self, obj):
+        # Move ndarrays out of the pickled index and into the blob column
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            arr = np.require(obj, requirements="C")
+            raw = arr.reshape(-1).view(np.uint8)
+            # Keep every blob 8-byte aligned so the reader's views stay aligned
+            pad = -self._rows["blob"] % 8
+            if pad:
+                self._append("blob", np.zeros(pad, dtype=np.uint8))
+            start, nbytes = self._append("blob", raw)
+            return BlobRef(start, nbytes, arr.dtype.str, arr.shape)
+        if isinstance(obj, dict):
+            return {k: self._pack(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._pack(v) for v in obj]
+        return obj
+
+    def add(self, scenario, summary=None):
+        """'summary' is an optional small metadata record kept in the index (see src.dataset_index)."""
+        # 1. Tracks -> state columns
+        tracks = []
+        for t_id, track in scenario["tracks"].items():
+            state = track["state"]
+            start, count = self._append("track_position", state["position"])
+            for key, column in STATE_COLUMNS.items():
+                if key != "position":
+                    self._append(column, state[key])
+            extra = {k: v for k, v in state.items() if k not in STATE_COLUMNS and k not in SIZE_VIEWS}
+            tracks.append({
+                "id": t_id,
+                "type": track["type"],
+                "metadata": self._pack(track.get("metadata", {})),
+                "start": start,
+                "count": count,
+                "extra": self._pack(extra),
+            })
+
+        # 2. Map features -> point column
+        map_features = []
+        for f_id, feature in scenario["map_features"].items():
+            geometry_key = next((k for k in GEOMETRY_KEYS if k in feature), None)
+            start, count = (0, 0)
+            if geometry_key is not None:
+                start, count = self._append("map_points", np.asarray(feature[geometry_key])[:, :2])
+            extra = {k: v for k, v in feature.items() if k != geometry_key}
+            map_features.append({
+                "id": f_id,
+                "geometry_key": geometry_key,
+                "start": start,
+                "count": count,
+                "extra": self._pack(extra),
+            })
+
+        # 3. Everything else is small and goes into the index
+        rest = {k: v for k, v in scenario.items() if k not in ("tracks", "map_features")}
+        self.records.append({
+            "id": scenario.get("id"),
+            "tracks": tracks,
+            "map_features": map_features,
+            "rest": self._pack(rest),
+            "summary": summary,
+        })
+
+    def close(self):
+        # Everything on disk before the swap, so a power loss cannot leave a renamed but empty shard
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        index = {
+            "version": STORE_VERSION,
+            "rows": dict(self._rows),
+            "scenarios": self.records,
+        }
+        with open(os.path.join(self.tmp_dir, INDEX_FILE), "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_dir(self.tmp_dir)
+
+        # Swap the finished shard in; a crash at any point leaves either the old
+        # or the new shard complete under final_dir, or the old one alone in
+        # '.old' (read in place by shard_dir(), restored by the next writer)
+        old_dir = self.final_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.final_dir):
+            os.replace(self.final_dir, old_dir)
+        os.replace(self.tmp_dir, self.final_dir)
+        fsync_dir(self.root)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return self.final_dir
+
+    def abort(self):
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class ScenarioShard:
+    """
+    Reader for a single shard. Columns are memory-mapped lazily, so forked
+    workers open their own maps.
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.name = os.path.basename(shard_dir)
+        with open(os.path.join(shard_dir, INDEX_FILE), "rb") as f:
+            self._index = pickle.load(f)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self._index["scenarios"])
+
+    def __getitem__(self, row):
+        return self.get(row)
+
+    def record(self, row):
+        return self._index["scenarios"][row]
+
+    def _column(self, name):
+        col = self._columns.get(name)
+        if col is None:
+            dtype, shape = COLUMNS[name]
+            rows = self._index["rows"][name]
+            if rows == 0:
+                col = np.empty((0,) + shape, dtype=dtype)
+            else:
+                path = os.path.join(self.shard_dir, name + ".bin")
+                col = np.memmap(path, dtype=dtype, mode="r", shape=(rows,) + shape)
+            self._columns[name] = col
+        return col
+
+    def _unpack(self, obj):
+        if isinstance(obj, BlobRef):
+            blob = self._column("blob")[obj.start:obj.start + obj.nbytes]
+            return blob.view(np.dtype(obj.dtype)).reshape(obj.shape)
+        if isinstance(obj, dict):
+            return {k: self._unpack(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._unpack(v) for v in obj]
+        return obj
+
+    def get(self, row):
+        record = self.record(row)
+        scenario = self._unpack(record["rest"])
+
+        # 1. Tracks: slice views out of the state columns
+        tracks = {}
+        for t in record["tracks"]:
+            sl = slice(t["start"], t["start"] + t["count"])
+            state = {key: self._column(column)[sl] for key, column in STATE_COLUMNS.items()}
+            for key, axis in SIZE_VIEWS.items():
+                state[key] = state["size"][:, axis]
+            state.update(self._unpack(t["extra"]))
+            tracks[t["id"]] = {
+                "type": t["type"],
+                "state": state,
+                "metadata": self._unpack(t["metadata"]),
+            }
+
+        # 2. Map features: slice views out of the point column
+        map_features = {}
+        points = self._column("map_points")
+        for m in record["map_features"]:
+            feature = self._unpack(m["extra"])
+            if m["geometry_key"] is not None:
+                feature[m["geometry_key"]] = points[m["start"]:m["start"] + m["count"]]
+            map_features[m["id"]] = feature
+
+        scenario["tracks"] = tracks
+        scenario["map_features"] = map_features
+        return scenario
+
+
+class ScenarioStore:
+    """
+    Read-only view over all shards under 'root'.
+
+    store[i] rebuilds the MetaDrive scenario dict of the i-th scenario. Every
+    array in it is a read-only view into a memory-mapped column.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.shards = list_shards(self.root)
+        if not self.shards:
+            raise FileNotFoundError(f"No scenario store shards found in {self.root}")
+
+        self._readers = []
+        self._locations = []
+        for shard_id, shard in enumerate(self.shards):
+            reader = ScenarioShard(shard_dir(self.root, shard))
+            self._readers.append(reader)
+            self._locations.extend((shard_id, row) for row in range(len(reader)))
+
+        self._id_to_index = {self.record(i)["id"]: i for i in range(len(self))}
+
+    @staticmethod
+    def is_store(path):
+        return bool(path) and os.path.isdir(path) and bool(list_shards(path))
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __getitem__(self, index):
+        return self.get(index)
+
+    @property
+    def ids(self):
+        return list(self._id_to_index)
+
+    def index_of(self, scenario_id):
+        return self._id_to_index[scenario_id]
+
+    def location(self, index):
+        """(shard name, row within the shard) of scenario 'index'."""
+        shard_id, row = self._locations[index]
+        return self.shards[shard_id], row
+
+    def record(self, index):
+        shard_id, row = self._locations[index]
+        return self._readers[shard_id].record(row)
+
+    def summary(self, index):
+        """The metadata record written by the converter, or None."""
+        return self.record(index).get("summary")
+
+    def scenario_name(self, index):
+        shard_id, _ = self._locations[index]
+        return f"{self.shards[shard_id]}/{self.record(index)['id']}"
+
+    def get(self, index):
+        shard_id, row = self._locations[index]
+        return self._readers[shard_id].get(row)
+
+
+def list_shards(root):
+    """
+    Sorted names of the complete shards under 'root', including shards left
+    only as '<name>.old' by a writer that crashed mid-swap (see shard_dir).
+    """
+    if not os.path.isdir(root):
+        return []
+    names = set()
+    for d in os.listdir(root):
+        if d.endswith(".tmp") or not os.path.isfile(os.path.join(root, d, INDEX_FILE)):
+            continue
+        if d.endswith(".old"):
+            d = d[:-len(".old")]
+            if os.path.isfile(os.path.join(root, d, INDEX_FILE)):
+                continue  # the swap finished; '.old' is about to be removed
+        names.add(d)
+    return sorted(names)
+
+
+def shard_dir(root, name):
+    """
+    Directory of shard 'name': '<name>', or '<name>.old' if a writer crashed
+    between its two renames. Readers use the old copy in place; renaming it
+    back is left to recover_shard() in the next writer, so a reader cannot
+    race a swap in progress.
+    """
+    path = os.path.join(root, name)
+    if not os.path.exists(path) and os.path.isfile(os.path.join(path + ".old", INDEX_FILE)):
+        return path + ".old"
+    return path
+
+
+def recover_shard(root, name):
+    """Puts an orphaned '<name>.old' back as shard 'name' (a writer crashed mid-swap)."""
+    path = os.path.join(root, name)
+    if not os.path.exists(path) and os.path.isfile(os.path.join(path + ".old", INDEX_FILE)):
+        os.replace(path + ".old", path)
+        fsync_dir(root)
@@ -0,0 +1,135 @@
+"""
+Synthetic Waymo-like scenarios, for benchmarks and smoke tests without real
+data or network access.
+
+synthetic_waymo_dict() produces the MessageToDict form of a Waymo Scenario
+proto (what convert_scenario_dict reads). Agents drive smooth curved
+trajectories at realistic speeds, the SDC's path and a few other agents' paths
+are also laid down as lanes, and the rest of the map is random road lines,
+edges and crosswalks. synthetic_scenario() runs it through the real converter,
+so the result has exactly the layout scripts/convert.py emits.
+"""
+
+import os
+
+import numpy as np
+
+from src.conversion import convert_scenario_dict
+from src.dataset_index import scenario_metadata
+
+NUM_STEPS = 91
+DT = 0.1
+
+# Waymo object types: 1 = vehicle, 2 = pedestrian, 3 = cyclist
+OBJECT_TYPES = (1, 2, 3)
+OBJECT_TYPE_SHARES = (0.8, 0.15, 0.05)
+OBJECT_SIZES = {1: (4.5, 2.0, 1.6), 2: (0.8, 0.8, 1.8), 3: (1.8, 0.8, 1.7)}
+OBJECT_SPEEDS = {1: (3.0, 15.0), 2: (0.5, 2.0), 3: (2.0, 6.0)}
+
+MAP_FEATURE_SHARES = {"lane": 0.6, "road_line": 0.2, "road_edge": 0.15, "crosswalk": 0.05}
+POINT_SPACING = 2.0
+AREA = 150.0  # agents start within +-AREA/2 m of the origin
+
+
+def _trajectory(rng, start, heading, speed, num_steps, turn_rate=0.05):
+    """Positions (T, 2), headings (T,) of a smooth random-curvature path."""
+    yaw_rate = np.cumsum(rng.normal(0.0, turn_rate, num_steps)) * DT
+    headings = heading + np.cumsum(np.clip(yaw_rate, -0.3, 0.3)) * DT
+    steps = speed * DT * np.stack([np.cos(headings), np.sin(headings)], axis=1)
+    return start + np.cumsum(steps, axis=0) - steps[0], headings
+
+
+def _points(xy):
+    return [{"x": float(x), "y": float(y), "z": 0.0} for x, y in xy]
+
+
+def synthetic_waymo_dict(seed=0, num_agents=32, num_map_features=100, num_steps=NUM_STEPS,
+                         points_per_feature=20, scenario_id=None):
+    """MessageToDict-style Scenario dict; track 0 is the SDC."""
+    rng = np.random.default_rng(seed)
+    scenario_id = scenario_id or f"synthetic_{seed:08d}"
+
+    # 1. Agents
+    tracks, paths = [], []
+    for t_id in range(num_agents):
+        object_type = 1 if t_id == 0 else int(rng.choice(OBJECT_TYPES, p=OBJECT_TYPE_SHARES))
+        length, width, height = OBJECT_SIZES[object_type]
+        speed = rng.uniform(*OBJECT_SPEEDS[object_type])
+        start = np.zeros(2) if t_id == 0 else rng.uniform(-AREA / 2, AREA / 2, 2)
+        position, heading = _trajectory(rng, start, rng.uniform(-np.pi, np.pi), speed, num_steps)
+        velocity = np.gradient(position, DT, axis=0)
+        paths.append(position)
+
+        # Some agents enter the scene late; MessageToDict drops all-default (invalid) states
+        first_valid = 0 if t_id == 0 or rng.random() < 0.7 else int(rng.integers(1, num_steps // 2))
+        states = [{} for _ in range(first_valid)]
+        states += [{
+            "center_x": float(position[i, 0]), "center_y": float(position[i, 1]), "center_z": 0.0,
+            "length": length, "width": width, "height": height,
+            "heading": float(heading[i]),
+            "velocity_x": float(velocity[i, 0]), "velocity_y": float(velocity[i, 1]),
+            "valid": True,
+        } for i in range(first_valid, num_steps)]
+        tracks.append({"id": t_id, "object_type": object_type, "states": states})
+
+    # 2. Map: lanes under the SDC and some agents first, then random features
+    kinds = list(MAP_FEATURE_SHARES)
+    kind_probs = np.array(list(MAP_FEATURE_SHARES.values()))
+    map_features = []
+    for f_id in range(num_map_features):
+        if f_id < min(len(paths), max(1, num_map_features // 4)):
+            kind = "lane"
+            # Extend the driven path a bit beyond both ends
+            path = paths[f_id]
+            direction = (path[-1] - path[0]) / max(np.linalg.norm(path[-1] - path[0]), 1e-6)
+            xy = np.concatenate([path[:1] - 20 * direction, path[::5], path[-1:] + 20 * direction])
+        else:
+            kind = kinds[rng.choice(len(kinds), p=kind_probs)]
+            start = rng.uniform(-AREA / 2, AREA / 2, 2)
+            if kind == "crosswalk":
+                corner = rng.uniform(3.0, 12.0, 2)
+                xy = start + np.array([[0, 0], [corner[0], 0], corner, [0, corner[1]]])
+            else:
+                xy, _ = _trajectory(rng, start, rng.uniform(-np.pi, np.pi), POINT_SPACING / DT, points_per_feature)
+        field = "polygon" if kind == "crosswalk" else "polyline"
+        # int64 ids come out of MessageToDict as strings
+        map_features.append({"id": str(1000 + f_id), kind: {field: _points(xy)}})
+
+    return {
+        "scenario_id": scenario_id,
+        "timestamps_seconds": [round(i * DT, 6) for i in range(num_steps)],
+        "current_time_index": 10,
+        "sdc_track_index": 0,
+        "tracks": tracks,
+        "map_features": map_features,
+    }
+
+
+def synthetic_scenario(seed=0, **kwargs):
+    """A converted MetaDrive scenario dict, as scripts/convert.py writes it."""
+    raw = synthetic_waymo_dict(seed, **kwargs)
+    return convert_scenario_dict(raw, raw["scenario_id"])
+
+
+def write_synthetic_dataset(out_dir, count, output_format="pkl", seed=0, **kwargs):
+    """
+    Writes 'count' scenarios to 'out_dir' like the conversion pipeline does
+    ("pkl" / "compact": sd_waymo_<id>.pkl + metadata sidecar, "store": one store shard).
+    Returns the scenario ids.
+    """
+    from src.converter import ENCODERS, WRITERS
+
+    os.makedirs(out_dir, exist_ok=True)
+    writer = WRITERS[output_format](out_dir)
+    encode = ENCODERS[output_format]
+    source = os.path.join(out_dir, "synthetic.tfrecord")
+    ids = []
+    try:
+        for i in range(count):
+            scenario = synthetic_scenario(seed + i, **kwargs)
+            writer.write(source, scenario["id"], encode(scenario), scenario_metadata(scenario))
+            ids.append(scenario["id"])
+        writer.finish_source(source)
+    finally:
+        writer.close()
+    return ids
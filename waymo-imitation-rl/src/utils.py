@@ -15,23 +15,101 @@ class PIDController:
         self.prev_error = error
         return output
 
+class BatchedPIDController:
+    """
+    PIDController for N independent loops; the integral / previous-error state
+    lives in (N,) arrays and one get_control() call updates all of them.
+    """
+    def __init__(self, n, k_p=1.0, k_i=0.0, k_d=0.1):
+        self.n = n
+        self.k_p = k_p
+        self.k_i = k_i
+        self.k_d = k_d
+        self.prev_error = np.zeros(n)
+        self.integral = np.zeros(n)
+
+    def reset(self, indices=None):
+        """Clears the state of all loops, or only of 'indices' (e.g. envs that just reset)."""
+        if indices is None:
+            indices = slice(None)
+        self.prev_error[indices] = 0.0
+        self.integral[indices] = 0.0
+
+    def get_control(self, errors, mask=None):
+        """
+        errors (N,) -> outputs (N,). Loops where 'mask' is False keep their state
+        (and output 0), e.g. agents that are not present this step.
+        """
+        errors = np.asarray(errors, dtype=np.float64)
+        if mask is None:
+            integral = self.integral + errors
+            derivative = errors - self.prev_error
+            self.integral = integral
+            self.prev_error = errors.copy()
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            integral = np.where(mask, self.integral + errors, self.integral)
+            derivative = np.where(mask, errors - self.prev_error, 0.0)
+            self.integral = integral
+            self.prev_error = np.where(mask, errors, self.prev_error)
+        output = self.k_p * errors + self.k_i * integral + self.k_d * derivative
+        return output if mask is None else np.where(mask, output, 0.0)
+
+def heading_errors(positions, headings, target_waypoints):
+    """Wrapped angle from each heading to the direction of its target, (N,)."""
+    positions = np.asarray(positions, dtype=np.float64)[..., :2]
+    target_vector = np.asarray(target_waypoints, dtype=np.float64)[..., :2] - positions
+    target_heading = np.arctan2(target_vector[..., 1], target_vector[..., 0])
+
+    heading_error = target_heading - np.asarray(headings, dtype=np.float64)
+    return (heading_error + np.pi) % (2 * np.pi) - np.pi
+
+def throttle_from_steering(steering):
+    # Simple Throttle Logic: slow down in turns
+    return np.where(np.abs(steering) < 0.3, 0.6, 0.3)
+
+def get_expert_actions(positions, headings, target_waypoints):
+    """
+    Vectorized get_expert_action over N states: positions (N, 2), headings (N,),
+    target_waypoints (N, 2) or (2,). Returns (N, 2) [steering, throttle].
+    """
+    steering = np.clip(heading_errors(positions, headings, target_waypoints) * 1.5, -1.0, 1.0)
+    return np.stack([steering, throttle_from_steering(steering)], axis=-1).astype(np.float32)
+
+class ExpertController:
+    """
+    Stateful expert for N vehicles (envs or agents of one scenario).
+
+    Steering is a BatchedPIDController on the heading error to each target
+    waypoint; with the default gains (P = 1.5) it matches get_expert_actions.
+    If target speeds are given, throttle comes from a second PID on the speed
+    error instead of the fixed turn rule.
+    """
+    def __init__(self, n, steering_gains=(1.5, 0.0, 0.0), speed_gains=(0.5, 0.01, 0.0)):
+        self.n = n
+        self.steering_pid = BatchedPIDController(n, *steering_gains)
+        self.speed_pid = BatchedPIDController(n, *speed_gains)
+
+    def reset(self, indices=None):
+        self.steering_pid.reset(indices)
+        self.speed_pid.reset(indices)
+
+    def get_actions(self, positions, headings, target_waypoints, speeds=None, target_speeds=None, mask=None):
+        """(N, 2) [steering, throttle] for all vehicles in one call."""
+        errors = heading_errors(positions, headings, target_waypoints)
+        steering = np.clip(self.steering_pid.get_control(errors, mask), -1.0, 1.0)
+        if target_speeds is None:
+            throttle = throttle_from_steering(steering)
+        else:
+            speed_errors = np.asarray(target_speeds, dtype=np.float64) - np.asarray(speeds, dtype=np.float64)
+            throttle = np.clip(self.speed_pid.get_control(speed_errors, mask), -1.0, 1.0)
+        actions = np.stack([steering, throttle], axis=-1).astype(np.float32)
+        if mask is not None:
+            actions[~np.asarray(mask, dtype=bool)] = 0.0
+        return actions
+
 def get_expert_action(vehicle, target_waypoint):
     """
     Calculates the steering/throttle needed for 'vehicle' to hit 'target_waypoint'.
     """
-    vehicle_pos = vehicle.position
-    vehicle_heading = vehicle.heading_theta
-    
-    target_vector = target_waypoint - vehicle_pos
-    target_heading = np.arctan2(target_vector[1], target_vector[0])
-    
-    heading_error = target_heading - vehicle_heading
-    heading_error = (heading_error + np.pi) % (2 * np.pi) - np.pi
-    
-    # PID for Steering
-    steering = np.clip(heading_error * 1.5, -1.0, 1.0)
-    
-    # Simple Throttle Logic
-    throttle = 0.6 if abs(steering) < 0.3 else 0.3
-    
-    return np.array([steering, throttle])
+    return get_expert_actions([vehicle.position], [vehicle.heading_theta], [target_waypoint])[0]
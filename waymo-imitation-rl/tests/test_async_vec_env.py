@@ -0,0 +1,92 @@
+import os
+
+import gymnasium as gym
+import numpy as np
+import pytest
+from stable_baselines3.common.vec_env import VecMonitor
+
+from src.async_vec_env import AsyncSharedMemoryVecEnv, env_method_all_workers
+
+
+class CountingEnv(gym.Env):
+    """Episodes of 'length' steps; an action of 99 kills the process outright."""
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (1,), np.float32)
+    action_space = gym.spaces.Box(-100, 100, (1,), np.float32)
+
+    def __init__(self, length=3):
+        self.length = length
+        self.t = 0
+        self.tag = None
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        self.t = 0
+        return np.zeros(1, np.float32), {}
+
+    def step(self, action):
+        if action[0] == 99:
+            os._exit(1)
+        self.t += 1
+        self.steps += 1
+        return np.full(1, self.t, np.float32), 1.0, self.t >= self.length, False, {}
+
+    def get_tag(self):
+        return self.tag
+
+    def drain_steps(self):
+        """Steps since the last call (like timing_stats / trajectory_metrics)."""
+        steps, self.steps = self.steps, 0
+        return steps
+
+
+def make_vec_env(num_workers=3, num_envs=2):
+    return AsyncSharedMemoryVecEnv([CountingEnv for _ in range(num_workers)], num_envs=num_envs,
+                                   start_method="fork")
+
+
+def test_set_attr_reaches_spare_workers():
+    env = make_vec_env()
+    try:
+        env.reset()
+        env.set_attr("tag", "a")
+        assert env.env_method("get_tag") == ["a", "a"]
+        # Episodes end every 3 steps, rotating the spare into a slot
+        bound = set(env._slot_worker)
+        for _ in range(7):
+            env.step(np.zeros((2, 1), np.float32))
+            bound |= set(env._slot_worker)
+            assert env.env_method("get_tag") == ["a", "a"]
+        assert bound == {0, 1, 2}
+    finally:
+        env.close()
+
+
+def test_dead_worker_raises_instead_of_hanging():
+    env = make_vec_env()
+    try:
+        env.reset()
+        env.step_async(np.array([[0.0], [99.0]], np.float32))
+        with pytest.raises(RuntimeError, match="died"):
+            env.step_wait()
+    finally:
+        env.close()
+
+
+def test_draining_methods_collect_from_spare_workers():
+    env = make_vec_env()
+    try:
+        env.reset()
+        wrapped = VecMonitor(env)
+        total = 0
+        for rollout in range(4):
+            for _ in range(5):
+                wrapped.step(np.zeros((2, 1), np.float32))
+            per_worker = env_method_all_workers(wrapped, "drain_steps")
+            assert len(per_worker) == 3
+            total += sum(per_worker)
+            assert total == 2 * 5 * (rollout + 1)
+        assert env.env_method("drain_steps") == [0, 0]
+        with pytest.raises(ValueError):
+            env.env_method("drain_steps", indices=[0], include_spares=True)
+    finally:
+        env.close()
@@ -0,0 +1,73 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.compact import HEADING_QUANTUM, dumps_compact
+from src.map_geometry import MAP_KEY
+from src.synthetic import synthetic_scenario
+
+TOLERANCE = 0.05
+QUANTUM = 0.01
+FLOAT32_SLACK = 1e-4  # float32 rounding of coordinates a few hundred m from the origin
+
+
+@pytest.fixture(scope="module")
+def scenario():
+    return synthetic_scenario(3, num_agents=12, num_map_features=40)
+
+
+def point_to_polyline(points, polyline):
+    """Distance from each of 'points' (N, 2) to the polyline (M, 2)."""
+    a, b = polyline[:-1], polyline[1:]
+    ab = b - a
+    ap = points[:, None] - a[None]
+    t = np.clip((ap * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0.0, 1.0)
+    return np.linalg.norm(ap - t[..., None] * ab, axis=2).min(axis=1)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_round_trip_within_error_bounds(scenario, codec):
+    decoded = pickle.loads(dumps_compact(scenario, tolerance=TOLERANCE, quantum=QUANTUM, codec=codec))
+
+    # Tracks: positions within half a quantum, everything else exact
+    for t_id, track in scenario["tracks"].items():
+        state, out = track["state"], decoded["tracks"][t_id]["state"]
+        np.testing.assert_allclose(out["position"], state["position"], atol=QUANTUM / 2 + FLOAT32_SLACK)
+        for key in ("heading", "velocity", "valid", "size", "length", "width", "height"):
+            np.testing.assert_array_equal(out[key], state[key])
+
+    # Map polylines: every original point within 'tolerance' (plus quantization) of the simplified line,
+    # which keeps both end points
+    for f_id, feature in scenario["map_features"].items():
+        if "polygon" in feature:
+            # Polygons are only quantized
+            np.testing.assert_allclose(decoded["map_features"][f_id]["polygon"], feature["polygon"],
+                                       atol=QUANTUM / 2 + FLOAT32_SLACK)
+        if "polyline" not in feature:
+            continue
+        polyline, out = np.asarray(feature["polyline"]), decoded["map_features"][f_id]["polyline"]
+        assert len(out) <= len(polyline)
+        np.testing.assert_allclose(out[[0, -1]], polyline[[0, -1]], atol=QUANTUM / 2 + FLOAT32_SLACK)
+        bound = TOLERANCE + QUANTUM * np.sqrt(2) / 2 + FLOAT32_SLACK
+        assert point_to_polyline(polyline[:, :2], out[:, :2]).max() <= bound
+
+    # Map geometry: points within half a quantum, headings within half a heading quantum, the index rebuilt
+    geometry, out = scenario["metadata"][MAP_KEY], decoded["metadata"][MAP_KEY]
+    np.testing.assert_allclose(out["points"], geometry["points"], atol=QUANTUM / 2 + FLOAT32_SLACK)
+    np.testing.assert_allclose(out["headings"], geometry["headings"], atol=HEADING_QUANTUM / 2 + 1e-6)
+    for key in ("lane_ids", "lane_offsets", "segment_start", "cell_start", "cell_points"):
+        np.testing.assert_array_equal(out[key], geometry[key])
+    assert decoded["metadata"]["sdc_id"] == scenario["metadata"]["sdc_id"]
+
+
+def test_lossless_without_quantum_and_tolerance(scenario):
+    decoded = pickle.loads(dumps_compact(scenario, tolerance=0.0, quantum=None))
+    for t_id, track in scenario["tracks"].items():
+        np.testing.assert_array_equal(decoded["tracks"][t_id]["state"]["position"], track["state"]["position"])
+    geometry = scenario["metadata"][MAP_KEY]
+    np.testing.assert_array_equal(decoded["metadata"][MAP_KEY]["points"], geometry["points"])
+
+
+def test_compact_is_smaller(scenario):
+    assert len(dumps_compact(scenario)) < len(pickle.dumps(scenario, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,24 @@
+import os
+
+from src.converter.stages import PickleWriter
+from src.manifest import atomic_write
+
+
+def test_atomic_write_replaces_and_leaves_no_temp_file(tmp_path):
+    path = tmp_path / "out.bin"
+    atomic_write(str(path), b"old")
+    atomic_write(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+
+def test_pickle_writer_removes_crashed_temp_files(tmp_path):
+    leftovers = ["sd_waymo_a.pkl.123.tmp", "sd_waymo_a.meta.json.123.tmp"]
+    kept = ["sd_waymo_b.pkl", "sd_waymo_b.meta.json"]
+    for name in leftovers + kept:
+        (tmp_path / name).write_bytes(b"x")
+    writer = PickleWriter(str(tmp_path))
+
+    name = writer.write("source", "c", b"payload", {"scenario_id": "c"})
+    assert sorted(os.listdir(tmp_path)) == sorted(kept + [name, "sd_waymo_c.meta.json"])
+    assert (tmp_path / name).read_bytes() == b"payload"
@@ -0,0 +1,49 @@
+import glob
+import os
+import pickle
+
+import numpy as np
+
+from src.dataset_index import SUMMARY_FILE, ScenarioIndex, build_index, load_summary, sidecar_path
+from src.synthetic import write_synthetic_dataset
+
+
+def test_index_survives_crash_between_swap_renames(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    write_synthetic_dataset(str(data_dir), 3, num_agents=4, num_map_features=10)
+    index_dir = str(tmp_path / "index")
+    assert build_index(str(data_dir), index_dir, workers=1) == 3
+
+    # Crash right after the first rename: only <index>.old is left
+    os.replace(index_dir, index_dir + ".old")
+    assert len(ScenarioIndex(index_dir)) == 3
+
+    # A failing rebuild still puts the old index back first
+    monkeypatch.setattr("src.dataset_index._index_entries", lambda *args: ("pkl", []))
+    build_index(str(data_dir), index_dir, workers=1)
+    assert os.path.isdir(index_dir) and not os.path.exists(index_dir + ".old")
+    assert len(ScenarioIndex(index_dir)) == 3
+
+
+def test_index_upgrades_a_summary_from_before_sidecars(tmp_path):
+    data_dir = str(tmp_path / "data")
+    write_synthetic_dataset(data_dir, 3, num_agents=4, num_map_features=10)
+    files = sorted(glob.glob(os.path.join(data_dir, "sd_waymo_*.pkl")))
+    os.remove(sidecar_path(files[0]))  # read back from the pickle itself
+
+    # What the original scripts/build_summary.py wrote (newer than every file)
+    old = {}
+    for path in files:
+        with open(path, "rb") as f:
+            scenario = pickle.load(f)
+        old[scenario["id"]] = {"id": scenario["id"], "filename": os.path.basename(path),
+                               "length": scenario["length"], "object_summary": {}}
+    with open(os.path.join(data_dir, SUMMARY_FILE), "wb") as f:
+        pickle.dump(old, f)
+
+    assert build_index(data_dir, workers=1) == 3
+    summary = load_summary(data_dir)
+    assert sorted(summary) == sorted(old)
+    assert all(entry["metadata"]["id"] == s_id for s_id, entry in summary.items())
+    index = ScenarioIndex(os.path.join(data_dir, "scenario_index"))
+    assert np.all(index.column("num_tracks") == 4)
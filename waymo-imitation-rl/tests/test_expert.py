@@ -0,0 +1,37 @@
+import numpy as np
+
+from src.expert import EXPERT_KEY, compute_expert_table, expert_action_at, expert_actions_at, expert_table
+
+
+def curved_track(T=40, last_valid=30):
+    t = np.arange(T)
+    position = np.stack([10 * np.sin(t / 15), 10 * (1 - np.cos(t / 15)), np.zeros(T)], axis=1)
+    heading = t / 15
+    valid = t <= last_valid
+    return {"position": position, "heading": heading, "valid": valid}
+
+
+def test_live_expert_stops_steering_at_the_final_step():
+    state = curved_track()
+    table = compute_expert_table(state)
+    assert table["final_step"] == 30
+    assert np.all(table["actions"][30:, 0] == 0) and np.all(table["actions"][:30, 0] != 0)
+
+    # A vehicle off the log still steers toward the lookahead until the final step, then not at all
+    position, heading = state["position"][30, :2] + [0.0, 3.0], 0.0
+    assert expert_action_at(table, 29, position, heading)[0] != 0
+    for step in (30, 35, 100):
+        assert expert_action_at(table, step, position, heading)[0] == 0
+
+    steps = np.array([29, 30, 39])
+    batch = expert_actions_at(np.repeat(table["lookahead"][None], 3, axis=0), steps,
+                              np.repeat(position[None], 3, axis=0), np.zeros(3), np.full(3, table["final_step"]))
+    single = np.stack([expert_action_at(table, s, position, heading) for s in steps])
+    np.testing.assert_allclose(batch, single, atol=1e-6)
+
+
+def test_stored_tables_without_final_step_derive_it():
+    table = compute_expert_table(curved_track())
+    legacy = {"lookahead": table["lookahead"], "actions": table["actions"]}
+    scenario = {"metadata": {EXPERT_KEY: legacy}}
+    assert expert_table(scenario)["final_step"] == 30
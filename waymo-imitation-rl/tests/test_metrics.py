@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.metrics import HEADING_TOLERANCE, LANE_SEARCH_RADIUS, _wrap, lane_deviation, trajectory_metrics
+from src.observations import ScenarioFeatures
+from src.synthetic import synthetic_scenario
+
+
+@pytest.fixture(scope="module")
+def features():
+    return [ScenarioFeatures(synthetic_scenario(seed, num_agents=16, num_map_features=60)) for seed in range(3)]
+
+
+def brute_force_segments(geometry, points):
+    """(distance, heading) of every lane segment, for every point: (N, S) each."""
+    start = geometry.table["segment_start"]
+    a, b = geometry.points[start], geometry.points[start + 1]
+    ab = b - a
+    ap = points[:, None] - a[None]
+    t = np.clip((ap * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0.0, 1.0)
+    distance = np.linalg.norm(ap - t[..., None] * ab, axis=2)
+    return distance, np.broadcast_to(geometry.headings[start], distance.shape)
+
+
+def test_lane_deviation_matches_brute_force(features):
+    geometry = features[0].map
+    rng = np.random.default_rng(0)
+    points = geometry.points[rng.integers(len(geometry), size=500)] + rng.uniform(-8, 8, (500, 2))
+    distance, lane_heading = lane_deviation(geometry, points)
+
+    reference, _ = brute_force_segments(geometry, points)
+    nearest = reference.min(axis=1)
+    in_range = nearest <= LANE_SEARCH_RADIUS
+    assert in_range.any() and not in_range.all()
+    np.testing.assert_allclose(distance[in_range], nearest[in_range], atol=1e-6)
+    assert np.all(distance[~in_range] == LANE_SEARCH_RADIUS)
+    assert np.all(np.isnan(lane_heading[~in_range])) and np.all(np.isfinite(lane_heading[in_range]))
+
+
+def test_lane_deviation_prefers_heading_consistent_lanes(features):
+    geometry = features[0].map
+    rng = np.random.default_rng(1)
+    points = geometry.points[rng.integers(len(geometry), size=500)] + rng.uniform(-4, 4, (500, 2))
+    headings = rng.uniform(-np.pi, np.pi, 500)
+    distance, lane_heading = lane_deviation(geometry, points, headings)
+
+    reference, reference_heading = brute_force_segments(geometry, points)
+    reference = np.where(reference <= LANE_SEARCH_RADIUS, reference, np.inf)
+    aligned = np.abs(_wrap(headings[:, None] - reference_heading)) <= HEADING_TOLERANCE
+    consistent = np.where(aligned, reference, np.inf).min(axis=1)
+    expected = np.where(np.isfinite(consistent), consistent, np.minimum(reference.min(axis=1), LANE_SEARCH_RADIUS))
+    np.testing.assert_allclose(distance, expected, atol=1e-6)
+    has_consistent = np.isfinite(consistent)
+    assert has_consistent.any()
+    assert np.all(np.abs(_wrap(headings - lane_heading))[has_consistent] <= HEADING_TOLERANCE + 1e-6)
+
+
+def test_log_replay_stays_on_its_lane(features):
+    # The logged SDC drives along the lanes the map was built from: no deviation, no heading error
+    T = 80
+    positions = np.stack([f.sdc_position[:T] for f in features])
+    headings = np.stack([f.sdc_heading[:T] for f in features])
+    metrics = trajectory_metrics(positions, headings, features)
+
+    np.testing.assert_allclose(metrics["ade"], 0.0, atol=1e-4)
+    np.testing.assert_allclose(metrics["fde"], 0.0, atol=1e-4)
+    assert np.all(metrics["lane_deviation"] < 0.05)
+    assert np.all(metrics["max_lane_deviation"] < 0.1)
+    assert np.all(metrics["heading_error"] < 0.02)
+    assert not metrics["off_road"].any()
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from src.algorithms import BC_PPO
+from src.dataset_index import build_index
+from src.multi_agent_env import ActiveVecMonitor, MultiAgentWaymoVecEnv
+from src.synthetic import write_synthetic_dataset
+
+
+@pytest.fixture(scope="module")
+def small_index(tmp_path_factory):
+    # 4 agents per scenario, at most 4 of them vehicles: far fewer than the 16 slots
+    data_dir = tmp_path_factory.mktemp("data")
+    write_synthetic_dataset(str(data_dir), 3, num_agents=4, num_map_features=20)
+    index_dir = data_dir / "scenario_index"
+    build_index(str(data_dir), str(index_dir), workers=1)
+    return str(index_dir)
+
+
+def test_idle_slots_never_span_an_episode(small_index):
+    env = MultiAgentWaymoVecEnv(small_index, agents_per_scene=16, prefetch_depth=0, seed=0)
+    try:
+        env.reset()
+        rng = np.random.default_rng(0)
+        previous_track = [None] * env.num_envs
+        previous_done = np.ones(env.num_envs, dtype=bool)
+        saw_idle = saw_switch = False
+        for _ in range(300):
+            obs, rewards, dones, infos = env.step(rng.uniform(-1, 1, (env.num_envs, 2)).astype(np.float32))
+            for slot, info in enumerate(infos):
+                track = info.get("track_id") if info["active"] else None
+                if track is None:
+                    saw_idle = True
+                    # Idle: an empty episode that ends right away
+                    assert dones[slot] and rewards[slot] == 0.0
+                    assert "terminal_observation" in info
+                if track != previous_track[slot]:
+                    # Idle -> vehicle, vehicle -> idle or another vehicle: always across a done
+                    assert previous_done[slot], f"slot {slot}: {previous_track[slot]} -> {track} mid-episode"
+                    saw_switch = saw_switch or None not in (track, previous_track[slot])
+                previous_track[slot] = track
+            previous_done = dones
+        assert saw_idle and saw_switch
+    finally:
+        env.close()
+
+
+def test_bc_ppo_trains_with_idle_slots(small_index):
+    env = MultiAgentWaymoVecEnv(small_index, agents_per_scene=16, prefetch_depth=0, seed=0)
+    try:
+        model = BC_PPO("MlpPolicy", env, n_steps=32, batch_size=128, n_epochs=1, seed=0, device="cpu")
+        model.learn(32 * env.num_envs)
+        mask = model.rollout_buffer.sample_mask
+        # Idle rows were collected but are masked out of the losses
+        assert 0 < mask.sum() < mask.size
+        assert np.isfinite(model.logger.name_to_value["train/value_loss"])
+    finally:
+        env.close()
+
+
+def test_monitor_reports_only_vehicle_episodes(small_index):
+    env = ActiveVecMonitor(MultiAgentWaymoVecEnv(small_index, agents_per_scene=16, prefetch_depth=0, seed=0))
+    try:
+        env.reset()
+        rng = np.random.default_rng(0)
+        steps = np.zeros(env.num_envs, dtype=np.int64)
+        returns = np.zeros(env.num_envs)
+        reported = done_rows = 0
+        for _ in range(300):
+            obs, rewards, dones, infos = env.step(rng.uniform(-1, 1, (env.num_envs, 2)).astype(np.float32))
+            done_rows += int(dones.sum())
+            for slot, info in enumerate(infos):
+                if info["active"]:
+                    steps[slot] += 1
+                    returns[slot] += rewards[slot]
+                if "episode" in info:
+                    # Only vehicles end episodes, and their stats cover exactly their own steps
+                    assert info["active"] and dones[slot]
+                    assert info["episode"]["l"] == steps[slot] >= 1
+                    assert info["episode"]["r"] == pytest.approx(returns[slot], rel=1e-4, abs=1e-4)
+                    reported += 1
+                if dones[slot]:
+                    steps[slot], returns[slot] = 0, 0.0
+        # Plain VecMonitor would have reported every done row, idle ones included
+        assert 0 < reported < done_rows / 2
+        assert env.episode_count == reported
+    finally:
+        env.close()
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from src.prefetch import ScenarioPrefetcher
+
+
+def test_load_errors_are_handed_back_with_their_index():
+    def load(index):
+        if index == 1:
+            raise IOError("bad file")
+        return {"id": index}, f"{index}.pkl"
+
+    picks = iter(range(100))
+    prefetcher = ScenarioPrefetcher(load, lambda: next(picks), depth=2)
+    try:
+        items = [prefetcher.get() for _ in range(3)]
+    finally:
+        prefetcher.close()
+    assert [item[0] for item in items] == [0, 1, 2]
+    assert items[0][1:] == ({"id": 0}, "0.pkl", None)
+    assert isinstance(items[1][3], IOError)
+
+
+def test_sampler_error_is_raised_instead_of_hanging():
+    calls = []
+
+    def pick():
+        calls.append(1)
+        if len(calls) > 2:
+            raise ValueError("all weights are zero")
+        return len(calls)
+
+    prefetcher = ScenarioPrefetcher(lambda i: ({"id": i}, ""), pick, depth=4)
+    result = {}
+
+    def consume():
+        try:
+            for _ in range(4):
+                prefetcher.get()
+        except RuntimeError as e:
+            result["error"] = e
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    consumer.join(timeout=5.0)
+    prefetcher.close()
+    assert not consumer.is_alive(), "get() blocked on a dead prefetch thread"
+    assert isinstance(result["error"].__cause__, ValueError)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.samplers import PrioritizedSampler, SumTree, WeightedSampler
+
+
+def assert_consistent(tree, weights):
+    internal = np.arange(1, tree.capacity)
+    np.testing.assert_allclose(tree.nodes[internal], tree.nodes[2 * internal] + tree.nodes[2 * internal + 1])
+    np.testing.assert_allclose(tree.get(np.arange(len(weights))), weights)
+    assert tree.total == pytest.approx(np.sum(weights))
+
+
+def brute_force_find(weights, values):
+    return np.searchsorted(np.cumsum(weights), values, side="right")
+
+
+@pytest.mark.parametrize("size", [1, 2, 37, 1024])
+def test_find_matches_cumulative_weights(size):
+    rng = np.random.default_rng(size)
+    weights = rng.uniform(0, 1, size) * (rng.random(size) > 0.2)
+    weights[0] += 0.1  # never all zero
+    tree = SumTree(size)
+    tree.set_all(weights)
+    assert_consistent(tree, weights)
+
+    values = rng.random(2000) * tree.total
+    expected = brute_force_find(weights, values)
+    np.testing.assert_array_equal(tree.find(values), expected)
+    assert [tree.find_one(v) for v in values[:200]] == list(expected[:200])
+
+
+def test_updates_keep_the_tree_consistent():
+    rng = np.random.default_rng(0)
+    weights = rng.uniform(0, 1, 100)
+    tree = SumTree(100)
+    tree.set_all(weights)
+    for _ in range(500):
+        index, weight = int(rng.integers(100)), float(rng.uniform(0, 2) * (rng.random() > 0.1))
+        tree.update(index, weight)
+        weights[index] = weight
+    assert_consistent(tree, weights)
+    values = rng.random(2000) * tree.total
+    np.testing.assert_array_equal(tree.find(values), brute_force_find(weights, values))
+
+
+def test_samples_are_proportional_to_weights():
+    rng = np.random.default_rng(1)
+    weights = np.array([0.0, 1.0, 2.0, 4.0, 8.0, 0.0, 16.0])
+    tree = SumTree(len(weights))
+    tree.set_all(weights)
+    n = 200_000
+    counts = np.bincount(tree.sample(rng, n), minlength=len(weights))
+    p = weights / weights.sum()
+    assert counts[weights == 0].sum() == 0
+    # Every bin within 5 standard deviations of its expected count
+    assert np.all(np.abs(counts - n * p) <= 5 * np.sqrt(n * p * (1 - p)) + 1e-9)
+
+    # After an update the new weights govern the draws
+    tree.update(6, 0.0)
+    tree.update(0, 16.0)
+    weights[[6, 0]] = [0.0, 16.0]
+    counts = np.bincount(tree.sample(rng, n), minlength=len(weights))
+    p = weights / weights.sum()
+    assert counts[6] == 0
+    assert np.all(np.abs(counts - n * p) <= 5 * np.sqrt(n * p * (1 - p)) + 1e-9)
+
+
+def test_weighted_samplers_follow_their_weights():
+    rng = np.random.default_rng(2)
+    sampler = WeightedSampler(4, weights=[1.0, 0.0, 1.0, 2.0])
+    draws = np.bincount([sampler.sample(rng) for _ in range(20_000)], minlength=4)
+    assert draws[1] == 0
+    assert draws[3] / 20_000 == pytest.approx(0.5, abs=0.02)
+
+    prioritized = PrioritizedSampler(3, eps=0.05, initial=1.0)
+    prioritized.update(0, {"arrive_dest": True})
+    assert prioritized.probability(0) == pytest.approx(0.05 / (0.05 + 2 * 1.05))
+    prioritized.update(0, {"arrive_dest": False})
+    assert prioritized.failure_rate[0] == pytest.approx(0.3)
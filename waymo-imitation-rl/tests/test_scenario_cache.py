@@ -0,0 +1,20 @@
+import glob
+import os
+
+import numpy as np
+
+from src.scenario_cache import SharedScenarioCache
+
+
+def test_hits_and_misses_count_read_outcomes(tmp_path):
+    cache = SharedScenarioCache(str(tmp_path / "cache"), budget_bytes=1 << 20, capacity=16)
+    assert cache.put("a", {"x": np.arange(10)})
+    np.testing.assert_array_equal(cache.get("a")["x"], np.arange(10))
+    assert cache.get("b") is None
+
+    # Evicted between the lookup and the read: a miss, not a hit
+    for path in glob.glob(os.path.join(cache.path, "*.bin")):
+        os.remove(path)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
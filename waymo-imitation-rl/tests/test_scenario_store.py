@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from src.dataset_index import ScenarioIndex, build_index
+from src.scenario_store import ScenarioShardWriter, ScenarioStore, list_shards
+from src.synthetic import synthetic_scenario
+
+
+def write_shard(root, name, seeds):
+    with ScenarioShardWriter(str(root), name) as writer:
+        for seed in seeds:
+            writer.add(synthetic_scenario(seed, num_agents=4, num_map_features=10))
+
+
+def test_shard_survives_crash_between_swap_renames(tmp_path):
+    root = tmp_path / "store"
+    write_shard(root, "a", [0, 1])
+    write_shard(root, "b", [2])
+    expected = ScenarioStore(str(root))[0]["id"]
+    build_index(str(root), str(tmp_path / "index"))
+
+    # Crash right after the first rename of a rewrite of 'a': only a.old is left
+    os.replace(root / "a", root / "a.old")
+    assert list_shards(str(root)) == ["a", "b"]
+    store = ScenarioStore(str(root))
+    assert len(store) == 3 and store[0]["id"] == expected
+    index = ScenarioIndex(str(tmp_path / "index"))
+    np.testing.assert_array_equal(index.load(0)["tracks"][index.load(0)["metadata"]["sdc_id"]]["state"]["position"],
+                                  store[0]["tracks"][store[0]["metadata"]["sdc_id"]]["state"]["position"])
+
+    # The next writer of 'a' restores the old shard first; an aborted rewrite keeps it
+    writer = ScenarioShardWriter(str(root), "a")
+    assert (root / "a").is_dir() and not (root / "a.old").exists()
+    writer.abort()
+    assert len(ScenarioStore(str(root))) == 3
+
+    # A finished rewrite replaces it
+    write_shard(root, "a", [5])
+    assert sorted(os.listdir(root)) == ["a", "b"]
+    assert len(ScenarioStore(str(root))) == 2